@@ -0,0 +1,13 @@
+# coding:utf-8
+from __future__ import absolute_import
+
+from django.apps import AppConfig
+
+
+class CommonConfig(AppConfig):
+    name = 'common'
+
+    def ready(self):
+        from common.cache import reference_cache
+        from common.models import Establishment
+        reference_cache.register(Establishment)
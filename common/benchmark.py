@@ -0,0 +1,94 @@
+import gc
+import os
+import threading
+import time
+
+from django.db import connection, reset_queries
+from django.test.utils import CaptureQueriesContext
+
+# Seconds between two readings of the resident set size during a step.
+RSS_SAMPLING_INTERVAL = 0.005
+
+
+def get_rss_kb():
+    """
+    Current resident set size of the process in kilobytes, ``None`` where
+    ``/proc`` is not available.
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            pages = int(statm.read().split()[1])
+    except (IOError, IndexError, ValueError):
+        return None
+    return pages * os.sysconf('SC_PAGE_SIZE') // 1024
+
+
+class RssSampler(threading.Thread):
+    """
+    Read the resident set size every ``interval`` seconds until
+    ``stop()`` and keep the highest reading. The sampler only sees the
+    memory the process holds when the thread gets the GIL, so a spike
+    shorter than the interval may be missed.
+    """
+    def __init__(self, interval=RSS_SAMPLING_INTERVAL):
+        super(RssSampler, self).__init__()
+        self.daemon = True
+        self.interval = interval
+        self.peak = get_rss_kb()
+        self.stopped = threading.Event()
+
+    def sample(self):
+        rss = get_rss_kb()
+        if rss is not None and rss > self.peak:
+            self.peak = rss
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        self.sample()
+        return self.peak
+
+
+def measure(func, *args, **kwargs):
+    """
+    Call ``func`` and return a dict with its result, the wall time in
+    seconds, the number of SQL queries and memory deltas in kilobytes.
+
+    The steps of a benchmark share the process: they run on data generated
+    in a transaction that is never committed, which a fresh process could
+    not see, so the process peak says nothing about any step but the first.
+    Memory is measured around the call instead: ``rss_delta_kb`` is the
+    growth of the resident set size, the memory the step kept, and
+    ``peak_rss_delta_kb`` the highest resident set size sampled during the
+    step above the one before it. Both are ``None`` without ``/proc``.
+    Garbage is collected before each reading.
+    """
+    reset_queries()
+    gc.collect()
+    rss = get_rss_kb()
+    sampler = None
+    if rss is not None:
+        sampler = RssSampler()
+        sampler.start()
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            started = time.time()
+            result = func(*args, **kwargs)
+            wall_time = time.time() - started
+    finally:
+        peak = sampler.stop() if sampler is not None else None
+    query_count = len(queries)
+    # The captured queries are not part of the step.
+    reset_queries()
+    gc.collect()
+    return {
+        'result': result,
+        'wall_time': wall_time,
+        'queries': query_count,
+        'rss_delta_kb': None if rss is None else get_rss_kb() - rss,
+        'peak_rss_delta_kb': None if peak is None else peak - rss,
+    }
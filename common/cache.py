@@ -0,0 +1,196 @@
+# coding:utf-8
+"""
+Cache of reference data: establishments, departments, positions.
+
+Values are kept in a per-process LRU in front of Django's cache framework
+(``REFERENCE_CACHE_ALIAS``). Every registered model has a version number in
+Django's cache, part of the keys of its values; saving or deleting an
+instance increments it (``post_save``/``post_delete``, ``objects_imported``
+for ``bulk_create``). A process reads the version from the shared cache at
+most every ``REFERENCE_CACHE_VERSION_TTL`` seconds, so it may use the
+values of an outdated version, wages included, for that long after another
+process changed them; its own changes are seen at once. A local hit saves
+fetching and unpickling the value. Hits and misses of both levels are
+counted.
+
+The cache alias must be shared by the processes, e.g. memcached or Redis:
+a local-memory or dummy backend cannot carry the versions to the other
+processes, so with those backends nothing is cached and every lookup
+loads the value.
+"""
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.signals import setting_changed
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from common.signals import objects_imported
+
+VERSION_KEY = 'reference:{model}:version'
+VALUE_KEY = 'reference:{model}:{version}:{name}'
+MISSING = object()
+
+
+def get_model_label(model):
+    return '{app_label}.{model_name}'.format(
+        app_label=model._meta.app_label,
+        model_name=model._meta.model_name,
+    )
+
+
+class LRUCache(object):
+    """
+    Thread-safe mapping of at most ``maxsize`` items, dropping the least
+    recently used one when full.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                value = self.items.pop(key)
+            except KeyError:
+                return default
+            self.items[key] = value
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.items.pop(key, None)
+            self.items[key] = value
+            if len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+
+    def discard_prefix(self, prefix):
+        with self.lock:
+            for key in [key for key in self.items if key.startswith(prefix)]:
+                del self.items[key]
+
+    def __len__(self):
+        return len(self.items)
+
+
+class ReferenceCache(object):
+    def __init__(self, cache_alias=None, maxsize=None, timeout=None):
+        self.cache_alias = cache_alias or getattr(settings, 'REFERENCE_CACHE_ALIAS', 'default')
+        self.timeout = timeout or getattr(settings, 'REFERENCE_CACHE_TIMEOUT', None)
+        self.local = LRUCache(maxsize or getattr(settings, 'REFERENCE_CACHE_SIZE', 256))
+        # Model label to ``(version, expiry time)``.
+        self.versions = {}
+        self.lock = threading.Lock()
+        self.stats = {
+            'local_hits': 0,
+            'shared_hits': 0,
+            'misses': 0,
+            'uncached': 0,
+            'invalidations': 0,
+        }
+
+    @property
+    def shared(self):
+        return caches[self.cache_alias]
+
+    @property
+    def enabled(self):
+        return not isinstance(self.shared, (LocMemCache, DummyCache))
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def register(self, model):
+        """
+        Invalidate the cached values of ``model`` whenever one of its
+        instances is saved or deleted, or a batch of them is imported.
+        """
+        dispatch_uid = 'reference-cache-{model}'.format(model=get_model_label(model))
+        post_save.connect(self.invalidate, sender=model, weak=False, dispatch_uid=dispatch_uid)
+        post_delete.connect(self.invalidate, sender=model, weak=False, dispatch_uid=dispatch_uid)
+        objects_imported.connect(self.invalidate, sender=model, weak=False, dispatch_uid=dispatch_uid)
+
+    def get_version(self, model):
+        label = get_model_label(model)
+        now = time.time()
+        version, expiry = self.versions.get(label, (None, None))
+        if version is not None and expiry > now:
+            return version
+        key = VERSION_KEY.format(model=label)
+        version = self.shared.get(key)
+        if version is None:
+            # A random first version cannot reuse the keys of values cached
+            # before the version was evicted.
+            self.shared.add(key, random.getrandbits(48), None)
+            version = self.shared.get(key)
+        self.versions[label] = (version, now + getattr(settings, 'REFERENCE_CACHE_VERSION_TTL', 1))
+        return version
+
+    def invalidate(self, sender, **kwargs):
+        label = get_model_label(sender)
+        key = VERSION_KEY.format(model=label)
+        try:
+            self.shared.incr(key)
+        except ValueError:
+            self.shared.set(key, random.getrandbits(48), None)
+        self.versions.pop(label, None)
+        self.local.discard_prefix('reference:{model}:'.format(model=label))
+        self.count('invalidations')
+
+    def clear(self):
+        """
+        Forget the local values and versions.
+        """
+        self.versions.clear()
+        self.local.discard_prefix('')
+
+    def get(self, model, name, load):
+        """
+        Cached value ``name`` of the reference data of ``model``; ``load()``
+        computes it on a miss.
+        """
+        if not self.enabled:
+            self.count('uncached')
+            return load()
+        key = VALUE_KEY.format(model=get_model_label(model), version=self.get_version(model), name=name)
+        value = self.local.get(key, MISSING)
+        if value is not MISSING:
+            self.count('local_hits')
+            return value
+        value = self.shared.get(key, MISSING)
+        if value is MISSING:
+            self.count('misses')
+            value = load()
+            self.shared.set(key, value, self.timeout)
+        else:
+            self.count('shared_hits')
+        self.local.set(key, value)
+        return value
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+        return dict(stats, local_size=len(self.local), enabled=self.enabled)
+
+
+reference_cache = ReferenceCache()
+
+
+@receiver(setting_changed)
+def reset_reference_cache(setting, **kwargs):
+    if setting == 'CACHES':
+        reference_cache.clear()
+
+
+def get_establishment():
+    from common.models import Establishment
+    return reference_cache.get(Establishment, 'last', lambda: Establishment.objects.last())
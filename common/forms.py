@@ -2,7 +2,9 @@
 from django import forms
 from django.utils.translation import ugettext as _
 from django.core.exceptions import ValidationError
+from django.forms.models import ModelChoiceIterator
 
+from common.cache import reference_cache
 from common.models import Establishment
 
 
@@ -15,3 +17,34 @@ class CleanStartEndMixin(object):
                     _(u'Дата окончания должна быть позже даты начала.')
                 )
             )
+
+
+class CachedModelChoiceIterator(ModelChoiceIterator):
+    """
+    Choices of a model choice field read from the reference cache instead
+    of querying the field queryset on every rendering.
+    """
+
+    def get_objects(self):
+        return reference_cache.get(
+            self.queryset.model, self.field.cache_name, lambda: list(self.queryset.all())
+        )
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        for obj in self.get_objects():
+            yield self.choice(obj)
+
+    def __len__(self):
+        return len(self.get_objects()) + (1 if self.field.empty_label is not None else 0)
+
+
+def use_cached_choices(field, cache_name):
+    """
+    Render the choices of the model choice ``field`` from the reference
+    cache, under ``cache_name``, which identifies the field queryset among
+    the cached values of its model.
+    """
+    field.cache_name = cache_name
+    field.widget.choices = CachedModelChoiceIterator(field)
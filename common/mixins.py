@@ -1,12 +1,18 @@
 # coding:utf-8
+import os
 from datetime import datetime
 try:
     import cStringIO as StringIO
 except ImportError:
     import StringIO
 
-from django.http import HttpResponse
+from django.http import (
+    HttpResponse,
+    FileResponse,
+)
 from django.contrib.auth.decorators import login_required
+from django.core.exceptions import ValidationError
+from django.utils.translation import ugettext as _
 from xlsxwriter.workbook import Workbook
 
 
@@ -20,6 +26,7 @@ class LoginRequiredMixin(object):
 class XlsxResponseMixin(object):
     mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
     filename = NotImplemented
+    streaming = False
 
     def get_filename(self):
         return self.filename
@@ -27,9 +34,17 @@ class XlsxResponseMixin(object):
     def get_content(self, context):
         raise NotImplementedError('``get_content()`` method is not implemented')
 
+    def get_file(self, context):
+        raise NotImplementedError('``get_file()`` method is not implemented')
+
     def render_to_file_response(self, context, **response_kwargs):
-        output = self.get_content(context)
-        response = HttpResponse(output, content_type=self.mimetype)
+        if self.streaming:
+            output = self.get_file(context)
+            response = FileResponse(output, content_type=self.mimetype)
+            response['Content-Length'] = os.fstat(output.fileno()).st_size
+        else:
+            output = self.get_content(context)
+            response = HttpResponse(output, content_type=self.mimetype)
 
         response['Content-Disposition'] = "attachment; filename={filename}".format(
             filename=self.get_filename(),
@@ -55,3 +70,44 @@ class CleanMonthYearMixin(object):
 class ActiveObjectsMixin(object):
     def get_queryset(self):
         return super(ActiveObjectsMixin, self).get_queryset().filter(active=True)
+
+
+class KeysetPaginationMixin(object):
+    """
+    Paginate a list view by primary key instead of by offset: each page
+    is one indexed query whatever the page number is. The ``after`` query
+    parameter holds the last primary key of the previous page.
+    """
+    page_size = 50
+    cursor_kwarg = 'after'
+
+    def get_cursor(self):
+        try:
+            return int(self.request.GET[self.cursor_kwarg])
+        except (KeyError, ValueError):
+            return None
+
+    def paginate_keyset(self, queryset):
+        queryset = queryset.order_by('-pk')
+        cursor = self.get_cursor()
+        if cursor is not None:
+            queryset = queryset.filter(pk__lt=cursor)
+        object_list = list(queryset[:self.page_size + 1])
+        if len(object_list) > self.page_size:
+            object_list = object_list[:self.page_size]
+            return object_list, object_list[-1].pk
+        return object_list, None
+
+    def get_context_data(self, **kwargs):
+        object_list, next_cursor = self.paginate_keyset(
+            kwargs.pop('object_list', self.object_list)
+        )
+        context = super(KeysetPaginationMixin, self).get_context_data(
+            object_list=object_list,
+            **kwargs
+        )
+        if next_cursor is not None:
+            query = self.request.GET.copy()
+            query[self.cursor_kwarg] = next_cursor
+            context['next_page_query'] = query.urlencode()
+        return context
@@ -0,0 +1,10 @@
+from django.dispatch import Signal
+
+
+# Sent by the salarycalc create, update and delete views once an object has
+# been saved. ``previous`` holds the state before an update, if any.
+object_changed = Signal(providing_args=['instance', 'previous'])
+
+# Sent by bulk imports and bulk actions once a batch of objects of the same
+# model has been written with ``bulk_create``.
+objects_imported = Signal(providing_args=['instances'])
@@ -0,0 +1,26 @@
+$(function () {
+    $('[data-role="employee-search"]').each(function () {
+        var $input = $(this);
+        var $target = $('#' + $input.data('target'));
+
+        $input.autocomplete({
+            minLength: 1,
+            delay: 200,
+            source: function (request, response) {
+                $.getJSON($input.data('url'), {q: request.term}, function (data) {
+                    response($.map(data.results, function (employee) {
+                        return {label: employee.text, value: employee.name, id: employee.id};
+                    }));
+                });
+            },
+            select: function (event, ui) {
+                $target.val(ui.item.id).trigger('change');
+            },
+            change: function (event, ui) {
+                if (!ui.item && !$input.val()) {
+                    $target.val('').trigger('change');
+                }
+            }
+        });
+    });
+});
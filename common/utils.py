@@ -1,13 +1,112 @@
 import calendar
 import datetime
 
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
+def parse_date(value):
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+
+
+class BusinessCalendar(object):
+    """
+    Production calendar: weekdays are business days, except for the dates in
+    ``holidays``; the dates in ``workdays`` are business days even if they
+    fall on a weekend (transferred workdays).
+
+    Business days are computed once per month and cached as a set and as
+    running counts, so membership tests are O(1) and counting business days
+    in a range costs O(1) per month it spans.
+    """
+
+    def __init__(self, holidays=(), workdays=()):
+        self.holidays = frozenset(parse_date(date) for date in holidays)
+        self.workdays = frozenset(parse_date(date) for date in workdays)
+        self.months = {}
+
+    def is_business_date(self, date):
+        if date in self.workdays:
+            return True
+        return date.weekday() < 5 and date not in self.holidays
+
+    def get_month(self, year, month):
+        key = (year, month)
+        if key not in self.months:
+            _, days_in_month = calendar.monthrange(year, month)
+            days = []
+            # counts[day] is the number of business days from the 1st to ``day``
+            counts = [0]
+            for day in xrange(1, days_in_month + 1):
+                date = datetime.date(year, month, day)
+                if self.is_business_date(date):
+                    days.append(date)
+                counts.append(len(days))
+            self.months[key] = (days, frozenset(days), counts)
+        return self.months[key]
+
+    def business_days(self, year, month):
+        return self.get_month(year, month)[0]
+
+    def get_month_mask(self, year, month):
+        """
+        Business days of the month as a bit mask, bit ``day - 1`` being set
+        for a business day. Identifies the part of the calendar a month
+        payroll depends on.
+        """
+        return sum(1 << (date.day - 1) for date in self.business_days(year, month))
+
+    def is_business_day(self, date):
+        return date in self.get_month(date.year, date.month)[1]
+
+    def count(self, start_date, end_date):
+        """Number of business days from ``start_date`` to ``end_date`` inclusive."""
+        total = 0
+        year, month = start_date.year, start_date.month
+        while (year, month) <= (end_date.year, end_date.month):
+            counts = self.get_month(year, month)[2]
+            first_day = start_date.day if (year, month) == (start_date.year, start_date.month) else 1
+            last_day = end_date.day if (year, month) == (end_date.year, end_date.month) else len(counts) - 1
+            if first_day <= last_day:
+                total += counts[last_day] - counts[first_day - 1]
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        return total
+
+
+_business_calendar = None
+
+
+def get_business_calendar():
+    """
+    Return the calendar built from the ``BUSINESS_CALENDAR_HOLIDAYS`` and
+    ``BUSINESS_CALENDAR_WORKDAYS`` settings (lists of dates or "YYYY-MM-DD"
+    strings).
+    """
+    global _business_calendar
+    if _business_calendar is None:
+        _business_calendar = BusinessCalendar(
+            holidays=getattr(settings, 'BUSINESS_CALENDAR_HOLIDAYS', ()),
+            workdays=getattr(settings, 'BUSINESS_CALENDAR_WORKDAYS', ()),
+        )
+    return _business_calendar
+
+
+@receiver(setting_changed)
+def reset_business_calendar(setting, **kwargs):
+    global _business_calendar
+    if setting in ('BUSINESS_CALENDAR_HOLIDAYS', 'BUSINESS_CALENDAR_WORKDAYS'):
+        _business_calendar = None
+
 
 def business_days(month, year):
-    _, days_in_month = calendar.monthrange(year, month)
-    for day in xrange(1, days_in_month + 1):
-        date = datetime.date(year, month, day)
-        if date.weekday() < 5:
-            yield date
+    for date in get_business_calendar().business_days(year, month):
+        yield date
+
+def business_days_count(start_date, end_date):
+    return get_business_calendar().count(start_date, end_date)
 
 def daterange(start_date, end_date):
     for days in xrange(int((end_date - start_date).days) + 1):
@@ -1,7 +1,12 @@
 # coding:utf-8
 from datetime import datetime
 
-from django.http import HttpResponseRedirect
+from django.core.exceptions import PermissionDenied
+from django.http import (
+    HttpResponseRedirect,
+    JsonResponse,
+)
+from django.views.generic import View
 from django.views.generic.edit import (
     DeleteView,
     CreateView,
@@ -10,6 +15,10 @@ from django.views.generic.edit import (
 from django.contrib.messages.views import SuccessMessageMixin
 from django.contrib import messages
 
+from common.cache import reference_cache
+from common.mixins import LoginRequiredMixin
+from common.signals import object_changed
+
 
 class SalarycalcDeleteView(DeleteView):
     def delete(self, request, *args, **kwargs):
@@ -17,6 +26,7 @@ class SalarycalcDeleteView(DeleteView):
         success_url = self.get_success_url()
         self.object.active=False
         self.object.save()
+        object_changed.send(sender=self.model, instance=self.object)
         self.delete_success()
         return HttpResponseRedirect(success_url)
 
@@ -30,11 +40,27 @@ class AutoPopulatedCreateView(CreateView):
         form.instance.updated_by = self.request.user
         form.instance.created_date = datetime.now()
         form.instance.updated_date = datetime.now()
-        return super(AutoPopulatedCreateView, self).form_valid(form)
+        response = super(AutoPopulatedCreateView, self).form_valid(form)
+        object_changed.send(sender=self.model, instance=self.object)
+        return response
 
 
 class AutoPopulatedUpdateView(UpdateView):
     def form_valid(self, form):
         form.instance.updated_by = self.request.user
         form.instance.updated_date = datetime.now()
-        return super(AutoPopulatedUpdateView, self).form_valid(form)
+        previous = self.model._default_manager.get(pk=form.instance.pk)
+        response = super(AutoPopulatedUpdateView, self).form_valid(form)
+        object_changed.send(sender=self.model, instance=self.object, previous=previous)
+        return response
+
+
+class ReferenceCacheStatsView(LoginRequiredMixin, View):
+    """
+    Hit and miss counters of the reference cache of the process, for staff
+    monitoring.
+    """
+    def get(self, request, *args, **kwargs):
+        if not request.user.is_staff:
+            raise PermissionDenied
+        return JsonResponse(reference_cache.get_stats())
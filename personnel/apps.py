@@ -0,0 +1,17 @@
+# coding:utf-8
+from __future__ import absolute_import
+
+from django.apps import AppConfig
+
+
+class PersonnelConfig(AppConfig):
+    name = 'personnel'
+
+    def ready(self):
+        from common.cache import reference_cache
+        from personnel.models import (
+            Department,
+            Position,
+        )
+        reference_cache.register(Department)
+        reference_cache.register(Position)
@@ -0,0 +1,19 @@
+# coding:utf-8
+from common.cache import reference_cache
+from personnel.models import Position
+
+
+def get_positions():
+    """
+    Map position pk to the position, for every position.
+    """
+    return reference_cache.get(
+        Position, 'by_pk', lambda: dict((position.pk, position) for position in Position.objects.all())
+    )
+
+
+def get_position(pk):
+    position = get_positions().get(pk)
+    if position is None:
+        position = Position.objects.get(pk=pk)
+    return position
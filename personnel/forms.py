@@ -1,4 +1,5 @@
 # coding:utf-8
+import hashlib
 from decimal import Decimal
 
 from django import forms
@@ -13,9 +14,19 @@ from personnel.models import (
     Bonus,
     SickTime,
     Vacation,
+    TWOPLACES,
 )
 from common.mixins import CleanMonthYearMixin
-from common.forms import CleanStartEndMixin
+from common.forms import (
+    CleanStartEndMixin,
+    use_cached_choices,
+)
+from personnel.widgets import EmployeeSearchInput
+from personnel.importers import IMPORTERS
+from personnel.overlaps import (
+    find_conflicts,
+    get_overlap_message,
+)
 
 
 class PersonnelForm(ModelForm):
@@ -35,6 +46,30 @@ class PersonnelForm(ModelForm):
         )
 
 
+class EmployeeChoiceField(forms.ModelChoiceField):
+    """
+    Active employee picked with ``EmployeeSearchInput``. The employee
+    found by validation or given as the initial value is handed to the
+    widget, which renders its name without a query.
+    """
+    widget = EmployeeSearchInput
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('queryset', Employee.objects.filter(active=True))
+        kwargs.setdefault('label', _(u'Сотрудник'))
+        super(EmployeeChoiceField, self).__init__(*args, **kwargs)
+
+    def prepare_value(self, value):
+        if isinstance(value, Employee):
+            self.widget.employee = value
+        return super(EmployeeChoiceField, self).prepare_value(value)
+
+    def to_python(self, value):
+        employee = super(EmployeeChoiceField, self).to_python(value)
+        self.widget.employee = employee
+        return employee
+
+
 class DepartmentForm(PersonnelForm):
     class Meta(PersonnelForm.Meta):
         model = Department
@@ -73,6 +108,11 @@ class EmployeeForm(PersonnelForm):
             'assets/locales/bootstrap-datepicker.ru.min.js',
         )
 
+    def __init__(self, *args, **kwargs):
+        super(EmployeeForm, self).__init__(*args, **kwargs)
+        use_cached_choices(self.fields['department'], 'all')
+        use_cached_choices(self.fields['position'], 'all')
+
 
 class PositionForm(PersonnelForm):
     class Meta(PersonnelForm.Meta):
@@ -141,10 +181,7 @@ class BonusForm(CleanMonthYearMixin, PersonnelForm):
 
 
 class BonusCreateForm(BonusForm):
-    employee = forms.ModelChoiceField(
-        queryset=Employee.objects.filter(active=True),
-        label=_(u'Сотрудник'),
-    )
+    employee = EmployeeChoiceField()
 
     class Meta(BonusForm.Meta):
         exclude = (
@@ -166,7 +203,146 @@ class BonusUpdateForm(BonusForm):
         )
 
 
-class SickTimeForm(CleanStartEndMixin, PersonnelForm):
+class BonusBulkCreateForm(CleanMonthYearMixin, forms.Form):
+    departments = forms.ModelMultipleChoiceField(
+        queryset=Department.objects.filter(active=True),
+        widget=forms.SelectMultiple(attrs={
+            'data-role': 'multiselect',
+            'data-button-width': '100%',
+            'data-inherit-class': 'true',
+            'data-non-selected-text': _(u'Выберете отделы'),
+            'data-n-selected-text': _(u'выбрано'),
+            'data-all-selected-text': _(u'Все отделы'),
+            'data-include-select-all-option': 'true',
+            'data-select-all-text': _(u'Все отделы'),
+        }),
+        label=_(u'Отделы'),
+    )
+    month_year = forms.CharField(
+        widget=forms.DateInput(attrs={
+                'data-provide': 'datepicker',
+                'data-date-format': 'mm/yyyy',
+                'data-date-language': 'ru',
+                'data-date-min-view-mode': 'months',
+        }, format=('%m/%Y')),
+        label=_(u'За месяц'),
+    )
+    percent = forms.DecimalField(
+        min_value=0,
+        decimal_places=2,
+        label=_(u'Процент от заработной платы'),
+        help_text=_(u'Премия каждого сотрудника выбранных отделов составит указанный процент '
+            u'от его заработной платы.'),
+    )
+    description = forms.CharField(
+        widget=forms.Textarea,
+        required=False,
+        label=_(u'Описание'),
+    )
+
+    class Media:
+        css = {
+            'all': (
+                'assets/css/bootstrap-datepicker3.min.css',
+                'assets/css/bootstrap-multiselect.css',
+            ),
+        }
+        js = (
+            'assets/js/bootstrap-datepicker.min.js',
+            'assets/locales/bootstrap-datepicker.ru.min.js',
+            'assets/js/bootstrap-multiselect.js',
+        )
+
+    def __init__(self, *args, **kwargs):
+        super(BonusBulkCreateForm, self).__init__(*args, **kwargs)
+        use_cached_choices(self.fields['departments'], 'active')
+
+    def get_bonuses(self, user, lock=False):
+        """
+        Unsaved bonuses of all active employees of the chosen departments,
+        computed from a single query joining employees with their
+        departments and positions. With ``lock`` the employees are locked
+        until the end of the transaction.
+        """
+        month, year = self.cleaned_data['month_year']
+        percent = self.cleaned_data['percent']
+        employees = Employee.objects.filter(
+            active=True,
+            department__in=self.cleaned_data['departments'],
+        ).select_related('department', 'position').order_by('department__name', 'department_id', 'name')
+        if lock:
+            employees = employees.select_for_update()
+        return [
+            Bonus(
+                employee=employee,
+                month=month,
+                year=year,
+                amount=(employee.wages * percent / Decimal(100)).quantize(TWOPLACES),
+                description=self.cleaned_data['description'],
+                created_by=user,
+                updated_by=user,
+            )
+            for employee in employees
+        ]
+
+    @staticmethod
+    def get_token(bonuses):
+        """
+        Digest of ``bonuses``: a confirmation is accepted only if the
+        bonuses to create are still the ones of the preview.
+        """
+        return hashlib.md5(repr([
+            (bonus.employee_id, bonus.year, bonus.month, bonus.amount, bonus.description)
+            for bonus in bonuses
+        ])).hexdigest()
+
+    def check_duplicates(self, bonuses):
+        """
+        Reject the bonuses if an employee already has an active bonus for
+        the month, e.g. when the form is submitted twice.
+        """
+        if not bonuses:
+            return True
+        duplicates = Bonus.objects.filter(
+            active=True,
+            year=bonuses[0].year,
+            month=bonuses[0].month,
+            employee__in=[bonus.employee_id for bonus in bonuses],
+        ).values_list('employee_id', flat=True).distinct().count()
+        if duplicates:
+            self.add_error(None, ValidationError(
+                _(u'У сотрудников выбранных отделов ({count}) уже есть премии за этот месяц.').format(
+                    count=duplicates,
+                )
+            ))
+            return False
+        return True
+
+
+class CleanOverlapMixin(object):
+    """
+    Reject a leave overlapping another active leave of the same kind of
+    the employee.
+    """
+    def clean(self):
+        super(CleanOverlapMixin, self).clean()
+        data = self.cleaned_data
+        employee = data.get('employee') or getattr(self.instance, 'employee', None)
+        if employee is None or self.has_error('start_date') or self.has_error('end_date'):
+            return data
+        model = self._meta.model
+        leave = model(
+            pk=self.instance.pk,
+            employee_id=employee.pk,
+            start_date=data['start_date'],
+            end_date=data['end_date'],
+        )
+        for leave, interval in find_conflicts(model, [leave]):
+            self.add_error(None, ValidationError(get_overlap_message(model, interval)))
+        return data
+
+
+class SickTimeForm(CleanOverlapMixin, CleanStartEndMixin, PersonnelForm):
     start_date = forms.DateField(
         widget=forms.DateInput(attrs={
                 'data-provide': 'datepicker',
@@ -208,10 +384,7 @@ class SickTimeForm(CleanStartEndMixin, PersonnelForm):
 
 
 class SickTimeCreateForm(SickTimeForm):
-    employee = forms.ModelChoiceField(
-        queryset=Employee.objects.filter(active=True),
-        label=_(u'Сотрудник'),
-    )
+    employee = EmployeeChoiceField()
 
 
 class SickTimeUpdateForm(SickTimeForm):
@@ -221,7 +394,7 @@ class SickTimeUpdateForm(SickTimeForm):
         )
 
 
-class VacationForm(CleanStartEndMixin, PersonnelForm):
+class VacationForm(CleanOverlapMixin, CleanStartEndMixin, PersonnelForm):
     start_date = forms.DateField(
         widget=forms.DateInput(attrs={
                 'data-provide': 'datepicker',
@@ -264,10 +437,7 @@ class VacationForm(CleanStartEndMixin, PersonnelForm):
 
 
 class VacationCreateForm(VacationForm):
-    employee = forms.ModelChoiceField(
-        queryset=Employee.objects.filter(active=True),
-        label=_(u'Сотрудник'),
-    )
+    employee = EmployeeChoiceField()
 
 
 class VacationUpdateForm(VacationForm):
@@ -275,3 +445,56 @@ class VacationUpdateForm(VacationForm):
         exclude = VacationForm.Meta.exclude + (
             'employee',
         )
+
+
+class PersonnelFilterForm(CleanMonthYearMixin, forms.Form):
+    employee = EmployeeChoiceField(required=False)
+    department = forms.ModelChoiceField(
+        queryset=Department.objects.filter(active=True),
+        required=False,
+        label=_(u'Отдел'),
+    )
+    month_year = forms.CharField(
+        widget=forms.DateInput(attrs={
+                'data-provide': 'datepicker',
+                'data-date-format': 'mm/yyyy',
+                'data-date-language': 'ru',
+                'data-date-min-view-mode': 'months',
+        }, format=('%m/%Y')),
+        required=False,
+        label=_(u'За месяц'),
+    )
+
+    class Media:
+        css = {
+            'all': ('assets/css/bootstrap-datepicker3.min.css',),
+        }
+        js = (
+            'assets/js/bootstrap-datepicker.min.js',
+            'assets/locales/bootstrap-datepicker.ru.min.js',
+        )
+
+    def __init__(self, *args, **kwargs):
+        super(PersonnelFilterForm, self).__init__(*args, **kwargs)
+        use_cached_choices(self.fields['department'], 'active')
+
+    def clean_month_year(self):
+        if not self.cleaned_data.get('month_year'):
+            return None
+        return super(PersonnelFilterForm, self).clean_month_year()
+
+
+class PersonnelImportForm(forms.Form):
+    kind = forms.ChoiceField(
+        choices=[(kind, importer.title) for kind, importer in IMPORTERS],
+        label=_(u'Данные'),
+    )
+    file = forms.FileField(
+        label=_(u'Файл'),
+        help_text=_(u'Файл CSV или XLSX. Первая строка содержит названия столбцов: '
+            u'табельный номер и поля записи так, как они названы в форме.'),
+    )
+    dry_run = forms.BooleanField(
+        required=False,
+        label=_(u'Только проверить'),
+    )
@@ -0,0 +1,121 @@
+# coding:utf-8
+import datetime
+import random
+import uuid
+from decimal import Decimal
+
+from common.signals import objects_imported
+from personnel.models import (
+    Department,
+    Position,
+    Employee,
+    Bonus,
+    SickTime,
+    Vacation,
+    get_search_name,
+)
+
+
+def random_amount(rng, low, high):
+    return Decimal(rng.randint(low * 100, high * 100)) / Decimal(100)
+
+
+def random_interval(rng, start_date, days, max_length):
+    start = start_date + datetime.timedelta(rng.randint(0, days - 1))
+    return start, start + datetime.timedelta(rng.randint(0, max_length - 1))
+
+
+def generate_payroll_data(user, departments=3, positions=10, employees=100,
+                          sicktimes=2, vacations=2, bonuses=2,
+                          start_date=datetime.date(2014, 1, 1), years=2, seed=None):
+    """
+    Fill the database with synthetic departments, positions and employees
+    together with sick leaves, vacations and bonuses spread over ``years``
+    years from ``start_date``. ``sicktimes``, ``vacations`` and ``bonuses``
+    are average numbers of rows per employee. Returns a queryset of the
+    created employees.
+    """
+    rng = random.Random(seed)
+    prefix = uuid.uuid4().hex[:8]
+    days = years * 365
+    audit = {'created_by': user, 'updated_by': user}
+
+    def create(model, name, **kwargs):
+        # ``bulk_create`` does not call ``save()``, which fills ``search_name``.
+        return model(name=name, search_name=get_search_name(name), **dict(audit, **kwargs))
+
+    Department.objects.bulk_create(
+        create(Department, u'Отдел {0} {1}'.format(prefix, index))
+        for index in xrange(departments)
+    )
+    Position.objects.bulk_create(
+        create(
+            Position,
+            u'Должность {0} {1}'.format(prefix, index),
+            wages=random_amount(rng, 15000, 150000),
+        )
+        for index in xrange(positions)
+    )
+    department_list = list(Department.objects.filter(name__startswith=u'Отдел {0} '.format(prefix)))
+    position_list = list(Position.objects.filter(name__startswith=u'Должность {0} '.format(prefix)))
+    objects_imported.send(sender=Department, instances=department_list)
+    objects_imported.send(sender=Position, instances=position_list)
+
+    Employee.objects.bulk_create(
+        create(
+            Employee,
+            u'Сотрудник {0}'.format(index),
+            department=rng.choice(department_list),
+            position=rng.choice(position_list),
+            personnel_number=u'{0}-{1}'.format(prefix, index),
+            permanent_bonus_amount=random_amount(rng, 0, 10000),
+            insurance_experience=rng.choice(Employee.INSURANCE_EXPERIENCE_CHOICES)[0],
+            hired=start_date - datetime.timedelta(rng.randint(-days // 4, days)),
+        )
+        for index in xrange(employees)
+    )
+    employee_queryset = Employee.objects.filter(personnel_number__startswith=u'{0}-'.format(prefix))
+    employee_list = list(employee_queryset)
+
+    def rows_count(average):
+        return rng.randint(0, 2 * average) if average else 0
+
+    def generate_sicktimes():
+        for employee in employee_list:
+            for _ in xrange(rows_count(sicktimes)):
+                start, end = random_interval(rng, start_date, days, 21)
+                yield SickTime(
+                    employee=employee,
+                    start_date=start,
+                    end_date=end,
+                    last_two_years_wages=employee.last_two_years_wages,
+                    **audit
+                )
+
+    def generate_vacations():
+        for employee in employee_list:
+            for _ in xrange(rows_count(vacations)):
+                start, end = random_interval(rng, start_date, days, 28)
+                yield Vacation(
+                    employee=employee,
+                    start_date=start,
+                    end_date=end,
+                    average_daily_earnings=employee.average_daily_earnings.quantize(Decimal('0.01')),
+                    **audit
+                )
+
+    def generate_bonuses():
+        for employee in employee_list:
+            for _ in xrange(rows_count(bonuses)):
+                yield Bonus(
+                    employee=employee,
+                    month=rng.randint(1, 12),
+                    year=start_date.year + rng.randint(0, years - 1),
+                    amount=random_amount(rng, 1000, 50000),
+                    **audit
+                )
+
+    SickTime.objects.bulk_create(generate_sicktimes())
+    Vacation.objects.bulk_create(generate_vacations())
+    Bonus.objects.bulk_create(generate_bonuses())
+    return employee_queryset
@@ -0,0 +1,450 @@
+# coding:utf-8
+import csv
+import datetime
+import itertools
+import os
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils.translation import ugettext as _
+
+from common.signals import objects_imported
+from personnel.models import (
+    Employee,
+    Bonus,
+    SickTime,
+    Vacation,
+    TWOPLACES,
+)
+from personnel.overlaps import (
+    find_conflicts,
+    get_overlap_message,
+)
+
+BATCH_SIZE = 500
+DATE_FORMATS = ('%d.%m.%Y', '%Y-%m-%d')
+MONTH_YEAR_FORMATS = ('%m/%Y', '%m.%Y', '%Y-%m')
+CSV_ENCODINGS = ('utf-8', 'cp1251')
+
+
+class ImportFileError(Exception):
+    """
+    The file cannot be imported at all: unknown format, unreadable
+    content or missing columns.
+    """
+
+
+def decode_cell(value):
+    for encoding in CSV_ENCODINGS:
+        try:
+            return value.decode(encoding)
+        except UnicodeDecodeError:
+            pass
+    raise ImportFileError(_(u'Не удалось определить кодировку файла.'))
+
+
+def read_csv(fileobj):
+    lines = iter(fileobj)
+    first_line = next(lines, b'')
+    if first_line.startswith(b'\xef\xbb\xbf'):
+        first_line = first_line[3:]
+    try:
+        dialect = csv.Sniffer().sniff(first_line, delimiters=';,\t')
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.reader(itertools.chain([first_line], lines), dialect)
+    for row in reader:
+        yield [decode_cell(value) for value in row]
+
+
+def read_xlsx(fileobj):
+    try:
+        import openpyxl
+    except ImportError:
+        raise ImportFileError(_(u'Для импорта файлов XLSX необходим пакет openpyxl.'))
+    try:
+        workbook = openpyxl.load_workbook(fileobj, read_only=True, data_only=True)
+    except Exception:
+        raise ImportFileError(_(u'Не удалось прочитать файл XLSX.'))
+    for row in workbook.active.iter_rows():
+        yield [cell.value for cell in row]
+
+
+def read_rows(fileobj, filename):
+    """
+    Iterate over the rows of a CSV or XLSX file as lists of cell values,
+    chosen by the extension of ``filename``. Rows are read lazily.
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == '.csv':
+        return read_csv(fileobj)
+    if extension == '.xlsx':
+        return read_xlsx(fileobj)
+    raise ImportFileError(_(u'Поддерживаются только файлы CSV и XLSX.'))
+
+
+def clean_text(value):
+    if value is None:
+        return u''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return unicode(value).strip()
+
+
+def clean_decimal(value, label):
+    if isinstance(value, float):
+        value = repr(value)
+    try:
+        value = Decimal(clean_text(value).replace(u' ', u'').replace(u',', u'.'))
+    except InvalidOperation:
+        value = None
+    if value is None or not value.is_finite():
+        raise ValidationError(_(u'{label}: требуется число.').format(label=label))
+    return value
+
+
+def clean_date(value, label):
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    value = clean_text(value)
+    parts = value.split(u'.')
+    if len(parts) == 3 and all(part.isdigit() for part in parts):
+        # Fast path for the DD.MM.YYYY format of the forms.
+        try:
+            return datetime.date(int(parts[2]), int(parts[1]), int(parts[0]))
+        except ValueError:
+            pass
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, date_format).date()
+        except ValueError:
+            pass
+    raise ValidationError(
+        _(u'{label}: данные должны соответствовать формату "ДД.ММ.ГГГГ".').format(label=label)
+    )
+
+
+def clean_month_year(value, label):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.month, value.year
+    for month_year_format in MONTH_YEAR_FORMATS:
+        try:
+            value = datetime.datetime.strptime(clean_text(value), month_year_format)
+        except ValueError:
+            continue
+        return value.month, value.year
+    raise ValidationError(
+        _(u'{label}: данные должны соответствовать формату "ММ/ГГГГ".').format(label=label)
+    )
+
+
+class Importer(object):
+    """
+    Import rows of a CSV or XLSX file into ``model``.
+
+    The first row holds column titles, either field names or the labels of
+    ``columns``. Rows are processed in batches of ``batch_size``: each batch
+    is validated, its employees are looked up by personnel number in one
+    query and the objects are written with ``bulk_create``. The whole import
+    runs in one transaction and is rolled back if any row is invalid, so the
+    file is imported either completely or not at all. ``errors`` lists
+    ``(line, messages)`` for every rejected row.
+    """
+    model = NotImplemented
+    title = NotImplemented
+    # (field, label, required)
+    columns = NotImplemented
+
+    def __init__(self, user, batch_size=BATCH_SIZE, dry_run=False):
+        self.user = user
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.created = 0
+        self.errors = []
+        self.labels = {field: label for field, label, required in self.columns}
+        self.form_fields = {}
+
+    def get_column_indexes(self, header):
+        titles = [clean_text(title).lower() for title in header]
+        indexes = {}
+        for field, label, required in self.columns:
+            for title in (field, label.lower()):
+                if title in titles:
+                    indexes[field] = titles.index(title)
+                    break
+            else:
+                if required:
+                    raise ImportFileError(
+                        _(u'В файле нет столбца «{label}».').format(label=label)
+                    )
+        return indexes
+
+    def clean_field(self, field, value):
+        """
+        Validate ``value`` of the model ``field`` like a model form would,
+        e.g. the digits and decimal places of a decimal field, so that a
+        value the database cannot store is a row error.
+        """
+        if field not in self.form_fields:
+            self.form_fields[field] = self.model._meta.get_field(field).formfield()
+        try:
+            return self.form_fields[field].clean(value)
+        except ValidationError as error:
+            raise ValidationError([
+                u'{label}: {message}'.format(label=self.labels[field], message=message)
+                for message in error.messages
+            ])
+
+    def clean_row(self, data):
+        raise NotImplementedError('``clean_row()`` method is not implemented')
+
+    def build(self, employee, data):
+        raise NotImplementedError('``build()`` method is not implemented')
+
+    def validate_batch(self, built):
+        """
+        Check the ``(line, instance)`` pairs of a batch against each other
+        and the database; return the valid instances.
+        """
+        return [instance for line, instance in built]
+
+    def add_error(self, line, error):
+        self.errors.append((line, error.messages))
+
+    def import_batch(self, batch):
+        cleaned = []
+        for line, data in batch:
+            try:
+                cleaned.append((line, self.clean_row(data)))
+            except ValidationError as error:
+                self.add_error(line, error)
+
+        employees = {
+            employee.personnel_number: employee
+            for employee in Employee.objects.filter(
+                active=True,
+                personnel_number__in=set(data['personnel_number'] for line, data in cleaned),
+            ).select_related('position')
+        }
+        built = []
+        for line, data in cleaned:
+            employee = employees.get(data['personnel_number'])
+            if employee is None:
+                self.add_error(line, ValidationError(
+                    _(u'Сотрудник с табельным номером «{number}» не найден.').format(
+                        number=data['personnel_number'],
+                    )
+                ))
+                continue
+            try:
+                instance = self.build(employee, data)
+            except ValidationError as error:
+                self.add_error(line, error)
+                continue
+            instance.created_by_id = self.user.pk
+            instance.updated_by_id = self.user.pk
+            built.append((line, instance))
+        instances = self.validate_batch(built)
+
+        # After the first error nothing will be committed, the remaining
+        # batches are only validated.
+        if not self.errors:
+            self.model.objects.bulk_create(instances)
+            objects_imported.send(sender=self.model, instances=instances)
+            self.created += len(instances)
+
+    def run(self, rows):
+        rows = iter(rows)
+        header = next(rows, None)
+        if header is None:
+            raise ImportFileError(_(u'Файл пуст.'))
+        indexes = self.get_column_indexes(header)
+
+        def get_data(row):
+            return {
+                field: row[index] if index < len(row) else None
+                for field, index in indexes.items()
+            }
+
+        lines = (
+            (line, get_data(row))
+            for line, row in enumerate(rows, start=2)
+            if any(clean_text(value) for value in row)
+        )
+        with transaction.atomic():
+            while True:
+                batch = list(itertools.islice(lines, self.batch_size))
+                if not batch:
+                    break
+                self.import_batch(batch)
+            self.errors.sort(key=lambda error: error[0])
+            if self.errors or self.dry_run:
+                transaction.set_rollback(True)
+        if self.errors:
+            self.created = 0
+        return self
+
+
+class BonusImporter(Importer):
+    model = Bonus
+    title = _(u'Премии')
+    columns = (
+        ('personnel_number', _(u'Табельный номер'), True),
+        ('month_year', _(u'За месяц'), True),
+        ('amount', _(u'Сумма'), False),
+        ('percent', _(u'Процент'), False),
+        ('description', _(u'Описание'), False),
+    )
+
+    def clean_row(self, data):
+        errors = []
+        cleaned = {
+            'personnel_number': clean_text(data['personnel_number']),
+            'description': clean_text(data.get('description')),
+        }
+        if not cleaned['personnel_number']:
+            errors.append(_(u'Не указан табельный номер.'))
+        try:
+            cleaned['month'], cleaned['year'] = clean_month_year(data['month_year'], self.labels['month_year'])
+        except ValidationError as error:
+            errors.extend(error.messages)
+        for field in ('amount', 'percent'):
+            label = self.labels[field]
+            if clean_text(data.get(field)):
+                try:
+                    cleaned[field] = clean_decimal(data[field], label)
+                except ValidationError as error:
+                    errors.extend(error.messages)
+                    continue
+                if cleaned[field] < 0:
+                    errors.append(_(u'{label}: значение не может быть отрицательным.').format(label=label))
+        if 'amount' in cleaned:
+            try:
+                cleaned['amount'] = self.clean_field('amount', cleaned['amount'])
+            except ValidationError as error:
+                errors.extend(error.messages)
+        if not errors and 'amount' not in cleaned and 'percent' not in cleaned:
+            errors.append(_(u'Укажите сумму или процент от заработной платы.'))
+        if errors:
+            raise ValidationError(errors)
+        return cleaned
+
+    def build(self, employee, data):
+        amount = data.get('amount')
+        if amount is None:
+            amount = employee.wages * data['percent'] / Decimal(100)
+            try:
+                amount = amount.quantize(TWOPLACES)
+            except InvalidOperation:
+                # Too many digits to quantize, rejected below.
+                pass
+            amount = self.clean_field('amount', amount)
+        return Bonus(
+            employee_id=employee.pk,
+            month=data['month'],
+            year=data['year'],
+            amount=amount,
+            description=data['description'],
+        )
+
+
+class LeaveImporter(Importer):
+    """
+    Leaves take ``rate_field`` from the file; if the column is empty it is
+    filled from the employee like the create forms do.
+    """
+    rate_field = NotImplemented
+
+    def __init__(self, *args, **kwargs):
+        super(LeaveImporter, self).__init__(*args, **kwargs)
+        self.employee_rates = {}
+
+    def get_employee_rate(self, employee):
+        if employee.pk not in self.employee_rates:
+            self.employee_rates[employee.pk] = getattr(employee, self.rate_field).quantize(TWOPLACES)
+        return self.employee_rates[employee.pk]
+
+    def clean_row(self, data):
+        errors = []
+        cleaned = {'personnel_number': clean_text(data['personnel_number'])}
+        if not cleaned['personnel_number']:
+            errors.append(_(u'Не указан табельный номер.'))
+        for field in ('start_date', 'end_date'):
+            try:
+                cleaned[field] = clean_date(data[field], self.labels[field])
+            except ValidationError as error:
+                errors.extend(error.messages)
+        if cleaned.get('start_date') and cleaned.get('end_date') and cleaned['start_date'] > cleaned['end_date']:
+            errors.append(_(u'Дата окончания должна быть позже даты начала.'))
+        if clean_text(data.get(self.rate_field)):
+            try:
+                cleaned[self.rate_field] = self.clean_field(
+                    self.rate_field,
+                    clean_decimal(data[self.rate_field], self.labels[self.rate_field]),
+                )
+            except ValidationError as error:
+                errors.extend(error.messages)
+        if errors:
+            raise ValidationError(errors)
+        return cleaned
+
+    def validate_batch(self, built):
+        """
+        Reject leaves overlapping a stored leave or another leave of the
+        file, see ``find_conflicts()``.
+        """
+        lines = dict((id(instance), line) for line, instance in built)
+        invalid = set()
+        for instance, interval in find_conflicts(self.model, [instance for line, instance in built]):
+            # A row is reported once, with the first leave it overlaps.
+            if id(instance) not in invalid:
+                self.add_error(lines[id(instance)], ValidationError(get_overlap_message(self.model, interval)))
+                invalid.add(id(instance))
+        return [instance for line, instance in built if id(instance) not in invalid]
+
+    def build(self, employee, data):
+        rate = data.get(self.rate_field)
+        if rate is None:
+            rate = self.get_employee_rate(employee)
+        return self.model(
+            employee_id=employee.pk,
+            start_date=data['start_date'],
+            end_date=data['end_date'],
+            **{self.rate_field: rate}
+        )
+
+
+class SickTimeImporter(LeaveImporter):
+    model = SickTime
+    title = _(u'Больничные')
+    rate_field = 'last_two_years_wages'
+    rate_label = _(u'Суммарный заработок за последние 24 месяца')
+    columns = (
+        ('personnel_number', _(u'Табельный номер'), True),
+        ('start_date', _(u'Начало'), True),
+        ('end_date', _(u'Окончание'), True),
+        (rate_field, rate_label, False),
+    )
+
+
+class VacationImporter(LeaveImporter):
+    model = Vacation
+    title = _(u'Отпуска')
+    rate_field = 'average_daily_earnings'
+    rate_label = _(u'Среднедневной заработок')
+    columns = (
+        ('personnel_number', _(u'Табельный номер'), True),
+        ('start_date', _(u'Начало'), True),
+        ('end_date', _(u'Окончание'), True),
+        (rate_field, rate_label, False),
+    )
+
+
+IMPORTERS = (
+    ('bonus', BonusImporter),
+    ('sicktime', SickTimeImporter),
+    ('vacation', VacationImporter),
+)
@@ -0,0 +1,84 @@
+# coding: utf-8
+import datetime
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from common.benchmark import measure
+from common.utils import daterange
+from personnel.generators import generate_payroll_data
+from personnel.models import (
+    SickTime,
+    Vacation,
+)
+
+
+class Command(BaseCommand):
+    help = ('Generates leave rows inside a transaction that is rolled back and '
+            'times the day-by-day, per-employee and batch leave lookups.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employees', type=int, default=2000)
+        parser.add_argument(
+            '--leaves', type=int, default=50,
+            help='Average number of sick leave and vacation rows per employee.',
+        )
+        parser.add_argument(
+            '--sample', type=int, default=100,
+            help='Number of employees used for the per-employee lookups.',
+        )
+        parser.add_argument('--month', type=int, default=6)
+        parser.add_argument('--year', type=int, default=2015)
+
+    def measure(self, title, func):
+        measurement = measure(func)
+        self.stdout.write(u'{title}: {wall_time:.3f}s, {queries} queries, {result} rows'.format(
+            title=title,
+            **measurement
+        ))
+
+    def handle(self, *args, **options):
+        user = User.objects.order_by('pk').first()
+        start_date = datetime.date(options['year'], options['month'], 1)
+        end_date = (start_date + datetime.timedelta(days=31)).replace(day=1) - datetime.timedelta(days=1)
+
+        with transaction.atomic():
+            employees = generate_payroll_data(
+                user,
+                employees=options['employees'],
+                sicktimes=options['leaves'] // 2,
+                vacations=options['leaves'] // 2,
+                bonuses=0,
+            )
+            self.stdout.write(u'{sicktimes} sick leaves, {vacations} vacations'.format(
+                sicktimes=SickTime.objects.count(),
+                vacations=Vacation.objects.count(),
+            ))
+            sample = list(employees[:options['sample']])
+
+            def day_by_day():
+                rows = 0
+                for employee in sample:
+                    for day in daterange(start_date, end_date):
+                        rows += bool(employee.get_sicktime(day))
+                        rows += bool(employee.get_vacation(day))
+                return rows
+
+            def per_employee():
+                rows = 0
+                for employee in sample:
+                    rows += len(employee.sicktime_set.overlapping(None, start_date, end_date))
+                    rows += len(employee.vacation_set.overlapping(None, start_date, end_date))
+                return rows
+
+            def batch():
+                return (
+                    len(SickTime.objects.overlapping(employees, start_date, end_date)) +
+                    len(Vacation.objects.overlapping(employees, start_date, end_date))
+                )
+
+            self.measure(u'day by day, {0} employees'.format(len(sample)), day_by_day)
+            self.measure(u'per employee, {0} employees'.format(len(sample)), per_employee)
+            self.measure(u'batch, {0} employees'.format(employees.count()), batch)
+            transaction.set_rollback(True)
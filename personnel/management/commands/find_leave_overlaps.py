@@ -0,0 +1,42 @@
+# coding: utf-8
+from django.core.management.base import BaseCommand, CommandError
+
+from personnel.models import (
+    SickTime,
+    Vacation,
+)
+from personnel.overlaps import (
+    Interval,
+    iter_overlaps,
+)
+
+
+class Command(BaseCommand):
+    help = ('Scans the whole history for overlapping active sick leaves or vacations '
+            'of the same employee, in one pass over each table.')
+
+    def handle(self, *args, **options):
+        conflicts = 0
+        for model in (SickTime, Vacation):
+            rows = model.objects.filter(active=True).order_by(
+                'employee_id', 'start_date', 'end_date',
+            ).values_list('pk', 'employee_id', 'start_date', 'end_date')
+            intervals = (Interval(*row, leave=None) for row in rows.iterator())
+            for earlier, later in iter_overlaps(intervals):
+                conflicts += 1
+                self.stdout.write(
+                    u'{model} employee {employee}: #{earlier} {earlier_start} - {earlier_end} '
+                    u'overlaps #{later} {later_start} - {later_end}'.format(
+                        model=model._meta.model_name,
+                        employee=earlier.employee_id,
+                        earlier=earlier.pk,
+                        earlier_start=earlier.start_date,
+                        earlier_end=earlier.end_date,
+                        later=later.pk,
+                        later_start=later.start_date,
+                        later_end=later.end_date,
+                    )
+                )
+        self.stdout.write(u'{count} overlapping pairs found'.format(count=conflicts))
+        if conflicts:
+            raise CommandError('Overlapping leaves found.')
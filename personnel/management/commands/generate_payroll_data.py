@@ -0,0 +1,64 @@
+# coding: utf-8
+import datetime
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from personnel.generators import generate_payroll_data
+
+
+class Command(BaseCommand):
+    help = 'Fills the database with synthetic departments, employees, bonuses and leaves.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--departments', type=int, default=3)
+        parser.add_argument('--positions', type=int, default=10)
+        parser.add_argument('--employees', type=int, default=100)
+        parser.add_argument(
+            '--sicktimes', type=int, default=2,
+            help='Average number of sick leaves per employee.',
+        )
+        parser.add_argument(
+            '--vacations', type=int, default=2,
+            help='Average number of vacations per employee.',
+        )
+        parser.add_argument(
+            '--bonuses', type=int, default=2,
+            help='Average number of bonuses per employee.',
+        )
+        parser.add_argument(
+            '--start', default='2014-01-01',
+            help='First date of the generated history, YYYY-MM-DD.',
+        )
+        parser.add_argument('--years', type=int, default=2)
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument(
+            '--username', default=None,
+            help='Author of the generated rows; the first user by default.',
+        )
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('pk')
+        if options['username']:
+            users = users.filter(username=options['username'])
+        user = users.first()
+        if user is None:
+            raise CommandError('No user to record as the author of the generated rows.')
+        try:
+            start_date = datetime.datetime.strptime(options['start'], '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError('--start must be a date in YYYY-MM-DD format.')
+
+        employees = generate_payroll_data(
+            user,
+            departments=options['departments'],
+            positions=options['positions'],
+            employees=options['employees'],
+            sicktimes=options['sicktimes'],
+            vacations=options['vacations'],
+            bonuses=options['bonuses'],
+            start_date=start_date,
+            years=options['years'],
+            seed=options['seed'],
+        )
+        self.stdout.write(u'{count} employees created'.format(count=employees.count()))
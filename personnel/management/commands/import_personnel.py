@@ -0,0 +1,55 @@
+# coding: utf-8
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from personnel.importers import (
+    IMPORTERS,
+    BATCH_SIZE,
+    ImportFileError,
+    read_rows,
+)
+
+
+class Command(BaseCommand):
+    help = 'Imports bonuses, sick leaves or vacations from a CSV or XLSX file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=[kind for kind, importer in IMPORTERS])
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument(
+            '--dry-run', action='store_true', default=False,
+            help='Validate the file without saving anything.',
+        )
+        parser.add_argument(
+            '--username', default=None,
+            help='Author of the imported rows; the first user by default.',
+        )
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('pk')
+        if options['username']:
+            users = users.filter(username=options['username'])
+        user = users.first()
+        if user is None:
+            raise CommandError('No user to record as the author of the imported rows.')
+
+        importer = dict(IMPORTERS)[options['kind']](
+            user,
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run'],
+        )
+        try:
+            with open(options['path'], 'rb') as fileobj:
+                importer.run(read_rows(fileobj, options['path']))
+        except (IOError, ImportFileError) as error:
+            raise CommandError(unicode(error))
+
+        if importer.errors:
+            for line, messages in importer.errors:
+                self.stderr.write(u'{line}: {messages}'.format(line=line, messages=u' '.join(messages)))
+            raise CommandError('{count} invalid rows, nothing imported.'.format(count=len(importer.errors)))
+        if importer.dry_run:
+            self.stdout.write(u'{count} rows are valid'.format(count=importer.created))
+        else:
+            self.stdout.write(u'{count} rows imported'.format(count=importer.created))
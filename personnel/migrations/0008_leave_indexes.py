@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('personnel', '0007_auto_20150607_2104'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='bonus',
+            index_together=set([('employee', 'active', 'month')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='sicktime',
+            index_together=set([('employee', 'active', 'start_date', 'end_date')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='vacation',
+            index_together=set([('employee', 'active', 'start_date', 'end_date')]),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('personnel', '0008_leave_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='department',
+            name='name',
+            field=models.CharField(max_length=100, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='employee',
+            name='name',
+            field=models.CharField(max_length=100, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='position',
+            name='name',
+            field=models.CharField(max_length=100, db_index=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('personnel', '0009_name_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='bonus',
+            index_together=set([('employee', 'year', 'month', 'active')]),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def fill_search_names(apps, schema_editor):
+    for model_name in ('Department', 'Position', 'Employee'):
+        model = apps.get_model('personnel', model_name)
+        for pk, name in model.objects.values_list('pk', 'name').iterator():
+            model.objects.filter(pk=pk).update(search_name=name.lower())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('personnel', '0010_bonus_period_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='department',
+            name='search_name',
+            field=models.CharField(default='', max_length=100, editable=False, db_index=True),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='employee',
+            name='search_name',
+            field=models.CharField(default='', max_length=100, editable=False, db_index=True),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='position',
+            name='search_name',
+            field=models.CharField(default='', max_length=100, editable=False, db_index=True),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_search_names, migrations.RunPython.noop),
+    ]
@@ -3,7 +3,7 @@ from decimal import Decimal
 from django.db import models
 from django.utils.translation import ugettext as _
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db.models import Sum
+from django.db.models import Q, Sum
 
 from common.models import CommonModel
 from common.models import UnicodeNameMixin
@@ -12,6 +12,8 @@ from common.utils import business_days
 ABSTRACT_RATIO = Decimal('730.00')
 MINIMAL_DAILY_WAGES = Decimal('196.10')
 MAXIMUM_DAILY_WAGES = Decimal('1632.87')
+MONTHS_IN_TWO_YEARS = Decimal(24)
+DAYS_IN_MONTH = Decimal(30)
 
 INSURANCE_EXPERIENCE_LESS_THAN_FIVE_YEARS = 0
 INSURANCE_EXPERIENCE_FROM_FIVE_TO_EIGHT_YEARS = 1
@@ -25,16 +27,36 @@ INSURANCE_RATIO = {
 TWOPLACES = Decimal(10) ** -2
 
 
-class Department(UnicodeNameMixin, CommonModel):
-    name = models.CharField(max_length=100)
+def get_search_name(name):
+    return name.lower()
+
+
+class SearchNameModel(models.Model):
+    """
+    ``name`` lower-cased in an indexed column, for case-insensitive prefix
+    search: SQLite only folds the case of ASCII letters. ``save()`` fills
+    it; rows written with ``bulk_create`` must be given it.
+    """
+    search_name = models.CharField(max_length=100, db_index=True, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        self.search_name = get_search_name(self.name)
+        super(SearchNameModel, self).save(*args, **kwargs)
+
+
+class Department(UnicodeNameMixin, SearchNameModel, CommonModel):
+    name = models.CharField(max_length=100, db_index=True)
 
     class Meta:
         verbose_name = _(u'отдел')
         verbose_name_plural = _(u'отделы')
 
 
-class Position(UnicodeNameMixin, CommonModel):
-    name = models.CharField(max_length=100)
+class Position(UnicodeNameMixin, SearchNameModel, CommonModel):
+    name = models.CharField(max_length=100, db_index=True)
     wages = models.DecimalField(max_digits=22, decimal_places=2)
 
     class Meta:
@@ -42,14 +64,33 @@ class Position(UnicodeNameMixin, CommonModel):
         verbose_name_plural = _(u'должности')
 
 
-class Employee(UnicodeNameMixin, CommonModel):
+class EmployeeQuerySet(models.QuerySet):
+    def rates(self):
+        """
+        Map employee pk to its wages, last two years wages and average daily
+        earnings, read in one query joined with positions.
+        """
+        rates = {}
+        for pk, permanent_bonus_amount, position_wages in self.values_list(
+            'pk', 'permanent_bonus_amount', 'position__wages'
+        ):
+            wages = permanent_bonus_amount + position_wages
+            rates[pk] = {
+                'wages': wages,
+                'last_two_years_wages': wages * MONTHS_IN_TWO_YEARS,
+                'average_daily_earnings': wages / DAYS_IN_MONTH,
+            }
+        return rates
+
+
+class Employee(UnicodeNameMixin, SearchNameModel, CommonModel):
     INSURANCE_EXPERIENCE_CHOICES = (
         (INSURANCE_EXPERIENCE_LESS_THAN_FIVE_YEARS, _(u'Менее 5 лет')),
         (INSURANCE_EXPERIENCE_FROM_FIVE_TO_EIGHT_YEARS, _(u'От 5 до 8 лет')),
         (INSURANCE_EXPERIENCE_MORE_THAN_EIGHT_YEARS, _(u'8 лет и более')),
     )
 
-    name = models.CharField(max_length=100)
+    name = models.CharField(max_length=100, db_index=True)
     department = models.ForeignKey(to=Department)
     position = models.ForeignKey(to=Position)
     personnel_number = models.CharField(unique=True, max_length=100, verbose_name=_(u'табельный номер'))
@@ -59,41 +100,70 @@ class Employee(UnicodeNameMixin, CommonModel):
     )
     hired = models.DateField()
 
+    objects = EmployeeQuerySet.as_manager()
+
     class Meta:
         verbose_name = _(u'сотрудник')
         verbose_name_plural = _(u'сотрудники')
 
     def get_sicktime(self, date):
-        return self.sicktime_set.filter(
-            start_date__lte=date,
-            end_date__gte=date,
-            active=True,
-        ).first()
+        return self.sicktime_set.overlapping(None, date, date).first()
 
     def get_vacation(self, date):
-        return self.vacation_set.filter(
-            start_date__lte=date,
-            end_date__gte=date,
-            active=True,
-        ).first()
+        return self.vacation_set.overlapping(None, date, date).first()
+
+    def get_position(self):
+        """
+        Position of the employee, from the reference cache unless it has
+        been read together with the employee.
+        """
+        if not hasattr(self, self._meta.get_field('position').get_cache_name()):
+            from personnel.cache import get_position
+            self.position = get_position(self.position_id)
+        return self.position
 
     @property
     def wages(self):
-        return self.permanent_bonus_amount + self.position.wages
+        return self.permanent_bonus_amount + self.get_position().wages
 
     @property
     def last_two_years_wages(self):
-        return self.wages * Decimal(24)
+        return self.wages * MONTHS_IN_TWO_YEARS
 
     @property
     def average_daily_earnings(self):
-        return self.wages / Decimal(30)
-
-    def get_bonus_payments(self, month):
-        return self.bonus_set.filter(active=True, month=month).aggregate(
-            Sum('amount')
-        )['amount__sum'] or Decimal()
-
+        return self.wages / DAYS_IN_MONTH
+
+    def get_bonus_payments(self, year, month):
+        return Bonus.objects.payments([self.pk], year, month).get(self.pk) or Decimal()
+
+
+class BonusQuerySet(models.QuerySet):
+    def payments(self, employees, year, month):
+        """
+        Sums of the active bonuses for ``month`` of ``year`` keyed by
+        employee id. ``employees`` is a list of employee ids or an employee
+        queryset.
+        """
+        return self.payments_by_month(employees, [(year, month)])[(year, month)]
+
+    def payments_by_month(self, employees, months):
+        """
+        Sums of the active bonuses for each of ``months``, a list of
+        ``(year, month)`` pairs, keyed by the pair and then by employee id.
+        A single query grouped by employee, year and month.
+        """
+        query = Q()
+        for year, month in months:
+            query |= Q(year=year, month=month)
+        payments = dict((key, {}) for key in months)
+        for item in self.filter(
+            query,
+            employee__in=employees,
+            active=True,
+        ).values('employee', 'year', 'month').annotate(Sum('amount')).order_by():
+            payments[(item['year'], item['month'])][item['employee']] = item['amount__sum']
+        return payments
 
 
 class Bonus(CommonModel):
@@ -108,9 +178,14 @@ class Bonus(CommonModel):
     amount = models.DecimalField(max_digits=22, decimal_places=2)
     description = models.TextField(blank=True)
 
+    objects = BonusQuerySet.as_manager()
+
     class Meta:
         verbose_name = _(u'премия')
         verbose_name_plural = _(u'премии')
+        index_together = (
+            ('employee', 'year', 'month', 'active'),
+        )
 
     @property
     def formatted_date(self, format_=u"{month:0>2}/{year}"):
@@ -136,15 +211,37 @@ class PaymentsQuerySet(models.QuerySet):
         return sum(map(lambda item: item.payments, self))
 
 
+class LeaveQuerySet(models.QuerySet):
+    def overlapping(self, employees, start_date, end_date):
+        """
+        Active leaves overlapping the period from ``start_date`` to
+        ``end_date``. ``employees`` is a list of employee ids or an employee
+        queryset; ``None`` keeps the current employee filter.
+        """
+        queryset = self.filter(
+            active=True,
+            start_date__lte=end_date,
+            end_date__gte=start_date,
+        )
+        if employees is not None:
+            queryset = queryset.filter(employee__in=employees)
+        return queryset
+
+
 class SickTime(CommonModel):
     employee = models.ForeignKey(to=Employee)
     start_date = models.DateField()
     end_date = models.DateField()
     last_two_years_wages = models.DecimalField(max_digits=22, decimal_places=2)
 
+    objects = LeaveQuerySet.as_manager()
+
     class Meta:
         verbose_name = _(u'больничный')
         verbose_name_plural = _(u'больничные')
+        index_together = (
+            ('employee', 'active', 'start_date', 'end_date'),
+        )
 
     def __unicode__(self):
         return u"{name}: {start} - {end}".format(
@@ -170,9 +267,14 @@ class Vacation(CommonModel):
     end_date = models.DateField()
     average_daily_earnings = models.DecimalField(max_digits=22, decimal_places=2)
 
+    objects = LeaveQuerySet.as_manager()
+
     class Meta:
         verbose_name = _(u'отпуск')
         verbose_name_plural = _(u'отпуска')
+        index_together = (
+            ('employee', 'active', 'start_date', 'end_date'),
+        )
 
 
     def __unicode__(self):
@@ -0,0 +1,87 @@
+# coding:utf-8
+"""
+Overlapping sick leaves and vacations.
+
+Two active leaves of the same kind of an employee must not overlap. A sick
+leave may overlap a vacation: the payroll gives such days to the sick
+leave.
+"""
+from collections import namedtuple
+
+from django.utils.translation import ugettext as _
+
+from personnel.models import (
+    SickTime,
+    Vacation,
+)
+
+# ``leave`` is the unsaved or changed leave the interval comes from, ``None``
+# for a stored leave.
+Interval = namedtuple('Interval', ('pk', 'employee_id', 'start_date', 'end_date', 'leave'))
+
+OVERLAP_MESSAGES = {
+    SickTime: _(u'В этот период у сотрудника уже есть больничный с {start} по {end}.'),
+    Vacation: _(u'В этот период у сотрудника уже есть отпуск с {start} по {end}.'),
+}
+
+
+def iter_overlaps(intervals):
+    """
+    Yield ``(earlier, later)`` for every pair of overlapping ``intervals``
+    of the same employee, the intervals being sorted by employee and start
+    date. A sweep line over the start dates keeps the intervals that are
+    still open, so the cost is linear in the number of intervals and of
+    overlaps.
+    """
+    employee_id = None
+    open_intervals = []
+    for interval in intervals:
+        if interval.employee_id != employee_id:
+            employee_id = interval.employee_id
+            open_intervals = []
+        open_intervals = [other for other in open_intervals if other.end_date >= interval.start_date]
+        for other in open_intervals:
+            yield other, interval
+        open_intervals.append(interval)
+
+
+def find_conflicts(model, leaves):
+    """
+    Overlaps of the new or changed ``leaves`` of ``model`` with the active
+    leaves of the same employees and with each other, as ``(leave,
+    interval)`` pairs. Stored leaves are read with a single range query on
+    the ``(employee, active, start_date, end_date)`` index, whatever the
+    number of ``leaves`` is.
+    """
+    leaves = [leave for leave in leaves if leave.start_date <= leave.end_date]
+    if not leaves:
+        return []
+    stored = model.objects.filter(
+        active=True,
+        employee__in=set(leave.employee_id for leave in leaves),
+        start_date__lte=max(leave.end_date for leave in leaves),
+        end_date__gte=min(leave.start_date for leave in leaves),
+    ).exclude(
+        pk__in=[leave.pk for leave in leaves if leave.pk is not None],
+    ).values_list('pk', 'employee_id', 'start_date', 'end_date')
+    intervals = [Interval(*row, leave=None) for row in stored]
+    intervals.extend(
+        Interval(leave.pk, leave.employee_id, leave.start_date, leave.end_date, leave)
+        for leave in leaves
+    )
+    intervals.sort(key=lambda interval: (interval.employee_id, interval.start_date, interval.end_date))
+
+    conflicts = []
+    for earlier, later in iter_overlaps(intervals):
+        if later.leave is not None:
+            conflicts.append((later.leave, earlier))
+        elif earlier.leave is not None:
+            conflicts.append((earlier.leave, later))
+    return conflicts
+
+
+def get_overlap_message(model, interval):
+    return OVERLAP_MESSAGES[model].format(
+        start=interval.start_date.strftime('%d.%m.%Y'),
+        end=interval.end_date.strftime('%d.%m.%Y'),
+    )
@@ -0,0 +1,616 @@
+# coding:utf-8
+import datetime
+import json
+import shutil
+import tempfile
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.urlresolvers import reverse
+from django.http import QueryDict
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils.six import StringIO
+
+from common.cache import (
+    VERSION_KEY,
+    get_model_label,
+    reference_cache,
+)
+from personnel.cache import get_positions
+from personnel.forms import (
+    PersonnelFilterForm,
+    VacationCreateForm,
+    VacationUpdateForm,
+)
+from personnel.importers import (
+    BonusImporter,
+    SickTimeImporter,
+    VacationImporter,
+)
+from personnel.overlaps import (
+    Interval,
+    find_conflicts,
+    iter_overlaps,
+)
+from personnel.views import (
+    BonusListView,
+    EmployeeSearchView,
+)
+from personnel.models import (
+    Department,
+    Position,
+    Employee,
+    Bonus,
+    SickTime,
+    Vacation,
+)
+
+
+class BonusPaymentsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('accountant')
+        audit = {'created_by': self.user, 'updated_by': self.user}
+        self.employee = Employee.objects.create(
+            name=u'Сотрудник',
+            department=Department.objects.create(name=u'Бухгалтерия', **audit),
+            position=Position.objects.create(name=u'Бухгалтер', wages=Decimal('30000.00'), **audit),
+            personnel_number='1',
+            permanent_bonus_amount=Decimal('0.00'),
+            hired=datetime.date(2010, 1, 1),
+            **audit
+        )
+        self.other = Employee.objects.create(
+            name=u'Другой сотрудник',
+            department=self.employee.department,
+            position=self.employee.position,
+            personnel_number='2',
+            permanent_bonus_amount=Decimal('0.00'),
+            hired=datetime.date(2010, 1, 1),
+            **audit
+        )
+        for employee, year, month, amount, active in (
+            (self.employee, 2013, 3, '100.00', True),
+            (self.employee, 2014, 3, '200.00', True),
+            (self.employee, 2014, 3, '25.50', True),
+            (self.employee, 2014, 3, '1000.00', False),
+            (self.employee, 2014, 4, '400.00', True),
+            (self.employee, 2015, 3, '300.00', True),
+            (self.other, 2014, 3, '7.00', True),
+        ):
+            Bonus.objects.create(
+                employee=employee, year=year, month=month, amount=Decimal(amount), active=active, **audit
+            )
+
+    def test_get_bonus_payments(self):
+        self.assertEqual(self.employee.get_bonus_payments(2013, 3), Decimal('100.00'))
+        self.assertEqual(self.employee.get_bonus_payments(2014, 3), Decimal('225.50'))
+        self.assertEqual(self.employee.get_bonus_payments(2015, 3), Decimal('300.00'))
+        self.assertEqual(self.employee.get_bonus_payments(2016, 3), Decimal())
+
+    def test_deleted_bonus(self):
+        # Deleting a bonus deactivates it.
+        Bonus.objects.filter(year=2015).update(active=False)
+        self.assertEqual(self.employee.get_bonus_payments(2015, 3), Decimal())
+        self.assertEqual(self.employee.get_bonus_payments(2014, 3), Decimal('225.50'))
+
+    def test_payments_by_month(self):
+        payments = Bonus.objects.payments_by_month(
+            Employee.objects.all(), [(2013, 3), (2014, 3), (2014, 4), (2015, 3), (2015, 4)]
+        )
+        self.assertEqual(payments, {
+            (2013, 3): {self.employee.pk: Decimal('100.00')},
+            (2014, 3): {self.employee.pk: Decimal('225.50'), self.other.pk: Decimal('7.00')},
+            (2014, 4): {self.employee.pk: Decimal('400.00')},
+            (2015, 3): {self.employee.pk: Decimal('300.00')},
+            (2015, 4): {},
+        })
+
+
+class ImporterAmountTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('accountant')
+        audit = {'created_by': self.user, 'updated_by': self.user}
+        Employee.objects.create(
+            name=u'Сотрудник',
+            department=Department.objects.create(name=u'Бухгалтерия', **audit),
+            position=Position.objects.create(name=u'Бухгалтер', wages=Decimal('30000.00'), **audit),
+            personnel_number='1',
+            permanent_bonus_amount=Decimal('0.00'),
+            hired=datetime.date(2010, 1, 1),
+            **audit
+        )
+
+    def test_bonus_amounts(self):
+        importer = BonusImporter(self.user).run([
+            ['personnel_number', 'month_year', 'amount', 'percent'],
+            ['1', '03/2015', '1' * 21, ''],
+            ['1', '03/2015', '100.001', ''],
+            ['1', '03/2015', '', '1' * 30],
+            ['1', '03/2015', 'NaN', ''],
+            ['1', '03/2015', '', 'nan'],
+            ['1', '03/2015', 'Infinity', ''],
+            ['1', '03/2015', '', '-inf'],
+            ['1', '03/2015', float('nan'), ''],
+            ['1', '04/2015', '100.00', ''],
+        ])
+        self.assertEqual([line for line, messages in importer.errors], [2, 3, 4, 5, 6, 7, 8, 9])
+        self.assertEqual(importer.created, 0)
+        self.assertFalse(Bonus.objects.exists())
+
+    def test_vacation_rate(self):
+        importer = VacationImporter(self.user).run([
+            ['personnel_number', 'start_date', 'end_date', 'average_daily_earnings'],
+            ['1', '01.03.2015', '10.03.2015', '1' * 21],
+            ['1', '11.03.2015', '12.03.2015', 'sNaN'],
+            ['1', '13.03.2015', '14.03.2015', 'Infinity'],
+        ])
+        self.assertEqual([line for line, messages in importer.errors], [2, 3, 4])
+
+    def test_valid(self):
+        importer = BonusImporter(self.user).run([
+            ['personnel_number', 'month_year', 'amount', 'percent'],
+            ['1', '03/2015', '12345.67', ''],
+            ['1', '04/2015', '', '10'],
+        ])
+        self.assertEqual(importer.errors, [])
+        self.assertEqual(
+            sorted(Bonus.objects.values_list('amount', flat=True)),
+            [Decimal('3000.00'), Decimal('12345.67')],
+        )
+
+
+class LeaveOverlapTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('accountant')
+        self.audit = {'created_by': self.user, 'updated_by': self.user}
+        department = Department.objects.create(name=u'Бухгалтерия', **self.audit)
+        position = Position.objects.create(name=u'Бухгалтер', wages=Decimal('30000.00'), **self.audit)
+        self.employee, self.other = [
+            Employee.objects.create(
+                name=name,
+                department=department,
+                position=position,
+                personnel_number=number,
+                permanent_bonus_amount=Decimal('0.00'),
+                hired=datetime.date(2010, 1, 1),
+                **self.audit
+            )
+            for name, number in ((u'Сотрудник', '1'), (u'Другой сотрудник', '2'))
+        ]
+        self.vacation = self.create(Vacation, self.employee, datetime.date(2015, 3, 10), datetime.date(2015, 3, 20))
+
+    def create(self, model, employee, start_date, end_date, **kwargs):
+        rate_field = 'average_daily_earnings' if model is Vacation else 'last_two_years_wages'
+        kwargs.setdefault(rate_field, Decimal('1000.00'))
+        return model.objects.create(
+            employee=employee, start_date=start_date, end_date=end_date, **dict(self.audit, **kwargs)
+        )
+
+    def conflicts(self, model, employee, start_date, end_date, pk=None):
+        leave = model(pk=pk, employee_id=employee.pk, start_date=start_date, end_date=end_date)
+        return [interval.pk for leave, interval in find_conflicts(model, [leave])]
+
+    def test_iter_overlaps(self):
+        intervals = [
+            Interval(pk, employee_id, datetime.date(2015, 3, start), datetime.date(2015, 3, end), None)
+            for pk, employee_id, start, end in (
+                (1, 1, 1, 10),
+                (2, 1, 5, 6),
+                (3, 1, 10, 12),
+                (4, 1, 13, 15),
+                (5, 2, 14, 20),
+            )
+        ]
+        self.assertEqual(
+            [(earlier.pk, later.pk) for earlier, later in iter_overlaps(intervals)],
+            [(1, 2), (1, 3)],
+        )
+
+    def test_touching(self):
+        # Leaves sharing no day do not overlap, leaves sharing one day do.
+        self.assertEqual(self.conflicts(Vacation, self.employee, datetime.date(2015, 3, 1), datetime.date(2015, 3, 9)), [])
+        self.assertEqual(self.conflicts(Vacation, self.employee, datetime.date(2015, 3, 21), datetime.date(2015, 3, 31)), [])
+        self.assertEqual(
+            self.conflicts(Vacation, self.employee, datetime.date(2015, 3, 1), datetime.date(2015, 3, 10)),
+            [self.vacation.pk],
+        )
+        self.assertEqual(
+            self.conflicts(Vacation, self.employee, datetime.date(2015, 3, 20), datetime.date(2015, 3, 31)),
+            [self.vacation.pk],
+        )
+        self.assertEqual(
+            self.conflicts(Vacation, self.employee, datetime.date(2015, 3, 12), datetime.date(2015, 3, 14)),
+            [self.vacation.pk],
+        )
+
+    def test_other_kind_or_employee(self):
+        # A sick leave may overlap a vacation, another employee may be on
+        # leave at the same time, a deleted leave is ignored.
+        start, end = datetime.date(2015, 3, 12), datetime.date(2015, 3, 14)
+        self.assertEqual(self.conflicts(SickTime, self.employee, start, end), [])
+        self.assertEqual(self.conflicts(Vacation, self.other, start, end), [])
+        Vacation.objects.filter(pk=self.vacation.pk).update(active=False)
+        self.assertEqual(self.conflicts(Vacation, self.employee, start, end), [])
+
+    def test_edit_same_leave(self):
+        self.assertEqual(
+            self.conflicts(Vacation, self.employee, datetime.date(2015, 3, 15), datetime.date(2015, 3, 25), self.vacation.pk),
+            [],
+        )
+
+    def test_create_form(self):
+        data = {
+            'employee': self.employee.pk,
+            'start_date': '15.03.2015',
+            'end_date': '25.03.2015',
+            'average_daily_earnings': '1000.00',
+        }
+        form = VacationCreateForm(data)
+        self.assertFalse(form.is_valid())
+        self.assertEqual(len(form.non_field_errors()), 1)
+        self.assertIn(u'10.03.2015', form.non_field_errors()[0])
+
+        data['start_date'] = '21.03.2015'
+        self.assertTrue(VacationCreateForm(data).is_valid())
+        data['employee'] = self.other.pk
+        data['start_date'] = '15.03.2015'
+        self.assertTrue(VacationCreateForm(data).is_valid())
+
+    def test_update_form(self):
+        data = {
+            'start_date': '15.03.2015',
+            'end_date': '25.03.2015',
+            'average_daily_earnings': '1000.00',
+        }
+        self.assertTrue(VacationUpdateForm(data, instance=self.vacation).is_valid())
+
+        later = self.create(Vacation, self.employee, datetime.date(2015, 4, 1), datetime.date(2015, 4, 10))
+        form = VacationUpdateForm(data, instance=later)
+        self.assertFalse(form.is_valid())
+        self.assertEqual(len(form.non_field_errors()), 1)
+
+    def test_import(self):
+        importer = VacationImporter(self.user).run([
+            ['personnel_number', 'start_date', 'end_date'],
+            # Overlaps the stored vacation.
+            ['1', '20.03.2015', '22.03.2015'],
+            # Touches it.
+            ['1', '09.03.2015', '09.03.2015'],
+            # Overlap each other.
+            ['2', '01.03.2015', '10.03.2015'],
+            ['2', '10.03.2015', '12.03.2015'],
+            ['2', '13.03.2015', '14.03.2015'],
+        ])
+        self.assertEqual([line for line, messages in importer.errors], [2, 5])
+        self.assertEqual(importer.created, 0)
+        self.assertEqual(Vacation.objects.count(), 1)
+
+    def test_import_batches(self):
+        # Rows of different batches are checked against each other as
+        # the earlier batches are already written in the transaction.
+        importer = VacationImporter(self.user, batch_size=1).run([
+            ['personnel_number', 'start_date', 'end_date'],
+            ['2', '01.03.2015', '10.03.2015'],
+            ['2', '05.03.2015', '06.03.2015'],
+        ])
+        self.assertEqual([line for line, messages in importer.errors], [3])
+        self.assertEqual(Vacation.objects.count(), 1)
+
+    def test_import_other_kind(self):
+        importer = SickTimeImporter(self.user).run([
+            ['personnel_number', 'start_date', 'end_date'],
+            ['1', '12.03.2015', '14.03.2015'],
+        ])
+        self.assertEqual(importer.errors, [])
+        self.assertEqual(importer.created, 1)
+
+    def test_command(self):
+        stdout = StringIO()
+        call_command('find_leave_overlaps', stdout=stdout)
+        self.assertIn(u'0 overlapping pairs found', stdout.getvalue())
+
+        self.create(SickTime, self.employee, datetime.date(2015, 3, 12), datetime.date(2015, 3, 14))
+        overlapping = self.create(Vacation, self.employee, datetime.date(2015, 3, 20), datetime.date(2015, 3, 22))
+        stdout = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('find_leave_overlaps', stdout=stdout)
+        output = stdout.getvalue()
+        self.assertIn(u'#{earlier} 2015-03-10 - 2015-03-20 overlaps #{later}'.format(
+            earlier=self.vacation.pk, later=overlapping.pk,
+        ), output)
+        self.assertIn(u'1 overlapping pairs found', output)
+
+
+class KeysetPaginationTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('accountant')
+        audit = {'created_by': self.user, 'updated_by': self.user}
+        employee = Employee.objects.create(
+            name=u'Сотрудник',
+            department=Department.objects.create(name=u'Бухгалтерия', **audit),
+            position=Position.objects.create(name=u'Бухгалтер', wages=Decimal('30000.00'), **audit),
+            personnel_number='1',
+            permanent_bonus_amount=Decimal('0.00'),
+            hired=datetime.date(2010, 1, 1),
+            **audit
+        )
+        # Identical but for the primary key: only the key orders them.
+        Bonus.objects.bulk_create([
+            Bonus(employee=employee, year=2015, month=3, amount=Decimal('100.00'), **audit)
+            for i in range(7)
+        ])
+        Bonus.objects.filter(pk=Bonus.objects.order_by('pk')[3].pk).update(active=False)
+        self.pks = list(Bonus.objects.filter(active=True).order_by('-pk').values_list('pk', flat=True))
+        self.page_size = BonusListView.page_size
+        BonusListView.page_size = 2
+        self.addCleanup(setattr, BonusListView, 'page_size', self.page_size)
+
+    def get_page(self, query=''):
+        request = RequestFactory().get('/bonus/', QueryDict(query))
+        request.user = self.user
+        response = BonusListView.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        return [bonus.pk for bonus in response.context_data['object_list']], response.context_data.get('next_page_query')
+
+    def test_queries(self):
+        # The page and its employees in one query, the first page or not.
+        with self.assertNumQueries(1):
+            page, query = self.get_page()
+        with self.assertNumQueries(1):
+            self.get_page(query)
+        with self.assertNumQueries(1):
+            self.get_page('after={0}'.format(self.pks[-1]))
+
+    def test_pages(self):
+        # Every row once, in order, the last page without a next one.
+        pks = []
+        query = 'month_year=03/2015'
+        while query is not None:
+            page, query = self.get_page(query)
+            self.assertLessEqual(len(page), 2)
+            pks.extend(page)
+        self.assertEqual(pks, self.pks)
+
+    def test_full_last_page(self):
+        # Six rows fill three pages: the third one has no next page.
+        self.assertEqual(len(self.pks), 6)
+        page, query = self.get_page('after={0}'.format(self.pks[3]))
+        self.assertEqual(page, self.pks[4:])
+        self.assertIsNone(query)
+
+    def test_cursor(self):
+        # The cursor need not be a listed row; an invalid one is ignored.
+        deleted = Bonus.objects.get(active=False).pk
+        page, query = self.get_page('after={0}'.format(deleted))
+        self.assertEqual(page, [pk for pk in self.pks if pk < deleted][:2])
+        self.assertEqual(self.get_page('after=abc')[0], self.pks[:2])
+        page, query = self.get_page('month_year=03/2015&after=abc')
+        self.assertEqual(QueryDict(query), QueryDict('month_year=03/2015&after={0}'.format(self.pks[1])))
+
+
+@override_settings(ROOT_URLCONF='personnel.urls')
+class EmployeeSearchTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('accountant', password='secret')
+        audit = {'created_by': self.user, 'updated_by': self.user}
+        accounting = Department.objects.create(name=u'Бухгалтерия', **audit)
+        sales = Department.objects.create(name=u'Продажи', **audit)
+        accountant = Position.objects.create(name=u'Бухгалтер', wages=Decimal('30000.00'), **audit)
+        manager = Position.objects.create(name=u'Менеджер', wages=Decimal('40000.00'), **audit)
+        self.employees = {}
+        for name, number, department, position in (
+            (u'Иванов', '101', accounting, manager),
+            (u'Петров', '102', sales, accountant),
+            (u'Бухаров', '201', sales, manager),
+            (u'Сидоров', '202', sales, manager),
+        ):
+            self.employees[name] = Employee.objects.create(
+                name=name,
+                department=department,
+                position=position,
+                personnel_number=number,
+                permanent_bonus_amount=Decimal('0.00'),
+                hired=datetime.date(2010, 1, 1),
+                **audit
+            )
+        self.client.login(username='accountant', password='secret')
+
+    def search(self, **params):
+        response = self.client.get(reverse('employee-search'), params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def get_names(self, data):
+        return [result['name'] for result in data['results']]
+
+    def test_fields(self):
+        # Department, position and name, whatever the case of the term.
+        self.assertEqual(self.get_names(self.search(q=u'бух')), [u'Бухаров', u'Петров', u'Иванов'])
+        self.assertEqual(self.get_names(self.search(q=u'20')), [u'Сидоров', u'Бухаров'])
+        self.assertEqual(self.get_names(self.search(q=u'Мен')), [u'Сидоров', u'Бухаров', u'Иванов'])
+        self.assertEqual(self.get_names(self.search(q=u'нет')), [])
+
+    def test_case(self):
+        for term in (u'иван', u'Иван', u'иВАН', u'ИВАН'):
+            self.assertEqual(self.get_names(self.search(q=term)), [u'Иванов'], term)
+        self.assertEqual(self.get_names(self.search(q=u'ПРОДАЖИ')), [u'Сидоров', u'Бухаров', u'Петров'])
+        employee = self.employees[u'Сидоров']
+        employee.personnel_number = 'AB-7'
+        employee.save()
+        for term in ('AB-', 'ab-', 'Ab-7'):
+            self.assertEqual(self.get_names(self.search(q=term)), [u'Сидоров'], term)
+
+    def test_search_name(self):
+        employee = self.employees[u'Иванов']
+        self.assertEqual(employee.search_name, u'иванов')
+        employee.name = u'Иванова-Петрова'
+        employee.save()
+        self.assertEqual(Employee.objects.get(pk=employee.pk).search_name, u'иванова-петрова')
+        self.assertEqual(self.get_names(self.search(q=u'ИВАНОВА-П')), [u'Иванова-Петрова'])
+
+    def test_widget_label(self):
+        # The employee read by validation labels the picker.
+        employee = self.employees[u'Петров']
+        form = PersonnelFilterForm({'employee': employee.pk})
+        self.assertTrue(form.is_valid())
+        with self.assertNumQueries(0):
+            html = unicode(form['employee'])
+        self.assertIn(u'value="Петров"', html)
+        with self.assertNumQueries(0):
+            html = unicode(PersonnelFilterForm(initial={'employee': employee})['employee'])
+        self.assertIn(u'value="Петров"', html)
+
+    def test_department(self):
+        data = self.search(q=u'бух', department=self.employees[u'Петров'].department_id)
+        self.assertEqual(self.get_names(data), [u'Бухаров', u'Петров'])
+
+    def test_pages(self):
+        names = []
+        params = {'q': u'бух'}
+        page_size = EmployeeSearchView.page_size
+        EmployeeSearchView.page_size = 2
+        try:
+            while True:
+                data = self.search(**params)
+                names.extend(self.get_names(data))
+                if data['next'] is None:
+                    break
+                params['after'] = data['next']
+        finally:
+            EmployeeSearchView.page_size = page_size
+        self.assertEqual(names, [u'Бухаров', u'Петров', u'Иванов'])
+
+
+@override_settings(ROOT_URLCONF='personnel.urls')
+class ReferenceCacheTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('accountant', password='secret')
+        self.position = Position.objects.create(
+            name=u'Бухгалтер', wages=Decimal('30000.00'), created_by=self.user, updated_by=self.user,
+        )
+        # A cache shared by processes.
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        shared = override_settings(
+            CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': directory,
+            }},
+            REFERENCE_CACHE_VERSION_TTL=60,
+        )
+        shared.enable()
+        self.addCleanup(shared.disable)
+
+    def get_wages(self):
+        return get_positions()[self.position.pk].wages
+
+    def test_cached(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get_wages(), Decimal('30000.00'))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_wages(), Decimal('30000.00'))
+        # Another process reads the shared cache.
+        reference_cache.local.discard_prefix('')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_wages(), Decimal('30000.00'))
+
+    def test_save(self):
+        self.get_wages()
+        self.position.wages = Decimal('35000.00')
+        self.position.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get_wages(), Decimal('35000.00'))
+
+    def test_delete(self):
+        self.get_wages()
+        pk = self.position.pk
+        self.position.delete()
+        with self.assertNumQueries(1):
+            self.assertNotIn(pk, get_positions())
+
+    def test_other_process(self):
+        # A change in another process is seen once the local version
+        # expires.
+        self.get_wages()
+        Position.objects.filter(pk=self.position.pk).update(wages=Decimal('35000.00'))
+        reference_cache.shared.incr(VERSION_KEY.format(model=get_model_label(Position)))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_wages(), Decimal('30000.00'))
+        with self.settings(REFERENCE_CACHE_VERSION_TTL=0):
+            reference_cache.versions.clear()
+            with self.assertNumQueries(1):
+                self.assertEqual(self.get_wages(), Decimal('35000.00'))
+
+    def test_local_memory(self):
+        # Not shared by processes: every lookup loads the value.
+        with self.settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            for i in range(2):
+                with self.assertNumQueries(1):
+                    self.assertEqual(self.get_wages(), Decimal('30000.00'))
+            self.assertFalse(reference_cache.get_stats()['enabled'])
+
+    def test_stats(self):
+        url = reverse('reference-cache-stats')
+        self.client.login(username='accountant', password='secret')
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.user.is_staff = True
+        self.user.save()
+        stats = reference_cache.get_stats()
+        self.position.save()
+        self.get_wages()
+        self.get_wages()
+        data = json.loads(self.client.get(url).content)
+        self.assertTrue(data['enabled'])
+        self.assertEqual(data['misses'], stats['misses'] + 1)
+        self.assertEqual(data['local_hits'], stats['local_hits'] + 1)
+        self.assertEqual(data['invalidations'], stats['invalidations'] + 1)
+
+
+@override_settings(ROOT_URLCONF='personnel.urls')
+class EmployeeRatesTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('accountant', password='secret')
+        audit = {'created_by': self.user, 'updated_by': self.user}
+        self.employee = Employee.objects.create(
+            name=u'Сотрудник',
+            department=Department.objects.create(name=u'Бухгалтерия', **audit),
+            position=Position.objects.create(name=u'Бухгалтер', wages=Decimal('30000.00'), **audit),
+            personnel_number='1',
+            permanent_bonus_amount=Decimal('0.00'),
+            hired=datetime.date(2010, 1, 1),
+            **audit
+        )
+        self.client.login(username='accountant', password='secret')
+
+    def get(self, etag=None):
+        headers = {} if etag is None else {'HTTP_IF_NONE_MATCH': etag}
+        return self.client.get(reverse('employee-rates'), {'employee': self.employee.pk}, **headers)
+
+    def test_etag(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertEqual(json.loads(response.content)['rates'][str(self.employee.pk)]['wages'], '30000.00')
+        self.assertIn('must-revalidate', response['Cache-Control'])
+        self.assertEqual(self.get()['ETag'], etag)
+
+        response = self.get(etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, '')
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.get('"other", {0}'.format(etag)).status_code, 304)
+        self.assertEqual(self.get('"other"').status_code, 200)
+
+    def test_changed(self):
+        etag = self.get()['ETag']
+        position = self.employee.position
+        position.wages = Decimal('35000.00')
+        position.save()
+        response = self.get(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(json.loads(response.content)['rates'][str(self.employee.pk)]['wages'], '35000.00')
+        self.assertEqual(self.get(response['ETag']).status_code, 304)
@@ -0,0 +1,18 @@
+from django.conf.urls import url
+
+from common.views import ReferenceCacheStatsView
+from personnel.views import (
+    EmployeeSearchView,
+    EmployeeRatesView,
+    PersonnelImportView,
+    BonusBulkCreateView,
+)
+
+
+urlpatterns = [
+    url(r'^employees/search/$', EmployeeSearchView.as_view(), name='employee-search'),
+    url(r'^employees/rates/$', EmployeeRatesView.as_view(), name='employee-rates'),
+    url(r'^import/$', PersonnelImportView.as_view(), name='personnel-import'),
+    url(r'^bonus/bulk/$', BonusBulkCreateView.as_view(), name='bonus-bulk-create'),
+    url(r'^cache/stats/$', ReferenceCacheStatsView.as_view(), name='reference-cache-stats'),
+]
@@ -1,9 +1,27 @@
 # coding:utf-8
+import calendar
+import datetime
+import hashlib
+from decimal import Decimal
+
 import simplejson as json
+from django.db.models import Q
+from django.http import (
+    HttpResponse,
+    HttpResponseNotModified,
+    HttpResponseRedirect,
+    JsonResponse,
+)
+from django.views.generic import View
+from django.views.generic.edit import FormView
 from django.views.generic.list import ListView
+from django.contrib import messages
 from django.contrib.messages.views import SuccessMessageMixin
-from django.core.urlresolvers import reverse_lazy
+from django.core.urlresolvers import reverse, reverse_lazy
+from django.db import transaction
 from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
 from django.utils.translation import ugettext as _
 
 from personnel.models import (
@@ -14,7 +32,9 @@ from personnel.models import (
     SickTime,
     Vacation,
     TWOPLACES,
+    get_search_name,
 )
+from common.signals import objects_imported
 from common.views import (
     AutoPopulatedCreateView,
     AutoPopulatedUpdateView,
@@ -23,20 +43,68 @@ from common.views import (
 from common.mixins import (
     LoginRequiredMixin,
     ActiveObjectsMixin,
+    KeysetPaginationMixin,
+)
+from personnel.importers import (
+    IMPORTERS,
+    ImportFileError,
+    read_rows,
 )
 from personnel.forms import (
     DepartmentForm,
     EmployeeForm,
     PositionForm,
     BonusCreateForm,
+    BonusBulkCreateForm,
     BonusUpdateForm,
     SickTimeCreateForm,
     SickTimeUpdateForm,
     VacationCreateForm,
     VacationUpdateForm,
+    PersonnelFilterForm,
+    PersonnelImportForm,
 )
 
 
+class PersonnelFilterMixin(KeysetPaginationMixin):
+    """
+    Keyset-paginated list of employee records filtered by employee,
+    department and month. Employees are joined in the same query.
+    """
+    filter_form_class = PersonnelFilterForm
+
+    def filter_month(self, queryset, month, year):
+        raise NotImplementedError('``filter_month()`` method is not implemented')
+
+    def get_queryset(self):
+        queryset = super(PersonnelFilterMixin, self).get_queryset().select_related('employee')
+        self.filter_form = self.filter_form_class(self.request.GET)
+        if self.filter_form.is_valid():
+            data = self.filter_form.cleaned_data
+            if data['employee']:
+                queryset = queryset.filter(employee=data['employee'])
+            if data['department']:
+                queryset = queryset.filter(employee__department=data['department'])
+            if data['month_year']:
+                queryset = self.filter_month(queryset, *data['month_year'])
+        return queryset
+
+    def get_context_data(self, **kwargs):
+        context = super(PersonnelFilterMixin, self).get_context_data(**kwargs)
+        context['filter_form'] = self.filter_form
+        return context
+
+
+class LeaveFilterMixin(PersonnelFilterMixin):
+    def filter_month(self, queryset, month, year):
+        _, days_in_month = calendar.monthrange(year, month)
+        return queryset.overlapping(
+            None,
+            datetime.date(year, month, 1),
+            datetime.date(year, month, days_in_month),
+        )
+
+
 class DepartmentListView(LoginRequiredMixin, ActiveObjectsMixin, ListView):
     model = Department
 
@@ -102,9 +170,114 @@ class EmployeeListView(LoginRequiredMixin, ActiveObjectsMixin, ListView):
         data = super(EmployeeListView, self).get_context_data(**kwargs)
         department = get_object_or_404(Department, pk=self.kwargs['department_id'])
         data['department'] = department
+        for employee in data['object_list']:
+            employee.get_position()
         return data
 
 
+class EmployeeSearchView(LoginRequiredMixin, KeysetPaginationMixin, View):
+    """
+    JSON search over active employees by the prefix of their name,
+    personnel number, position or department name. Pages are keyed by
+    primary key: ``next`` is the ``after`` value of the following page.
+
+    Each of ``search_fields`` is an indexed column searched by a query of
+    its own, so that its index serves the prefix search; the primary keys
+    of the page are merged from the pages of the columns. Names are matched
+    in their lower-cased ``search_name`` columns whatever the case of the
+    term, personnel numbers as typed or in either case.
+    """
+    page_size = 20
+    search_fields = (
+        'search_name',
+        'personnel_number',
+        'position__search_name',
+        'department__search_name',
+    )
+
+    def get_prefixes(self, field, term):
+        if field.endswith('search_name'):
+            return [get_search_name(term)]
+        return set([term, term.upper(), term.lower()])
+
+    def get_queryset(self):
+        queryset = Employee.objects.filter(active=True)
+        department_id = self.request.GET.get('department')
+        if department_id and department_id.isdigit():
+            queryset = queryset.filter(department_id=department_id)
+        term = self.request.GET.get('q', '').strip()
+        if term:
+            queryset = queryset.filter(pk__in=self.get_matching_pks(queryset, term))
+        return queryset.select_related('position', 'department')
+
+    def get_matching_pks(self, queryset, term):
+        """
+        Primary keys of the page of the employees of ``queryset`` with a
+        search field starting with ``term``.
+        """
+        queryset = queryset.order_by('-pk')
+        cursor = self.get_cursor()
+        if cursor is not None:
+            queryset = queryset.filter(pk__lt=cursor)
+        pks = set()
+        for field in self.search_fields:
+            query = Q()
+            for prefix in self.get_prefixes(field, term):
+                query |= Q(**{'{field}__startswith'.format(field=field): prefix})
+            pks.update(queryset.filter(query).values_list('pk', flat=True)[:self.page_size + 1])
+        return sorted(pks, reverse=True)[:self.page_size + 1]
+
+    def get(self, request, *args, **kwargs):
+        employees, next_cursor = self.paginate_keyset(self.get_queryset())
+        return JsonResponse({
+            'results': [
+                {
+                    'id': employee.pk,
+                    'name': employee.name,
+                    'personnel_number': employee.personnel_number,
+                    'position': employee.position.name,
+                    'department': employee.department.name,
+                    'text': u'{name} ({personnel_number}, {position})'.format(
+                        name=employee.name,
+                        personnel_number=employee.personnel_number,
+                        position=employee.position.name,
+                    ),
+                }
+                for employee in employees
+            ],
+            'next': next_cursor,
+        })
+
+
+class EmployeeRatesView(LoginRequiredMixin, View):
+    """
+    Wages, last two years wages and average daily earnings of the employees
+    given by ``employee`` query parameters, keyed by pk. The response carries
+    an ETag of its content so that clients revalidate instead of refetching.
+    """
+    def get_rates(self):
+        ids = [pk for pk in self.request.GET.getlist('employee') if pk.isdigit()]
+        rates = Employee.objects.filter(active=True, pk__in=ids).rates()
+        return {
+            pk: {
+                field: str(value.quantize(TWOPLACES))
+                for field, value in employee_rates.items()
+            }
+            for pk, employee_rates in rates.items()
+        }
+
+    def get(self, request, *args, **kwargs):
+        content = json.dumps({'rates': self.get_rates()}, sort_keys=True)
+        etag = hashlib.md5(content).hexdigest()
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(content, content_type='application/json')
+        response['ETag'] = quote_etag(etag)
+        patch_cache_control(response, private=True, max_age=0, must_revalidate=True)
+        return response
+
+
 class EmployeeCreateView(SuccessMessageMixin, LoginRequiredMixin, AutoPopulatedCreateView):
     model = Employee
     form_class = EmployeeForm
@@ -136,9 +309,12 @@ class EmployeeDeleteView(LoginRequiredMixin, SalarycalcDeleteView):
     success_message = _(u'Сотрудник удалён')
 
 
-class BonusListView(LoginRequiredMixin, ActiveObjectsMixin, ListView):
+class BonusListView(LoginRequiredMixin, ActiveObjectsMixin, PersonnelFilterMixin, ListView):
     model = Bonus
 
+    def filter_month(self, queryset, month, year):
+        return queryset.filter(month=month, year=year)
+
 
 class BonusCreateView(SuccessMessageMixin, LoginRequiredMixin, AutoPopulatedCreateView):
     model = Bonus
@@ -147,6 +323,59 @@ class BonusCreateView(SuccessMessageMixin, LoginRequiredMixin, AutoPopulatedCrea
     success_message = _(u'Премия создана')
 
 
+class BonusBulkCreateView(LoginRequiredMixin, FormView):
+    """
+    Give a percentage bonus to every employee of the chosen departments.
+    The first submission shows the totals by department; the bonuses are
+    created when the form is submitted again with ``confirm`` and the
+    token of the preview. A confirmation is refused if the bonuses changed
+    since the preview or if the employees already have bonuses for the
+    month.
+    """
+    form_class = BonusBulkCreateForm
+    template_name = 'personnel/bonus_bulk_form.html'
+    success_url = reverse_lazy('bonus-list')
+
+    def get_preview(self, form, bonuses):
+        departments = []
+        for bonus in bonuses:
+            department = bonus.employee.department
+            if not departments or departments[-1]['department'].pk != department.pk:
+                departments.append({'department': department, 'count': 0, 'amount': Decimal()})
+            departments[-1]['count'] += 1
+            departments[-1]['amount'] += bonus.amount
+        return {
+            'departments': departments,
+            'count': len(bonuses),
+            'amount': sum((bonus.amount for bonus in bonuses), Decimal()),
+            'token': form.get_token(bonuses),
+        }
+
+    def render_preview(self, form, bonuses):
+        return self.render_to_response(self.get_context_data(
+            form=form,
+            preview=self.get_preview(form, bonuses),
+        ))
+
+    def form_valid(self, form):
+        if 'confirm' not in self.request.POST:
+            bonuses = form.get_bonuses(self.request.user)
+            if not form.check_duplicates(bonuses):
+                return self.form_invalid(form)
+            return self.render_preview(form, bonuses)
+        with transaction.atomic():
+            bonuses = form.get_bonuses(self.request.user, lock=True)
+            if not form.check_duplicates(bonuses):
+                return self.form_invalid(form)
+            if form.get_token(bonuses) != self.request.POST.get('token'):
+                messages.warning(self.request, _(u'Данные изменились после расчёта, проверьте итоги ещё раз.'))
+                return self.render_preview(form, bonuses)
+            Bonus.objects.bulk_create(bonuses)
+            objects_imported.send(sender=Bonus, instances=bonuses)
+        messages.success(self.request, _(u'Создано премий: {count}').format(count=len(bonuses)))
+        return HttpResponseRedirect(self.get_success_url())
+
+
 class BonusUpdateView(SuccessMessageMixin, LoginRequiredMixin, AutoPopulatedUpdateView):
     model = Bonus
     form_class = BonusUpdateForm
@@ -165,7 +394,7 @@ class BonusDeleteView(LoginRequiredMixin, SalarycalcDeleteView):
     success_message = _(u'Премия удалена')
 
 
-class SickTimeListView(LoginRequiredMixin, ActiveObjectsMixin,  ListView):
+class SickTimeListView(LoginRequiredMixin, ActiveObjectsMixin, LeaveFilterMixin, ListView):
     model = SickTime
 
 
@@ -176,14 +405,6 @@ class SickTimeCreateView(SuccessMessageMixin, LoginRequiredMixin, AutoPopulatedC
     success_url = reverse_lazy('sicktime-list')
     success_message = _(u'Больничный создан')
 
-    def get_context_data(self, *args, **kwargs):
-        context = super(SickTimeCreateView, self).get_context_data(*args, **kwargs)
-        context['employees_last_two_years_wages'] = json.dumps({
-            employee.pk: str(employee.last_two_years_wages.quantize(TWOPLACES))
-            for employee in Employee.objects.filter(active=True)
-        })
-        return context
-
 
 class SickTimeUpdateView(SuccessMessageMixin, LoginRequiredMixin, AutoPopulatedUpdateView):
     model = SickTime
@@ -198,7 +419,7 @@ class SickTimeDeleteView(LoginRequiredMixin, SalarycalcDeleteView):
     success_message = _(u'Больничный удалён')
 
 
-class VacationListView(LoginRequiredMixin, ActiveObjectsMixin, ListView):
+class VacationListView(LoginRequiredMixin, ActiveObjectsMixin, LeaveFilterMixin, ListView):
     model = Vacation
 
 
@@ -209,14 +430,6 @@ class VacationCreateView(SuccessMessageMixin, LoginRequiredMixin, AutoPopulatedC
     success_url = reverse_lazy('vacation-list')
     success_message = _(u'Отпуск создан')
 
-    def get_context_data(self, *args, **kwargs):
-        context = super(VacationCreateView, self).get_context_data(*args, **kwargs)
-        context['employees_average_daily_earnings'] = json.dumps({
-            employee.pk: str(employee.average_daily_earnings.quantize(TWOPLACES))
-            for employee in Employee.objects.filter(active=True)
-        })
-        return context
-
 
 class VacationUpdateView(SuccessMessageMixin, LoginRequiredMixin, AutoPopulatedUpdateView):
     model = Vacation
@@ -229,3 +442,35 @@ class VacationDeleteView(LoginRequiredMixin, SalarycalcDeleteView):
     model = Vacation
     success_url = reverse_lazy('vacation-list')
     success_message = _(u'Отпуск удалён')
+
+
+class PersonnelImportView(LoginRequiredMixin, FormView):
+    form_class = PersonnelImportForm
+    template_name = 'personnel/import_form.html'
+    success_urls = {
+        'bonus': 'bonus-list',
+        'sicktime': 'sicktime-list',
+        'vacation': 'vacation-list',
+    }
+
+    def get_initial(self):
+        return {'kind': self.request.GET.get('kind')}
+
+    def form_valid(self, form):
+        kind = form.cleaned_data['kind']
+        upload = form.cleaned_data['file']
+        importer = dict(IMPORTERS)[kind](self.request.user, dry_run=form.cleaned_data['dry_run'])
+        try:
+            importer.run(read_rows(upload, upload.name))
+        except ImportFileError as error:
+            form.add_error('file', unicode(error))
+            return self.form_invalid(form)
+        if importer.errors:
+            return self.render_to_response(self.get_context_data(form=form, importer=importer))
+        if importer.dry_run:
+            messages.success(self.request, _(u'Ошибок не найдено, строк к загрузке: {count}').format(
+                count=importer.created,
+            ))
+            return self.render_to_response(self.get_context_data(form=form))
+        messages.success(self.request, _(u'Загружено записей: {count}').format(count=importer.created))
+        return HttpResponseRedirect(reverse(self.success_urls[kind]))
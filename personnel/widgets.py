@@ -0,0 +1,52 @@
+# coding:utf-8
+from django import forms
+from django.core.urlresolvers import reverse
+from django.utils.safestring import mark_safe
+
+from personnel.models import Employee
+
+
+class EmployeeSearchInput(forms.HiddenInput):
+    """
+    Employee picker completed from the employee search endpoint. The
+    selected primary key is kept in a hidden input, so the page renders in
+    constant time however many employees there are.
+    """
+
+    class Media:
+        css = {
+            'all': ('assets/css/employee-search.css',),
+        }
+        js = (
+            'assets/js/jquery-ui-1.9.2.custom.min.js',
+            'assets/js/employee-search.js',
+        )
+
+    # The selected employee, set by ``EmployeeChoiceField`` so that the
+    # label needs no query.
+    employee = None
+
+    def get_label(self, value):
+        if not value:
+            return u''
+        if self.employee is not None and unicode(self.employee.pk) == unicode(value):
+            return unicode(self.employee)
+        try:
+            return unicode(Employee.objects.get(pk=value))
+        except (Employee.DoesNotExist, ValueError):
+            return u''
+
+    def render(self, name, value, attrs=None):
+        attrs = dict(attrs or {})
+        hidden_attrs = {'id': attrs.pop('id', 'id_{name}'.format(name=name))}
+        attrs.update({
+            'data-role': 'employee-search',
+            'data-url': reverse('employee-search'),
+            'data-target': hidden_attrs['id'],
+            'autocomplete': 'off',
+        })
+        search = forms.TextInput(attrs=self.attrs).render(
+            u'{name}_search'.format(name=name), self.get_label(value), attrs,
+        )
+        hidden = super(EmployeeSearchInput, self).render(name, value, hidden_attrs)
+        return mark_safe(hidden + search)
@@ -0,0 +1,160 @@
+# coding: utf-8
+"""
+Computed payroll for machine consumers, as JSON or NDJSON records.
+"""
+from __future__ import absolute_import
+
+import hashlib
+import itertools
+
+import simplejson as json
+from django.db import connections
+from django.db.models import F
+
+from common.signals import (
+    object_changed,
+    objects_imported,
+)
+from common.utils import get_business_calendar
+from personnel.models import (
+    Bonus,
+    Department,
+    Employee,
+    Position,
+    SickTime,
+    Vacation,
+)
+from reports.exporters import iter_ndjson as iter_ndjson_lines
+from reports.ledger import get_month_range_filter
+from reports.models import (
+    PayrollLedger,
+    PayrollRevision,
+)
+from reports.payroll import get_month_bounds
+
+# Models the payroll is computed from; any change of them increments the
+# payroll revision.
+PAYROLL_MODELS = (
+    Department,
+    Position,
+    Employee,
+    Bonus,
+    SickTime,
+    Vacation,
+)
+
+
+def increment_payroll_revision(sender, **kwargs):
+    if not PayrollRevision.objects.filter(pk=1).update(value=F('value') + 1):
+        PayrollRevision.objects.get_or_create(pk=1)
+
+
+# The revision is incremented once per edit in a view or per imported
+# batch, like the ledger is invalidated, not by every saved row: the
+# revision row would serialize all writes otherwise.
+for model in PAYROLL_MODELS:
+    dispatch_uid = 'payroll-revision-{model}'.format(model=model._meta.model_name)
+    object_changed.connect(increment_payroll_revision, sender=model, dispatch_uid=dispatch_uid)
+    objects_imported.connect(increment_payroll_revision, sender=model, dispatch_uid=dispatch_uid)
+
+
+def get_payroll_version(departments, months):
+    """
+    Version of the payroll of the employees of ``departments`` over the
+    consecutive ``months``, in a single query: the payroll revision, the
+    latest ``updated_at`` of every row the computation reads and the number
+    of employees.
+
+    The revision changes with every edit or import of ``PAYROLL_MODELS``
+    announced by ``object_changed`` or ``objects_imported``, including a
+    bonus or leave moved out of the months or to another department, which
+    the filtered rows cannot show. The latest ``updated_at`` and the number
+    of employees also cover rows changed without signals, e.g. in the
+    admin or by ``QuerySet.update()``.
+    """
+    start_date = get_month_bounds(*months[0])[0]
+    end_date = get_month_bounds(*months[-1])[1]
+    employees = Employee.objects.filter(department__in=departments)
+    latest = (
+        employees,
+        Position.objects.filter(employee__in=employees),
+        Bonus.objects.filter(get_month_range_filter(start_date, end_date), employee__in=employees),
+        SickTime.objects.filter(employee__in=employees, start_date__lte=end_date, end_date__gte=start_date),
+        Vacation.objects.filter(employee__in=employees, start_date__lte=end_date, end_date__gte=start_date),
+    )
+    sql, params = PayrollRevision.objects.values('value').query.sql_with_params()
+    columns = ['(SELECT MAX(value) FROM ({sql}) revision)'.format(sql=sql)]
+    params = list(params)
+    for queryset in latest:
+        sql, sql_params = queryset.order_by().values('updated_at').query.sql_with_params()
+        columns.append('(SELECT MAX(updated_at) FROM ({sql}) latest)'.format(sql=sql))
+        params.extend(sql_params)
+    sql, sql_params = employees.order_by().values('pk').query.sql_with_params()
+    columns.append('(SELECT COUNT(*) FROM ({sql}) employees)'.format(sql=sql))
+    params.extend(sql_params)
+
+    with connections[employees.db].cursor() as cursor:
+        cursor.execute('SELECT {columns}'.format(columns=', '.join(columns)), params)
+        return cursor.fetchone()
+
+
+def get_payroll_etag(departments, months, output_format):
+    calendar = get_business_calendar()
+    key = (
+        output_format,
+        tuple(months),
+        tuple(sorted(department.pk for department in departments)),
+        get_payroll_version(departments, months),
+        tuple(calendar.get_month_mask(year, month) for year, month in months),
+    )
+    return hashlib.md5(repr(key)).hexdigest()
+
+
+def iter_payroll_records(snapshots):
+    """
+    Aggregated data of every employee of ``snapshots`` as dictionaries of
+    JSON values, amounts as strings.
+    """
+    for snapshot in snapshots:
+        for employee, aggregated_data in snapshot:
+            record = {
+                'employee': employee.pk,
+                'personnel_number': employee.personnel_number,
+                'name': employee.name,
+                'year': snapshot.year,
+                'month': snapshot.month,
+            }
+            for field in PayrollLedger.AGGREGATED_FIELDS:
+                value = aggregated_data[field]
+                record[field] = value if isinstance(value, (int, long)) else str(value)
+            yield record
+
+
+def iter_json(records):
+    yield '{"results": ['
+    separator = ''
+    for record in records:
+        yield separator + json.dumps(record, sort_keys=True)
+        separator = ', '
+    yield ']}'
+
+
+def iter_ndjson(records):
+    """
+    NDJSON of ``records``, which all have the same keys, written by the
+    report exporter with the keys sorted.
+    """
+    records = iter(records)
+    first = next(records, None)
+    if first is None:
+        return
+    header = sorted(first)
+    rows = ([record[key] for key in header] for record in itertools.chain([first], records))
+    for line in iter_ndjson_lines(header, rows):
+        yield line
+
+
+OUTPUT_FORMATS = {
+    'json': ('application/json', iter_json),
+    'ndjson': ('application/x-ndjson; charset=utf-8', iter_ndjson),
+}
@@ -0,0 +1,13 @@
+# coding:utf-8
+from __future__ import absolute_import
+
+from django.apps import AppConfig
+from django.utils.translation import ugettext_lazy as _
+
+
+class ReportsConfig(AppConfig):
+    name = 'reports'
+    verbose_name = _(u'отчеты')
+
+    def ready(self):
+        from reports import api, ledger  # noqa: connects the signal handlers
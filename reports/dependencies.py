@@ -0,0 +1,112 @@
+# coding: utf-8
+"""
+Dependencies of the payroll on the personnel data.
+
+A cell is the payroll of one employee for one month, a row of the payroll
+ledger. Every edited ``Bonus``, ``SickTime``, ``Vacation``, ``Employee`` or
+``Position`` row affects a set of cells, given as ``AffectedCells``: the
+``employees`` (ids or a queryset) over the months from ``start_date`` to
+``end_date``, all months if they are ``None``. Only these cells are
+invalidated and recomputed, the rest of the ledger is kept.
+
+Comparing a row before and after an update leaves out edits that cannot
+change the payroll, such as a renamed employee or a new bonus description.
+"""
+from __future__ import absolute_import
+
+from collections import namedtuple
+
+from personnel.models import (
+    Bonus,
+    Employee,
+    Position,
+    SickTime,
+    Vacation,
+)
+from reports.payroll import get_month_bounds
+
+AffectedCells = namedtuple('AffectedCells', ('employees', 'start_date', 'end_date'))
+
+# Fields the payroll of a cell is computed from, by model.
+PAYROLL_FIELDS = {
+    Bonus: ('employee_id', 'year', 'month', 'amount', 'active'),
+    SickTime: ('employee_id', 'start_date', 'end_date', 'last_two_years_wages', 'active'),
+    Vacation: ('employee_id', 'start_date', 'end_date', 'average_daily_earnings', 'active'),
+    Employee: ('position_id', 'permanent_bonus_amount', 'insurance_experience', 'hired'),
+    Position: ('wages',),
+}
+
+
+def get_cells(instance):
+    """
+    Cells depending on ``instance`` in its current state.
+    """
+    if isinstance(instance, Bonus):
+        return AffectedCells([instance.employee_id], *get_month_bounds(instance.year, instance.month))
+    if isinstance(instance, (SickTime, Vacation)):
+        return AffectedCells([instance.employee_id], instance.start_date, instance.end_date)
+    if isinstance(instance, Employee):
+        return AffectedCells([instance.pk], None, None)
+    if isinstance(instance, Position):
+        # Wages fan out to every employee holding the position.
+        return AffectedCells(Employee.objects.filter(position_id=instance.pk), None, None)
+    return None
+
+
+def get_changed_fields(instance, previous):
+    return [
+        field for field in PAYROLL_FIELDS[type(instance)]
+        if getattr(instance, field) != getattr(previous, field)
+    ]
+
+
+def get_affected_cells(instance, previous=None):
+    """
+    Cells to recompute after ``instance`` has been saved. ``previous`` is
+    its state before an update; without it every cell depending on
+    ``instance`` is affected.
+    """
+    if type(instance) not in PAYROLL_FIELDS:
+        return []
+    if previous is None:
+        return [get_cells(instance)]
+    changed_fields = get_changed_fields(instance, previous)
+    if not changed_fields:
+        return []
+    if changed_fields == ['hired']:
+        # Only the months between the old and the new hire dates change.
+        return [AffectedCells(
+            [instance.pk],
+            min(instance.hired, previous.hired),
+            max(instance.hired, previous.hired),
+        )]
+    cells = [get_cells(previous), get_cells(instance)]
+    if cells[0] == cells[1]:
+        return cells[:1]
+    return cells
+
+
+def get_imported_cells(model, instances):
+    """
+    Cells affected by a batch of imported ``instances`` of ``model``.
+    Bonuses affect their months; leaves are merged into a single range
+    over the batch employees, so that the batch is invalidated in one
+    query.
+    """
+    if not instances:
+        return []
+    if issubclass(model, Bonus):
+        employees = {}
+        for instance in instances:
+            employees.setdefault((instance.year, instance.month), set()).add(instance.employee_id)
+        return [
+            AffectedCells(month_employees, *get_month_bounds(year, month))
+            for (year, month), month_employees in sorted(employees.items())
+        ]
+    if issubclass(model, (SickTime, Vacation)):
+        return [AffectedCells(
+            set(instance.employee_id for instance in instances),
+            min(instance.start_date for instance in instances),
+            max(instance.end_date for instance in instances),
+        )]
+    return [cells for cells in map(get_cells, instances) if cells is not None]
@@ -0,0 +1,93 @@
+# coding: utf-8
+"""
+CSV and NDJSON output of reports for machine consumers.
+
+Reports are written row by row from ``Report.iter_rows()`` and the output is
+produced by generators, so it can be streamed while the rows are computed
+and memory does not depend on the number of rows.
+"""
+from __future__ import absolute_import
+
+import codecs
+import csv
+import itertools
+from collections import OrderedDict
+from decimal import Decimal
+
+import simplejson as json
+
+CSV_DELIMITER = ';'
+CHUNK_ROWS = 500
+
+
+class Echo(object):
+    """
+    File-like object that returns what is written, lets ``csv.writer``
+    format a single row.
+    """
+
+    def write(self, value):
+        return value
+
+
+def encode_value(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return str(value)
+
+
+def iter_csv(header, rows):
+    """
+    CSV in UTF-8 with a byte order mark, which spreadsheet applications need
+    to read the Cyrillic headers, and ``;`` as the delimiter.
+    """
+    writer = csv.writer(Echo(), delimiter=CSV_DELIMITER)
+    yield codecs.BOM_UTF8 + writer.writerow([encode_value(title) for title in header])
+    for row in rows:
+        yield writer.writerow([encode_value(value) for value in row])
+
+
+def json_value(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def iter_ndjson(header, rows):
+    """
+    A JSON object per row keyed by the column titles, amounts as strings.
+    """
+    for row in rows:
+        record = OrderedDict(zip(header, (json_value(value) for value in row)))
+        yield json.dumps(record, ensure_ascii=False).encode('utf-8') + '\n'
+
+
+def iter_chunks(lines, size=CHUNK_ROWS):
+    """
+    Join ``lines`` into chunks of ``size`` lines. The first line is sent on
+    its own so the response starts before the report is computed.
+    """
+    lines = iter(lines)
+    for line in itertools.islice(lines, 1):
+        yield line
+    while True:
+        chunk = ''.join(itertools.islice(lines, size))
+        if not chunk:
+            break
+        yield chunk
+
+
+# (content type, file extension, writer)
+EXPORT_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv', iter_csv),
+    'ndjson': ('application/x-ndjson; charset=utf-8', 'ndjson', iter_ndjson),
+}
+
+
+def export_report(report, output_format):
+    """
+    Iterate over the content of ``report`` in ``output_format``, one of
+    ``EXPORT_FORMATS``.
+    """
+    content_type, extension, writer = EXPORT_FORMATS[output_format]
+    return iter_chunks(writer(report.get_header(), report.iter_rows()))
@@ -1,7 +1,11 @@
 # coding: utf-8
+from datetime import datetime
+
 from django import forms
+from django.core.exceptions import ValidationError
 from django.utils.translation import ugettext as _
 
+from common.forms import use_cached_choices
 from common.mixins import CleanMonthYearMixin
 from personnel.models import Department
 
@@ -30,6 +34,16 @@ class ReportForm(CleanMonthYearMixin, forms.Form):
         }, format=('%m/%Y')),
         label=_(u'За месяц'),
     )
+    format = forms.ChoiceField(
+        choices=(
+            ('xlsx', _(u'Excel (XLSX)')),
+            ('csv', 'CSV'),
+            ('ndjson', 'NDJSON'),
+        ),
+        initial='xlsx',
+        required=False,
+        label=_(u'Формат'),
+    )
 
     class Media:
         css = {
@@ -47,3 +61,110 @@ class ReportForm(CleanMonthYearMixin, forms.Form):
     def __init__(self, *args, **kwargs):
         super(ReportForm, self).__init__(*args, **kwargs)
         self.fields['departments'].help_text = _(u'Выберете один или несколько отделов')
+        use_cached_choices(self.fields['departments'], 'active')
+
+    def clean_format(self):
+        return self.cleaned_data['format'] or 'xlsx'
+
+
+class RangeReportForm(ReportForm):
+    PERIOD_QUARTER = 'quarter'
+    PERIOD_YEAR = 'year'
+    PERIOD_CUSTOM = 'custom'
+    PERIOD_CHOICES = (
+        (PERIOD_QUARTER, _(u'Квартал')),
+        (PERIOD_YEAR, _(u'Год')),
+        (PERIOD_CUSTOM, _(u'Произвольный период')),
+    )
+    MAX_MONTHS = 36
+
+    period = forms.ChoiceField(
+        choices=PERIOD_CHOICES,
+        label=_(u'Период'),
+        help_text=_(u'Квартал или год, в который входит начальный месяц, либо период '
+            u'от начального до конечного месяца.'),
+    )
+    end_month_year = forms.CharField(
+        widget=forms.DateInput(attrs={
+                'data-provide': 'datepicker',
+                'data-date-format': 'mm/yyyy',
+                'data-date-language': 'ru',
+                'data-date-min-view-mode': 'months',
+        }, format=('%m/%Y')),
+        required=False,
+        label=_(u'По месяц'),
+    )
+
+    def __init__(self, *args, **kwargs):
+        super(RangeReportForm, self).__init__(*args, **kwargs)
+        self.fields['month_year'].label = _(u'С месяца')
+
+    def clean_end_month_year(self):
+        if not self.cleaned_data.get('end_month_year'):
+            return None
+        try:
+            value = datetime.strptime(
+                self.cleaned_data['end_month_year'],
+                self.fields['end_month_year'].widget.format
+            )
+        except ValueError:
+            raise ValidationError(
+                _(u'Неверный формат: данные должны соответствовать формату "ММ/ГГГГ"'),
+            )
+        return (value.month, value.year)
+
+    def clean(self):
+        data = super(RangeReportForm, self).clean()
+        if not data.get('month_year') or not data.get('period'):
+            return data
+        month, year = data['month_year']
+        if data['period'] == self.PERIOD_QUARTER:
+            month = month - (month - 1) % 3
+            data['month_year'] = (month, year)
+            data['end_month_year'] = (month + 2, year)
+        elif data['period'] == self.PERIOD_YEAR:
+            data['month_year'] = (1, year)
+            data['end_month_year'] = (12, year)
+        elif not data.get('end_month_year'):
+            self.add_error('end_month_year', ValidationError(_(u'Укажите конечный месяц периода.')))
+        else:
+            end_month, end_year = data['end_month_year']
+            months_count = (end_year - year) * 12 + end_month - month + 1
+            if months_count < 1:
+                self.add_error('end_month_year', ValidationError(
+                    _(u'Конечный месяц должен быть не раньше начального.')
+                ))
+            elif months_count > self.MAX_MONTHS:
+                self.add_error('end_month_year', ValidationError(
+                    _(u'Период не может быть длиннее {count} месяцев.').format(count=self.MAX_MONTHS)
+                ))
+        return data
+
+
+class PayrollApiForm(RangeReportForm):
+    """
+    Query parameters of the payroll API: a single month, or a quarter, a
+    year or a custom period if ``period`` is given.
+    """
+    FORMAT_JSON = 'json'
+    FORMAT_NDJSON = 'ndjson'
+    FORMAT_CHOICES = (
+        (FORMAT_JSON, 'JSON'),
+        (FORMAT_NDJSON, 'NDJSON'),
+    )
+
+    format = forms.ChoiceField(choices=FORMAT_CHOICES, required=False)
+
+    def __init__(self, *args, **kwargs):
+        super(PayrollApiForm, self).__init__(*args, **kwargs)
+        self.fields['period'].required = False
+
+    def clean_format(self):
+        return self.cleaned_data['format'] or self.FORMAT_JSON
+
+    def clean(self):
+        if not self.cleaned_data.get('period'):
+            self.cleaned_data['period'] = self.PERIOD_CUSTOM
+            if not self.cleaned_data.get('end_month_year'):
+                self.cleaned_data['end_month_year'] = self.cleaned_data.get('month_year')
+        return super(PayrollApiForm, self).clean()
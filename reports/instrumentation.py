@@ -0,0 +1,192 @@
+# coding: utf-8
+from __future__ import absolute_import
+
+import cProfile
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.utils import CursorWrapper
+
+logger = logging.getLogger('reports')
+
+_local = threading.local()
+
+CURSOR_FACTORIES = ('make_cursor', 'make_debug_cursor')
+
+
+class CountingCursorWrapper(CursorWrapper):
+    """
+    Cursor adding the number and the duration of the queries it executes
+    to ``instrumentation``. The SQL is not kept.
+    """
+
+    def __init__(self, cursor, db, instrumentation):
+        super(CountingCursorWrapper, self).__init__(cursor, db)
+        self.instrumentation = instrumentation
+
+    def execute(self, sql, params=None):
+        started = time.time()
+        try:
+            return super(CountingCursorWrapper, self).execute(sql, params)
+        finally:
+            self.instrumentation.add_query(time.time() - started)
+
+    def executemany(self, sql, param_list):
+        started = time.time()
+        try:
+            return super(CountingCursorWrapper, self).executemany(sql, param_list)
+        finally:
+            self.instrumentation.add_query(time.time() - started)
+
+
+class ReportInstrumentation(object):
+    """
+    Records the number and duration of SQL queries, the time spent in each
+    report phase and the output size while it is active. Phases are
+    exclusive: time spent in a nested phase is not counted in the outer one.
+    With ``profile`` set the whole block is also run under cProfile and the
+    stats are dumped to ``REPORT_PROFILE_DIR``.
+
+    Queries are counted by wrapping the cursors of the default connection
+    of the current thread.
+    """
+
+    def __init__(self, name, profile=False):
+        self.name = name
+        self.profile = profile
+        self.phases = OrderedDict()
+        self.stack = []
+        self.phase_started = None
+        self.output_size = None
+        self.profile_path = None
+        self.total_time = None
+        self.query_count = 0
+        self.query_time = 0.0
+
+    def __enter__(self):
+        self.previous = getattr(_local, 'instrumentation', None)
+        _local.instrumentation = self
+        self.db = connections[DEFAULT_DB_ALIAS]
+        self.cursor_factories = dict((name, self.db.__dict__.get(name)) for name in CURSOR_FACTORIES)
+        for name in CURSOR_FACTORIES:
+            setattr(self.db, name, self.wrap_cursor_factory(getattr(self.db, name)))
+        if self.profile:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        self.started = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.total_time = time.time() - self.started
+        if self.profile:
+            self.profiler.disable()
+            handle, self.profile_path = tempfile.mkstemp(
+                prefix='report-', suffix='.prof',
+                dir=getattr(settings, 'REPORT_PROFILE_DIR', None),
+            )
+            os.close(handle)
+            self.profiler.dump_stats(self.profile_path)
+        for name, factory in self.cursor_factories.items():
+            if factory is None:
+                delattr(self.db, name)
+            else:
+                setattr(self.db, name, factory)
+        _local.instrumentation = self.previous
+
+    def wrap_cursor_factory(self, factory):
+        def make_cursor(cursor):
+            return CountingCursorWrapper(factory(cursor), self.db, self)
+        return make_cursor
+
+    def add_query(self, elapsed):
+        self.query_count += 1
+        self.query_time += elapsed
+
+    def add_time(self, name, elapsed):
+        self.phases[name] = self.phases.get(name, 0.0) + elapsed
+
+    def enter_phase(self, name):
+        now = time.time()
+        if self.stack:
+            self.add_time(self.stack[-1], now - self.phase_started)
+        self.stack.append(name)
+        self.phase_started = now
+
+    def exit_phase(self):
+        now = time.time()
+        self.add_time(self.stack.pop(), now - self.phase_started)
+        self.phase_started = now
+
+    def get_data(self):
+        return OrderedDict((
+            ('report', self.name),
+            ('queries', self.query_count),
+            ('query_time', round(self.query_time, 4)),
+            ('total_time', round(self.total_time, 4)),
+            ('phases', OrderedDict(
+                (name, round(elapsed, 4)) for name, elapsed in self.phases.items()
+            )),
+            ('output_size', self.output_size),
+            ('profile', self.profile_path),
+        ))
+
+    def annotate_response(self, response):
+        return annotate_response(response, self.get_data())
+
+    def log(self):
+        logger.info('report %s', json.dumps(self.get_data()))
+
+
+def annotate_response(response, data):
+    """
+    Add the metrics ``data`` of ``ReportInstrumentation.get_data()`` to the
+    headers of ``response``.
+    """
+    timings = [('db', data['query_time'])] + data['phases'].items() + [('total', data['total_time'])]
+    response['Server-Timing'] = ', '.join(
+        '{name};dur={duration:.1f}'.format(name=name, duration=elapsed * 1000)
+        for name, elapsed in timings
+    )
+    response['X-Report-Queries'] = data['queries']
+    if data['output_size'] is not None:
+        response['X-Report-Size'] = data['output_size']
+    if data['profile']:
+        response['X-Report-Profile'] = os.path.basename(data['profile'])
+    return response
+
+
+def instrument_stream(instrumentation, content):
+    """
+    Iterate over the chunks of ``content`` under ``instrumentation`` and log
+    the metrics once it is exhausted; for streamed responses, whose headers
+    are sent before the content is computed.
+    """
+    output_size = 0
+    with instrumentation:
+        for chunk in content:
+            output_size += len(chunk)
+            yield chunk
+    instrumentation.output_size = output_size
+    instrumentation.log()
+
+
+@contextmanager
+def phase(name):
+    """Attribute the time spent in the block to ``name``, if instrumented."""
+    instrumentation = getattr(_local, 'instrumentation', None)
+    if instrumentation is None:
+        yield
+        return
+    instrumentation.enter_phase(name)
+    try:
+        yield
+    finally:
+        instrumentation.exit_phase()
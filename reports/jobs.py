@@ -0,0 +1,194 @@
+# coding: utf-8
+from __future__ import absolute_import
+
+import datetime
+import hashlib
+import json
+import traceback
+
+from django.conf import settings
+from django.core.files import File
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.translation import ugettext as _
+
+from common.cache import get_establishment
+from reports.instrumentation import ReportInstrumentation
+from reports.models import ReportJob
+from reports.reports import (
+    SummaryReport,
+    SickReport,
+    VacationReport,
+    BonusReport,
+    ReportPack,
+    RangeReport,
+)
+
+REPORT_TYPES = {
+    'summary': (SummaryReport, 'summary.xlsx'),
+    'sick': (SickReport, 'sick.xlsx'),
+    'vacation': (VacationReport, 'vacation.xlsx'),
+    'bonus': (BonusReport, 'bonus.xlsx'),
+    'pack': (ReportPack, 'reports.xlsx'),
+    'range': (RangeReport, 'range.xlsx'),
+}
+
+
+
+def get_departments_key(departments):
+    return ','.join(str(pk) for pk in sorted(department.pk for department in departments))
+
+
+def get_active_key(report_type, month, year, end_month, end_year, departments_key, user, profile):
+    return hashlib.md5(repr((
+        report_type, month, year, end_month, end_year, departments_key, user.pk, profile,
+    ))).hexdigest()
+
+
+def enqueue_report(report_type, month_year, departments, user, end_month_year=None, profile=False):
+    """
+    Return a pending or running job for the report, creating one only if no
+    identical request of ``user`` is already waiting in the queue.
+    ``end_month_year`` is the last month of range reports; ``profile`` runs
+    the job under cProfile.
+
+    Concurrent identical requests are serialized by the unique
+    ``active_key`` of the job: the request losing the race gets the job of
+    the other one.
+    """
+    month, year = month_year
+    end_month, end_year = end_month_year or (None, None)
+    departments_key = get_departments_key(departments)
+    active_key = get_active_key(report_type, month, year, end_month, end_year, departments_key, user, profile)
+    job = ReportJob.objects.filter(active_key=active_key).first()
+    if job is None:
+        try:
+            with transaction.atomic():
+                job = ReportJob.objects.create(
+                    report_type=report_type,
+                    month=month,
+                    year=year,
+                    end_month=end_month,
+                    end_year=end_year,
+                    departments_key=departments_key,
+                    created_by=user,
+                    active_key=active_key,
+                    profile=profile,
+                )
+                job.departments = departments
+        except IntegrityError:
+            # An identical request has created the job meanwhile.
+            job = ReportJob.objects.get(active_key=active_key)
+    return job
+
+
+def recover_stale_jobs():
+    """
+    Requeue the jobs running for longer than ``REPORT_JOB_TIMEOUT`` seconds,
+    whose worker has most likely died; fail them once they have been
+    started ``REPORT_JOB_MAX_ATTEMPTS`` times.
+    """
+    now = timezone.now()
+    stale = ReportJob.objects.filter(
+        status=ReportJob.STATUS_RUNNING,
+        started_at__lt=now - datetime.timedelta(seconds=getattr(settings, 'REPORT_JOB_TIMEOUT', 3600)),
+    )
+    stale.filter(
+        attempts__lt=getattr(settings, 'REPORT_JOB_MAX_ATTEMPTS', 3),
+    ).update(status=ReportJob.STATUS_PENDING, started_at=None)
+    stale.update(
+        status=ReportJob.STATUS_FAILED,
+        active_key=None,
+        finished_at=now,
+        error=_(u'Превышено время формирования отчета.'),
+    )
+
+
+def delete_expired_jobs():
+    """
+    Delete the jobs finished more than ``REPORT_JOB_EXPIRY`` seconds ago
+    together with their files; return the number of deleted jobs.
+    """
+    expired = list(ReportJob.objects.filter(
+        status__in=(ReportJob.STATUS_DONE, ReportJob.STATUS_FAILED),
+        finished_at__lt=timezone.now() - datetime.timedelta(
+            seconds=getattr(settings, 'REPORT_JOB_EXPIRY', 7 * 24 * 3600),
+        ),
+    ).values_list('pk', 'file'))
+    storage = ReportJob._meta.get_field('file').storage
+    for pk, name in expired:
+        if name:
+            storage.delete(name)
+    ReportJob.objects.filter(pk__in=[pk for pk, name in expired]).delete()
+    return len(expired)
+
+
+def claim_next_job():
+    """
+    Mark the oldest pending job as running and return it. The status update
+    is conditional, so concurrent workers never pick the same job. Stale
+    jobs are recovered first, see ``recover_stale_jobs()``.
+    """
+    recover_stale_jobs()
+    for pk in ReportJob.objects.filter(
+        status=ReportJob.STATUS_PENDING,
+    ).order_by('pk').values_list('pk', flat=True)[:10]:
+        claimed = ReportJob.objects.filter(
+            pk=pk,
+            status=ReportJob.STATUS_PENDING,
+        ).update(status=ReportJob.STATUS_RUNNING, started_at=timezone.now(), attempts=F('attempts') + 1)
+        if claimed:
+            return ReportJob.objects.get(pk=pk)
+    return None
+
+
+def run_job(job):
+    report_class, filename = REPORT_TYPES[job.report_type]
+    report = report_class(
+        establishment=get_establishment(),
+        context={
+            'month_year': (job.month, job.year),
+            'end_month_year': (job.end_month, job.end_year) if job.end_month else None,
+            'departments': list(job.departments.all()),
+        },
+    )
+    instrumentation = ReportInstrumentation(job.report_type, profile=job.profile)
+    try:
+        with instrumentation:
+            output = report.get_file()
+        try:
+            job.file.save(filename, File(output), save=False)
+        finally:
+            output.close()
+    except Exception:
+        job.status = ReportJob.STATUS_FAILED
+        job.error = traceback.format_exc()
+    else:
+        job.status = ReportJob.STATUS_DONE
+        instrumentation.output_size = job.file.size
+    if instrumentation.total_time is not None:
+        job.metrics = json.dumps(instrumentation.get_data())
+        instrumentation.log()
+    job.active_key = None
+    job.finished_at = timezone.now()
+    # A job requeued as stale may have been claimed again meanwhile: the
+    # number of attempts identifies the run, and the result of an older
+    # run is dropped instead of overwriting the newer one.
+    finished = ReportJob.objects.filter(
+        pk=job.pk,
+        attempts=job.attempts,
+        status__in=(ReportJob.STATUS_PENDING, ReportJob.STATUS_RUNNING),
+    ).update(
+        status=job.status,
+        file=job.file.name,
+        error=job.error,
+        metrics=job.metrics,
+        active_key=None,
+        finished_at=job.finished_at,
+    )
+    if not finished:
+        if job.file:
+            job.file.delete(save=False)
+        return ReportJob.objects.get(pk=job.pk)
+    return job
@@ -0,0 +1,186 @@
+# coding: utf-8
+"""
+Payroll arithmetic in integer kopecks.
+
+Money is kept as integers: every amount is an exact fraction of kopecks
+with a numerator and a known denominator, and is rounded once, half to
+even, when it is reported. The rounding rules are:
+
+* salary for worked days is ``wages / days in month * worked calendar
+  days``;
+* a sick leave day costs ``clamp(last_two_years_wages / 730) * insurance
+  ratio``, a vacation day costs the average daily earnings;
+* taxes are 13% of the exact amounts, amounts minus tax are exact as well;
+* each reported value is rounded to the kopeck, half to even.
+
+The Decimal backend is the reference. It computes the same formulas with
+28 significant digits, so its results are within far less than a kopeck
+of the exact ones and round the same way, except when the exact amount is
+a tie: a salary of 1000.01 for 15 days out of 30 is exactly 500.005, while
+adding the Decimal rate 33.3336...67 day by day gives 500.0050...04, hence
+500.01. Only the salary and sick leave amounts, and the totals including
+them, are inexact in the reference; when one of them is a tie the employee
+month is computed by the reference backend (see the
+``compare_payroll_backends`` command).
+"""
+from __future__ import absolute_import
+
+from decimal import Decimal
+
+from common.utils import business_days_count
+from personnel.models import (
+    ABSTRACT_RATIO,
+    INSURANCE_RATIO,
+    MINIMAL_DAILY_WAGES,
+    MAXIMUM_DAILY_WAGES,
+    SickTime,
+)
+from reports.payroll import (
+    INCOME_TAX,
+    calculate_payroll as calculate_reference_payroll,
+    clip_interval,
+    days_count,
+    get_month_bounds,
+    subtract_intervals,
+)
+
+# Leave day rates are fractions of a kopeck with this denominator.
+LEAVE_DENOMINATOR = int(ABSTRACT_RATIO) * 100
+TAX_PERCENT = int(INCOME_TAX * 100)
+
+
+def to_kopecks(value):
+    text = str(value)
+    if text[-3:-2] == '.':
+        # Two decimal places, as the money fields are stored.
+        return int(text[:-3] + text[-2:])
+    return int(value.scaleb(2))
+
+
+def from_kopecks(kopecks):
+    sign = '-' if kopecks < 0 else ''
+    return Decimal('{0}{1}.{2:02d}'.format(sign, *divmod(abs(kopecks), 100)))
+
+
+def round_half_even(numerator, denominator):
+    quotient, remainder = divmod(numerator, denominator)
+    if remainder * 2 > denominator or (remainder * 2 == denominator and quotient % 2):
+        quotient += 1
+    return quotient
+
+
+def is_tie(numerator, denominator):
+    """
+    Whether ``numerator / denominator`` lies exactly halfway between two
+    integers.
+    """
+    return numerator % denominator * 2 == denominator
+
+
+MINIMAL_DAILY_KOPECKS = to_kopecks(MINIMAL_DAILY_WAGES)
+MAXIMUM_DAILY_KOPECKS = to_kopecks(MAXIMUM_DAILY_WAGES)
+INSURANCE_PERCENT = {
+    experience: int(ratio * 100) for experience, ratio in INSURANCE_RATIO.items()
+}
+
+
+def get_day_rate(leave):
+    """
+    Day rate of ``leave`` as a numerator over ``LEAVE_DENOMINATOR`` kopecks.
+    """
+    if isinstance(leave, SickTime):
+        wages = to_kopecks(leave.last_two_years_wages)
+        ratio = int(ABSTRACT_RATIO)
+        wages = min(max(wages, MINIMAL_DAILY_KOPECKS * ratio), MAXIMUM_DAILY_KOPECKS * ratio)
+        return wages * INSURANCE_PERCENT[leave.employee.insurance_experience]
+    return to_kopecks(leave.day_rate) * LEAVE_DENOMINATOR
+
+
+def allocate_leave(leaves, period_start, period_end, covered):
+    """
+    Same as ``reports.payroll.allocate_leave()``, the payments are returned
+    as a numerator over ``LEAVE_DENOMINATOR`` kopecks.
+    """
+    leave_days_count = 0
+    payments = 0
+    for leave in sorted(leaves, key=lambda item: item.pk):
+        interval = clip_interval(leave.start_date, leave.end_date, period_start, period_end)
+        if interval is None:
+            continue
+        count = sum(days_count(part) for part in subtract_intervals(interval, covered))
+        if count:
+            leave_days_count += count
+            payments += get_day_rate(leave) * count
+        covered.append(interval)
+    return leave_days_count, payments
+
+
+def calculate_payroll(employee, year, month, sicktimes, vacations, bonus_payments):
+    """
+    Integer counterpart of ``reports.payroll.calculate_payroll()``, returns
+    the same values.
+    """
+    month_start, end_date = get_month_bounds(year, month)
+    days_in_month_count = end_date.day
+    start_date = max(month_start, employee.hired)
+
+    covered = []
+    sicktime_days_count, sicktime_payments = allocate_leave(sicktimes, start_date, end_date, covered)
+    vacation_days_count, vacation_payments = allocate_leave(vacations, start_date, end_date, covered)
+
+    worked_days_count = 0
+    worked_calendar_days_count = 0
+    if start_date <= end_date:
+        for part in subtract_intervals((start_date, end_date), covered):
+            worked_days_count += business_days_count(*part)
+            worked_calendar_days_count += days_count(part)
+    wages = to_kopecks(employee.permanent_bonus_amount) + to_kopecks(employee.position.wages)
+    bonus_payments = to_kopecks(bonus_payments)
+
+    # Every amount below is numerator / denominator kopecks.
+    leave = LEAVE_DENOMINATOR
+    total = leave * days_in_month_count
+    total_payments = (
+        wages * worked_calendar_days_count * leave +
+        (vacation_payments + sicktime_payments) * days_in_month_count +
+        bonus_payments * total
+    )
+    inexact = (
+        (wages * worked_calendar_days_count, days_in_month_count),
+        (sicktime_payments, leave),
+        (total_payments, total),
+    )
+    for numerator, denominator in inexact:
+        if any(is_tie(numerator * percent, denominator * 100) for percent in (100, TAX_PERCENT, 100 - TAX_PERCENT)):
+            return calculate_reference_payroll(
+                employee, year, month, sicktimes, vacations, from_kopecks(bonus_payments)
+            )
+
+    def amount(numerator, denominator):
+        return from_kopecks(round_half_even(numerator, denominator))
+
+    def tax(numerator, denominator):
+        return from_kopecks(round_half_even(numerator * TAX_PERCENT, denominator * 100))
+
+    def minus_tax(numerator, denominator):
+        return from_kopecks(round_half_even(numerator * (100 - TAX_PERCENT), denominator * 100))
+
+    return {
+        'business_days_count': business_days_count(month_start, end_date),
+        'worked_days_count': worked_days_count,
+        'worked_days_payments': amount(wages * worked_calendar_days_count, days_in_month_count),
+        'vacation_days_count': vacation_days_count,
+        'vacation_payments': amount(vacation_payments, leave),
+        'vacation_tax': tax(vacation_payments, leave),
+        'vacation_payments_minus_tax': minus_tax(vacation_payments, leave),
+        'sicktime_days_count': sicktime_days_count,
+        'sicktime_payments': amount(sicktime_payments, leave),
+        'sicktime_tax': tax(sicktime_payments, leave),
+        'sicktime_payments_minus_tax': minus_tax(sicktime_payments, leave),
+        'total_payments': amount(total_payments, total),
+        'total_tax': tax(total_payments, total),
+        'total_payments_minus_tax': minus_tax(total_payments, total),
+        'bonus_payments': from_kopecks(bonus_payments),
+        'bonus_tax': tax(bonus_payments, 1),
+        'bonus_payments_minus_tax': minus_tax(bonus_payments, 1),
+    }
@@ -0,0 +1,143 @@
+# coding: utf-8
+from __future__ import absolute_import
+
+import itertools
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.dispatch import receiver
+
+from common.signals import object_changed, objects_imported
+from common.utils import get_business_calendar
+from personnel.models import Employee
+from reports.dependencies import (
+    get_affected_cells,
+    get_imported_cells,
+)
+from reports.models import PayrollLedger
+from reports.payroll import get_month_bounds
+from reports.snapshot import PayrollSnapshot
+
+# Up to this many employees missing from the ledger, the raw data is only
+# loaded for them, by primary key; below the parameter limit of SQLite.
+SELECTIVE_LOAD_LIMIT = 500
+
+
+def load_payroll(queryset, year, month, backend=None):
+    """
+    Return a ``PayrollSnapshot`` for the employees of ``queryset`` backed by
+    the payroll ledger. Only employees without a ledger row for the month
+    are computed from the raw data, with the payroll ``backend``; their
+    results are stored in the ledger. Rows computed with other business
+    days of the month than the current calendar are computed again.
+    """
+    return load_payroll_range(queryset, [(year, month)], backend)[0]
+
+
+def load_payroll_range(queryset, months, backend=None):
+    """
+    Return ledger-backed snapshots for the consecutive ``months``, a list of
+    ``(year, month)`` pairs. Ledger rows of the whole range are read in one
+    query; the raw data is loaded once for the range if any month has
+    employees missing from the ledger, only for those employees when they
+    are few.
+    """
+    employees = list(queryset.select_related('position'))
+    calendar = get_business_calendar()
+    calendar_masks = dict((key, calendar.get_month_mask(*key)) for key in months)
+    aggregated_data = dict((key, {}) for key in months)
+    stale_months = set()
+    for row in PayrollLedger.objects.filter(
+        get_month_range_filter(
+            get_month_bounds(*months[0])[0],
+            get_month_bounds(*months[-1])[1],
+        ),
+        employee__in=queryset,
+    ):
+        key = (row.year, row.month)
+        if row.calendar_mask != calendar_masks[key]:
+            # The holidays or transferred workdays of the month have changed.
+            stale_months.add(key)
+            continue
+        aggregated_data[key][row.employee_id] = row.get_aggregated_data()
+    missing = dict(
+        (key, [employee for employee in employees if employee.pk not in aggregated_data[key]])
+        for key in months
+    )
+    if not any(missing.values()):
+        return [
+            PayrollSnapshot(year, month, employees, {}, {}, {}, aggregated_data=aggregated_data[(year, month)])
+            for year, month in months
+        ]
+
+    missing_pks = set(employee.pk for employee in itertools.chain.from_iterable(missing.values()))
+    if len(missing_pks) <= SELECTIVE_LOAD_LIMIT:
+        # The cost of recomputing a few invalidated cells does not depend
+        # on the number of employees of ``queryset``.
+        snapshots = PayrollSnapshot.load_range(Employee.objects.filter(pk__in=missing_pks), months)
+    else:
+        snapshots = PayrollSnapshot.load_range(queryset, months)
+    rows = []
+    for snapshot in snapshots:
+        key = (snapshot.year, snapshot.month)
+        snapshot.employees = employees
+        snapshot.aggregated_data.update(aggregated_data[key])
+        snapshot.compute(missing[key], backend=backend)
+        rows.extend(
+            PayrollLedger.from_aggregated_data(
+                employee, snapshot.year, snapshot.month, calendar_masks[key],
+                snapshot.get_aggregated_data(employee),
+            )
+            for employee in missing[key]
+        )
+    try:
+        with transaction.atomic():
+            if stale_months:
+                query = Q()
+                for year, month in stale_months:
+                    query |= Q(year=year, month=month) & ~Q(calendar_mask=calendar_masks[(year, month)])
+                PayrollLedger.objects.filter(query, employee__in=queryset).delete()
+            PayrollLedger.objects.bulk_create(rows)
+    except IntegrityError:
+        # Another request has filled the same months concurrently.
+        pass
+    return snapshots
+
+
+def get_month_range_filter(start_date, end_date):
+    return (
+        (Q(year__gt=start_date.year) | Q(year=start_date.year, month__gte=start_date.month)) &
+        (Q(year__lt=end_date.year) | Q(year=end_date.year, month__lte=end_date.month))
+    )
+
+
+def get_cells_filter(cells):
+    """
+    Filter of the ledger rows of ``cells``, a list of ``AffectedCells``.
+    """
+    query = Q()
+    for item in cells:
+        cells_query = Q(employee__in=item.employees)
+        if item.start_date is not None:
+            cells_query &= get_month_range_filter(item.start_date, item.end_date)
+        query |= cells_query
+    return query
+
+
+def invalidate_cells(cells):
+    if cells:
+        PayrollLedger.objects.filter(get_cells_filter(cells)).delete()
+
+
+@receiver(object_changed)
+def invalidate_ledger(sender, instance, previous=None, **kwargs):
+    invalidate_cells(get_affected_cells(instance, previous))
+
+
+@receiver(objects_imported)
+def invalidate_imported_ledger(sender, instances, **kwargs):
+    """
+    Invalidate the ledger for a batch of imported objects with a single
+    query.
+    """
+    invalidate_cells(get_imported_cells(sender, instances))
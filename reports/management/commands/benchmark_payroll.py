@@ -0,0 +1,145 @@
+# coding: utf-8
+from __future__ import absolute_import
+
+import datetime
+import json
+import platform
+
+import django
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory
+
+from common.benchmark import measure
+from common.models import Establishment
+from personnel.generators import generate_payroll_data
+from personnel.models import Department
+from personnel.views import (
+    DepartmentListView,
+    EmployeeListView,
+    BonusListView,
+    SickTimeListView,
+    VacationListView,
+)
+from reports.models import PayrollLedger
+from reports.reports import (
+    get_aggregated_data,
+    SummaryReport,
+    SickReport,
+    VacationReport,
+    BonusReport,
+)
+
+REPORT_CLASSES = (
+    SummaryReport,
+    SickReport,
+    VacationReport,
+    BonusReport,
+)
+
+LIST_VIEWS = (
+    DepartmentListView,
+    EmployeeListView,
+    BonusListView,
+    SickTimeListView,
+    VacationListView,
+)
+
+
+class Command(BaseCommand):
+    help = ('Times payroll aggregation, report generation and the personnel list '
+            'views on generated data sets and writes the results as JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', default='100,1000,10000',
+            help='Comma separated numbers of employees to benchmark.',
+        )
+        parser.add_argument('--month', type=int, default=6)
+        parser.add_argument('--year', type=int, default=2015)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--output', default=None,
+            help='File to write the JSON results to; standard output by default.',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',')]
+        except ValueError:
+            raise CommandError('--sizes must be a comma separated list of integers.')
+        self.user = User.objects.order_by('pk').first()
+        if self.user is None:
+            raise CommandError('At least one user is required to run the benchmark.')
+        self.month, self.year = options['month'], options['year']
+
+        results = {
+            'created_at': datetime.datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'month': self.month,
+            'year': self.year,
+            'runs': [self.run(size, options['seed']) for size in sizes],
+        }
+        output = json.dumps(results, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                output_file.write(output)
+        else:
+            self.stdout.write(output)
+
+    def record(self, run, name, func, *args, **kwargs):
+        measurement = measure(func, *args, **kwargs)
+        del measurement['result']
+        run['measurements'][name] = measurement
+        self.stderr.write(
+            u'{size} {name}: {wall_time:.3f}s, {queries} queries, '
+            u'RSS kept {rss_delta_kb} kB, sampled peak {peak_rss_delta_kb} kB above the start'.format(
+                size=run['employees'],
+                name=name,
+                **measurement
+            )
+        )
+
+    def run(self, size, seed):
+        run = {'employees': size, 'measurements': {}}
+        with transaction.atomic():
+            employees = generate_payroll_data(
+                self.user,
+                departments=max(1, size // 100),
+                employees=size,
+                start_date=datetime.date(self.year - 1, 1, 1),
+                seed=seed,
+            )
+            departments = list(Department.objects.filter(employee__in=employees).distinct())
+            context = {
+                'month_year': (self.month, self.year),
+                'departments': departments,
+            }
+            establishment = Establishment.objects.last() or Establishment(name=u'Benchmark')
+
+            def aggregate():
+                for employee in employees.select_related('position'):
+                    get_aggregated_data(employee, self.year, self.month)
+
+            self.record(run, 'get_aggregated_data', aggregate)
+            for report_class in REPORT_CLASSES:
+                PayrollLedger.objects.filter(employee__in=employees).delete()
+                report = report_class(establishment=establishment, context=context)
+                self.record(run, report_class.__name__, report.get_file_content)
+            report = SummaryReport(establishment=establishment, context=context)
+            self.record(run, 'SummaryReport (ledger)', report.get_file_content)
+
+            factory = RequestFactory()
+            for view_class in LIST_VIEWS:
+                request = factory.get('/')
+                request.user = self.user
+                view = view_class.as_view()
+                kwargs = {}
+                if view_class is EmployeeListView:
+                    kwargs['department_id'] = departments[0].pk
+                self.record(run, view_class.__name__, lambda: view(request, **kwargs).render())
+            transaction.set_rollback(True)
+        return run
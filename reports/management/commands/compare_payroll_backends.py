@@ -0,0 +1,82 @@
+# coding: utf-8
+from __future__ import absolute_import
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from personnel.models import Employee
+from reports.payroll import (
+    PAYROLL_BACKENDS,
+    PAYROLL_ENGINES,
+    get_months,
+)
+from reports.snapshot import (
+    PayrollSnapshot,
+    calculate_chunk,
+)
+
+
+def parse_month(value):
+    year, month = value.split('-')
+    return int(year), int(month)
+
+
+BACKEND_CHOICES = sorted(set(PAYROLL_BACKENDS) | set(PAYROLL_ENGINES))
+
+
+class Command(BaseCommand):
+    help = ('Computes the payroll of every active employee with two payroll backends '
+            'and reports every value that differs between them, with timings.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', default='2014-01', help='First month, YYYY-MM.')
+        parser.add_argument('--end', default='2015-12', help='Last month, YYYY-MM.')
+        parser.add_argument('--reference', default='decimal', choices=BACKEND_CHOICES)
+        parser.add_argument('--backend', default='kopecks', choices=BACKEND_CHOICES)
+
+    def handle(self, *args, **options):
+        try:
+            start_year, start_month = parse_month(options['start'])
+            end_year, end_month = parse_month(options['end'])
+        except ValueError:
+            raise CommandError('--start and --end must be months in YYYY-MM format.')
+        months = get_months(start_year, start_month, end_year, end_month)
+        if not months:
+            raise CommandError('--end must not be earlier than --start.')
+
+        backends = (options['reference'], options['backend'])
+        timings = dict((backend, 0.0) for backend in backends)
+        compared = 0
+        mismatches = 0
+        queryset = Employee.objects.filter(active=True)
+        for snapshot in PayrollSnapshot.load_range(queryset, months):
+            items = [snapshot.get_calculation_item(employee) for employee in snapshot.employees]
+            results = {}
+            for backend in backends:
+                started = time.time()
+                results[backend] = dict(calculate_chunk((backend, snapshot.year, snapshot.month, items)))
+                timings[backend] += time.time() - started
+            reference, other = (results[backend] for backend in backends)
+            for employee in snapshot.employees:
+                compared += 1
+                for field, value in sorted(reference[employee.pk].items()):
+                    if str(other[employee.pk][field]) != str(value):
+                        mismatches += 1
+                        self.stdout.write(u'{year}-{month:02d} employee {pk} {field}: {reference} != {other}'.format(
+                            year=snapshot.year,
+                            month=snapshot.month,
+                            pk=employee.pk,
+                            field=field,
+                            reference=value,
+                            other=other[employee.pk][field],
+                        ))
+
+        for backend in backends:
+            self.stdout.write(u'{backend}: {time:.3f}s'.format(backend=backend, time=timings[backend]))
+        self.stdout.write(u'{count} employee months compared, {mismatches} mismatches'.format(
+            count=compared,
+            mismatches=mismatches,
+        ))
+        if mismatches:
+            raise CommandError('The backends disagree.')
@@ -0,0 +1,45 @@
+# coding: utf-8
+from __future__ import absolute_import
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from reports.jobs import (
+    claim_next_job,
+    delete_expired_jobs,
+    run_job,
+)
+
+
+class Command(BaseCommand):
+    help = 'Builds queued report files and deletes expired ones.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true', default=False,
+            help='Exit once the queue is empty instead of waiting for new jobs.',
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=2.0,
+            help='Seconds to wait between polls of an empty queue.',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            # Like the request cycle, drop the connection if it is broken
+            # or older than CONN_MAX_AGE.
+            close_old_connections()
+            job = claim_next_job()
+            if job is None:
+                delete_expired_jobs()
+                if options['once']:
+                    return
+                time.sleep(options['sleep'])
+                continue
+            job = run_job(job)
+            self.stdout.write(u'{pk}: {status}'.format(
+                pk=job.pk,
+                status=job.get_status_display(),
+            ))
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('personnel', '0007_auto_20150607_2104'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PayrollLedger',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('year', models.PositiveIntegerField()),
+                ('month', models.PositiveSmallIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('business_days_count', models.PositiveSmallIntegerField()),
+                ('worked_days_count', models.PositiveSmallIntegerField()),
+                ('worked_days_payments', models.DecimalField(max_digits=22, decimal_places=2)),
+                ('vacation_days_count', models.PositiveSmallIntegerField()),
+                ('vacation_payments', models.DecimalField(max_digits=22, decimal_places=2)),
+                ('vacation_tax', models.DecimalField(max_digits=22, decimal_places=2)),
+                ('vacation_payments_minus_tax', models.DecimalField(max_digits=22, decimal_places=2)),
+                ('sicktime_days_count', models.PositiveSmallIntegerField()),
+                ('sicktime_payments', models.DecimalField(max_digits=22, decimal_places=2)),
+                ('sicktime_tax', models.DecimalField(max_digits=22, decimal_places=2)),
+                ('sicktime_payments_minus_tax', models.DecimalField(max_digits=22, decimal_places=2)),
+                ('total_payments', models.DecimalField(max_digits=22, decimal_places=2)),
+                ('total_tax', models.DecimalField(max_digits=22, decimal_places=2)),
+                ('total_payments_minus_tax', models.DecimalField(max_digits=22, decimal_places=2)),
+                ('bonus_payments', models.DecimalField(max_digits=22, decimal_places=2)),
+                ('bonus_tax', models.DecimalField(max_digits=22, decimal_places=2)),
+                ('bonus_payments_minus_tax', models.DecimalField(max_digits=22, decimal_places=2)),
+                ('employee', models.ForeignKey(to='personnel.Employee')),
+            ],
+            options={
+                'verbose_name': '\u0440\u0430\u0441\u0447\u0435\u0442 \u0437\u0430 \u043c\u0435\u0441\u044f\u0446',
+                'verbose_name_plural': '\u0440\u0430\u0441\u0447\u0435\u0442\u044b \u0437\u0430 \u043c\u0435\u0441\u044f\u0446',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='payrollledger',
+            unique_together=set([('employee', 'year', 'month')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='payrollledger',
+            index_together=set([('year', 'month')]),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('personnel', '0007_auto_20150607_2104'),
+        ('reports', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportJob',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('report_type', models.CharField(max_length=20)),
+                ('month', models.PositiveSmallIntegerField()),
+                ('year', models.PositiveIntegerField()),
+                ('departments_key', models.CharField(max_length=255)),
+                ('status', models.SmallIntegerField(default=0, choices=[(0, '\u0412 \u043e\u0447\u0435\u0440\u0435\u0434\u0438'), (1, '\u0424\u043e\u0440\u043c\u0438\u0440\u0443\u0435\u0442\u0441\u044f'), (2, '\u0413\u043e\u0442\u043e\u0432'), (3, '\u041e\u0448\u0438\u0431\u043a\u0430')])),
+                ('file', models.FileField(upload_to=b'reports', blank=True)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(null=True, blank=True)),
+                ('finished_at', models.DateTimeField(null=True, blank=True)),
+                ('created_by', models.ForeignKey(related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('departments', models.ManyToManyField(to='personnel.Department')),
+            ],
+            options={
+                'verbose_name': '\u0437\u0430\u0434\u0430\u043d\u0438\u0435 \u043d\u0430 \u043e\u0442\u0447\u0435\u0442',
+                'verbose_name_plural': '\u0437\u0430\u0434\u0430\u043d\u0438\u044f \u043d\u0430 \u043e\u0442\u0447\u0435\u0442\u044b',
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='reportjob',
+            index_together=set([('status', 'report_type', 'year', 'month', 'departments_key')]),
+        ),
+    ]
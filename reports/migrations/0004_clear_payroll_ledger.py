@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+def clear_payroll_ledger(apps, schema_editor):
+    # Ledger rows were computed with bonuses summed over every year of the
+    # month; they are recomputed on demand.
+    apps.get_model('reports', 'PayrollLedger').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('personnel', '0010_bonus_period_index'),
+        ('reports', '0003_reportjob_range'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_payroll_ledger, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+def clear_payroll_ledger(apps, schema_editor):
+    # Ledger rows may hold salaries computed as wages * days / days in
+    # month, which rounds ties differently from the daily rate; they are
+    # recomputed on demand.
+    apps.get_model('reports', 'PayrollLedger').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0004_clear_payroll_ledger'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_payroll_ledger, migrations.RunPython.noop),
+    ]
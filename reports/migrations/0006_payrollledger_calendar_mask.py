@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0005_clear_payroll_ledger_salary'),
+    ]
+
+    operations = [
+        # The calendar of the existing rows is unknown; no month has an
+        # empty mask, so they are all recomputed on demand.
+        migrations.AddField(
+            model_name='payrollledger',
+            name='calendar_mask',
+            field=models.PositiveIntegerField(default=0),
+            preserve_default=False,
+        ),
+    ]
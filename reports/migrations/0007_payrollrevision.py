@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def create_payroll_revision(apps, schema_editor):
+    apps.get_model('reports', 'PayrollRevision').objects.create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0006_payrollledger_calendar_mask'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PayrollRevision',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_payroll_revision, migrations.RunPython.noop),
+    ]
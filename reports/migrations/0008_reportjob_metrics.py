@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0007_payrollrevision'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reportjob',
+            name='metrics',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='reportjob',
+            name='profile',
+            field=models.BooleanField(default=False),
+        ),
+    ]
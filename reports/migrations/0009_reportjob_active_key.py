@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0008_reportjob_metrics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reportjob',
+            name='active_key',
+            field=models.CharField(max_length=32, unique=True, null=True, blank=True),
+        ),
+        migrations.AddField(
+            model_name='reportjob',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
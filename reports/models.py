@@ -0,0 +1,144 @@
+# coding:utf-8
+import json
+from collections import OrderedDict
+
+from django.db import models
+from django.contrib.auth.models import User
+from django.utils.translation import ugettext as _
+
+from personnel.models import (
+    Department,
+    Employee,
+)
+
+
+class PayrollLedger(models.Model):
+    AGGREGATED_FIELDS = (
+        'business_days_count',
+        'worked_days_count',
+        'worked_days_payments',
+        'vacation_days_count',
+        'vacation_payments',
+        'vacation_tax',
+        'vacation_payments_minus_tax',
+        'sicktime_days_count',
+        'sicktime_payments',
+        'sicktime_tax',
+        'sicktime_payments_minus_tax',
+        'total_payments',
+        'total_tax',
+        'total_payments_minus_tax',
+        'bonus_payments',
+        'bonus_tax',
+        'bonus_payments_minus_tax',
+    )
+
+    employee = models.ForeignKey(to=Employee)
+    year = models.PositiveIntegerField()
+    month = models.PositiveSmallIntegerField()
+    # Business days of the month the row was computed with, see
+    # ``BusinessCalendar.get_month_mask()``.
+    calendar_mask = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    business_days_count = models.PositiveSmallIntegerField()
+    worked_days_count = models.PositiveSmallIntegerField()
+    worked_days_payments = models.DecimalField(max_digits=22, decimal_places=2)
+    vacation_days_count = models.PositiveSmallIntegerField()
+    vacation_payments = models.DecimalField(max_digits=22, decimal_places=2)
+    vacation_tax = models.DecimalField(max_digits=22, decimal_places=2)
+    vacation_payments_minus_tax = models.DecimalField(max_digits=22, decimal_places=2)
+    sicktime_days_count = models.PositiveSmallIntegerField()
+    sicktime_payments = models.DecimalField(max_digits=22, decimal_places=2)
+    sicktime_tax = models.DecimalField(max_digits=22, decimal_places=2)
+    sicktime_payments_minus_tax = models.DecimalField(max_digits=22, decimal_places=2)
+    total_payments = models.DecimalField(max_digits=22, decimal_places=2)
+    total_tax = models.DecimalField(max_digits=22, decimal_places=2)
+    total_payments_minus_tax = models.DecimalField(max_digits=22, decimal_places=2)
+    bonus_payments = models.DecimalField(max_digits=22, decimal_places=2)
+    bonus_tax = models.DecimalField(max_digits=22, decimal_places=2)
+    bonus_payments_minus_tax = models.DecimalField(max_digits=22, decimal_places=2)
+
+    class Meta:
+        verbose_name = _(u'расчет за месяц')
+        verbose_name_plural = _(u'расчеты за месяц')
+        unique_together = (
+            ('employee', 'year', 'month'),
+        )
+        index_together = (
+            ('year', 'month'),
+        )
+
+    @classmethod
+    def from_aggregated_data(cls, employee, year, month, calendar_mask, aggregated_data):
+        return cls(employee=employee, year=year, month=month, calendar_mask=calendar_mask, **{
+            field: aggregated_data[field] for field in cls.AGGREGATED_FIELDS
+        })
+
+    def get_aggregated_data(self):
+        return {field: getattr(self, field) for field in self.AGGREGATED_FIELDS}
+
+
+class PayrollRevision(models.Model):
+    """
+    Single row counting the changes of the data the payroll is computed
+    from, part of the payroll API version, see ``reports.api``.
+    """
+    value = models.BigIntegerField(default=0)
+
+
+class ReportJob(models.Model):
+    STATUS_PENDING = 0
+    STATUS_RUNNING = 1
+    STATUS_DONE = 2
+    STATUS_FAILED = 3
+    STATUS_CHOICES = (
+        (STATUS_PENDING, _(u'В очереди')),
+        (STATUS_RUNNING, _(u'Формируется')),
+        (STATUS_DONE, _(u'Готов')),
+        (STATUS_FAILED, _(u'Ошибка')),
+    )
+
+    report_type = models.CharField(max_length=20)
+    month = models.PositiveSmallIntegerField()
+    year = models.PositiveIntegerField()
+    # Last month of range reports; empty for single month reports.
+    end_month = models.PositiveSmallIntegerField(null=True, blank=True)
+    end_year = models.PositiveIntegerField(null=True, blank=True)
+    departments = models.ManyToManyField(to=Department)
+    departments_key = models.CharField(max_length=255)
+    status = models.SmallIntegerField(choices=STATUS_CHOICES, default=STATUS_PENDING)
+    file = models.FileField(upload_to='reports', blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    created_by = models.ForeignKey(to=User, related_name='+')
+    # Identifies the request of a pending or running job, empty once the
+    # job is finished: at most one active job per request.
+    active_key = models.CharField(max_length=32, unique=True, null=True, blank=True)
+    # Number of times a worker has started the job.
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # Run the job under cProfile.
+    profile = models.BooleanField(default=False)
+    # JSON of ``ReportInstrumentation.get_data()`` of the finished job.
+    metrics = models.TextField(blank=True)
+
+    class Meta:
+        verbose_name = _(u'задание на отчет')
+        verbose_name_plural = _(u'задания на отчеты')
+        index_together = (
+            ('status', 'report_type', 'year', 'month', 'departments_key'),
+        )
+
+    @property
+    def is_ready(self):
+        return self.status == self.STATUS_DONE
+
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_DONE, self.STATUS_FAILED)
+
+    def get_metrics(self):
+        if not self.metrics:
+            return None
+        return json.loads(self.metrics, object_pairs_hook=OrderedDict)
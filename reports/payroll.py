@@ -0,0 +1,244 @@
+# coding: utf-8
+import datetime
+import calendar
+import logging
+from decimal import (
+    Context,
+    Decimal,
+    ROUND_HALF_EVEN,
+    getcontext,
+)
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from common.utils import business_days_count
+from personnel.models import TWOPLACES
+
+logger = logging.getLogger('reports')
+
+INCOME_TAX = Decimal("0.13")
+ONE_DAY = datetime.timedelta(days=1)
+
+# Interchangeable implementations of ``calculate_payroll()``, chosen by the
+# PAYROLL_BACKEND setting. They return the same values to the kopeck.
+PAYROLL_BACKENDS = {
+    'decimal': 'reports.payroll.calculate_payroll',
+    'kopecks': 'reports.kopecks.calculate_payroll',
+}
+# Engines compute a whole chunk of employees at once, they take
+# ``(year, month, items)`` and return ``(employee pk, aggregated data)`` pairs.
+# They are chosen by name like the backends. Their dependencies are optional:
+# an engine that cannot be imported is replaced by the reference backend.
+PAYROLL_ENGINES = {
+    'numpy': 'reports.vectorized.calculate_chunk',
+}
+# Engines already reported as unavailable, to warn once per process.
+unavailable_engines = set()
+
+
+def get_month_bounds(year, month):
+    _, days_in_month_count = calendar.monthrange(year, month)
+    return datetime.date(year, month, 1), datetime.date(year, month, days_in_month_count)
+
+
+def get_months(start_year, start_month, end_year, end_month):
+    """
+    Return the ``(year, month)`` pairs from the start month to the end month,
+    both included.
+    """
+    months = []
+    year, month = start_year, start_month
+    while (year, month) <= (end_year, end_month):
+        months.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+def days_count(interval):
+    start_date, end_date = interval
+    return (end_date - start_date).days + 1
+
+
+def clip_interval(start_date, end_date, period_start, period_end):
+    start_date = max(start_date, period_start)
+    end_date = min(end_date, period_end)
+    if start_date > end_date:
+        return None
+    return start_date, end_date
+
+
+def subtract_intervals(interval, covered):
+    """
+    Return the parts of ``interval`` that are not covered by any interval
+    from ``covered``. Intervals are ``(start_date, end_date)`` tuples with
+    both ends inclusive.
+    """
+    parts = [interval]
+    for cut_start, cut_end in covered:
+        remaining = []
+        for start_date, end_date in parts:
+            if cut_end < start_date or cut_start > end_date:
+                remaining.append((start_date, end_date))
+                continue
+            if start_date < cut_start:
+                remaining.append((start_date, cut_start - ONE_DAY))
+            if end_date > cut_end:
+                remaining.append((cut_end + ONE_DAY, end_date))
+        parts = remaining
+    return parts
+
+
+def round_significant(coefficient, precision):
+    """
+    Round the integer ``coefficient`` to ``precision`` significant digits,
+    half to even, keeping its scale.
+    """
+    digits = len(str(coefficient))
+    if digits <= precision:
+        return coefficient
+    scale = 10 ** (digits - precision)
+    quotient, remainder = divmod(coefficient, scale)
+    if remainder * 2 > scale or (remainder * 2 == scale and quotient % 2):
+        quotient += 1
+    return quotient * scale
+
+
+def add_daily(total, rate, count):
+    """
+    Add ``rate`` to ``total`` once per day for ``count`` days.
+
+    Amounts have 28 significant digits, so repeated additions may round
+    differently from ``rate * count``, which matters when the exact amount
+    is a half kopeck: the per-day sums are the reference. The additions are
+    done on integer coefficients with the rounding of the Decimal context,
+    which gives the same value as adding Decimals day by day.
+    """
+    if total < 0 or rate < 0 or getcontext().rounding != ROUND_HALF_EVEN:
+        for _ in xrange(count):
+            total += rate
+        return total
+    precision = getcontext().prec
+    total_sign, total_digits, total_exponent = total.as_tuple()
+    rate_sign, rate_digits, rate_exponent = rate.as_tuple()
+    exponent = min(total_exponent, rate_exponent)
+    coefficient = int(''.join(map(str, total_digits))) * 10 ** (total_exponent - exponent)
+    step = int(''.join(map(str, rate_digits))) * 10 ** (rate_exponent - exponent)
+    if len(str(coefficient + step * count)) <= precision:
+        # Every partial sum is exact.
+        coefficient += step * count
+    else:
+        for _ in xrange(count):
+            coefficient = round_significant(coefficient + step, precision)
+    return Decimal(coefficient).scaleb(exponent, context=Context(prec=len(str(coefficient))))
+
+
+def allocate_leave(leaves, period_start, period_end, covered):
+    """
+    Distribute the days of ``period`` between ``leaves``.
+
+    A day belongs to the leave with the lowest primary key among those
+    covering it, which is what ``.first()`` returned for a day-by-day lookup.
+    Days already present in ``covered`` are skipped; allocated intervals are
+    appended to it. Returns ``(days_count, payments)``, the payments being
+    added in date order like the day-by-day lookup did.
+    """
+    parts = []
+    for leave in sorted(leaves, key=lambda item: item.pk):
+        interval = clip_interval(leave.start_date, leave.end_date, period_start, period_end)
+        if interval is None:
+            continue
+        parts.extend((part, leave.day_rate) for part in subtract_intervals(interval, covered))
+        covered.append(interval)
+    leave_days_count = 0
+    payments = Decimal('0.00')
+    for part, day_rate in sorted(parts, key=lambda item: item[0]):
+        count = days_count(part)
+        leave_days_count += count
+        payments = add_daily(payments, day_rate, count)
+    return leave_days_count, payments
+
+
+def calculate_payroll(employee, year, month, sicktimes, vacations, bonus_payments):
+    """
+    Compute the month payroll of ``employee`` from already loaded active
+    ``sicktimes`` and ``vacations`` overlapping the month. Sick leave takes
+    precedence over vacation.
+    """
+    month_start, end_date = get_month_bounds(year, month)
+    days_in_month_count = end_date.day
+    start_date = max(month_start, employee.hired)
+
+    covered = []
+    sicktime_days_count, sicktime_payments = allocate_leave(sicktimes, start_date, end_date, covered)
+    vacation_days_count, vacation_payments = allocate_leave(vacations, start_date, end_date, covered)
+
+    worked_days_count = 0
+    worked_calendar_days_count = 0
+    if start_date <= end_date:
+        for part in subtract_intervals((start_date, end_date), covered):
+            worked_days_count += business_days_count(*part)
+            worked_calendar_days_count += days_count(part)
+    worked_days_rate = employee.wages / days_in_month_count
+    worked_days_payments = add_daily(Decimal('0.00'), worked_days_rate, worked_calendar_days_count)
+
+    sicktime_tax = sicktime_payments * INCOME_TAX
+    sicktime_payments_minus_tax = sicktime_payments - sicktime_tax
+    vacation_tax = vacation_payments * INCOME_TAX
+    vacation_payments_minus_tax = vacation_payments - vacation_tax
+    bonus_tax = bonus_payments * INCOME_TAX
+    bonus_payments_minus_tax = bonus_payments - bonus_tax
+    total_payments = worked_days_payments + vacation_payments + sicktime_payments + bonus_payments
+    total_tax = total_payments * INCOME_TAX
+    total_payments_minus_tax = total_payments - total_tax
+    return {
+        'business_days_count': business_days_count(month_start, end_date),
+        'worked_days_count': worked_days_count,
+        'worked_days_payments': worked_days_payments.quantize(TWOPLACES),
+        'vacation_days_count': vacation_days_count,
+        'vacation_payments': vacation_payments.quantize(TWOPLACES),
+        'vacation_tax': vacation_tax.quantize(TWOPLACES),
+        'vacation_payments_minus_tax': vacation_payments_minus_tax.quantize(TWOPLACES),
+        'sicktime_days_count': sicktime_days_count,
+        'sicktime_payments': sicktime_payments.quantize(TWOPLACES),
+        'sicktime_tax': sicktime_tax.quantize(TWOPLACES),
+        'sicktime_payments_minus_tax': sicktime_payments_minus_tax.quantize(TWOPLACES),
+        'total_payments': total_payments.quantize(TWOPLACES),
+        'total_tax': total_tax.quantize(TWOPLACES),
+        'total_payments_minus_tax': total_payments_minus_tax.quantize(TWOPLACES),
+        'bonus_payments': bonus_payments.quantize(TWOPLACES),
+        'bonus_tax': bonus_tax.quantize(TWOPLACES),
+        'bonus_payments_minus_tax': bonus_payments_minus_tax.quantize(TWOPLACES),
+    }
+
+
+def get_payroll_backend_name(name=None):
+    if name is None:
+        name = getattr(settings, 'PAYROLL_BACKEND', 'decimal')
+    return name
+
+
+def get_payroll_backend(name=None):
+    name = get_payroll_backend_name(name)
+    if name in PAYROLL_ENGINES:
+        # An engine whose dependencies are not installed.
+        name = 'decimal'
+    return import_string(PAYROLL_BACKENDS[name])
+
+
+def get_payroll_engine(name=None):
+    """
+    Return the chunk engine named ``name``, ``None`` if ``name`` is one of
+    ``PAYROLL_BACKENDS`` or if the engine cannot be imported for lack of its
+    optional dependencies; ``get_payroll_backend()`` then returns the
+    reference backend.
+    """
+    name = get_payroll_backend_name(name)
+    if name in PAYROLL_ENGINES:
+        try:
+            return import_string(PAYROLL_ENGINES[name])
+        except ImportError as error:
+            if name not in unavailable_engines:
+                unavailable_engines.add(name)
+                logger.warning('payroll engine %s is not available, using the decimal backend: %s', name, error)
+    return None
@@ -1,6 +1,8 @@
 # coding: utf-8
+from __future__ import absolute_import
+
 import datetime
-import calendar
+import tempfile
 from decimal import Decimal
 from collections import defaultdict
 try:
@@ -8,93 +10,52 @@ try:
 except ImportError:
     import StringIO
 
-from django.utils import dateformat
 from django.utils.translation import ugettext as _
 from django.conf import settings
 from xlsxwriter.workbook import Workbook
 from babel.dates import format_date
 
-from common.utils import business_days
-from common.utils import daterange
-from personnel.models import (
-    Employee,
-    SickTime,
-    TWOPLACES,
+from personnel.models import Employee
+from reports.payroll import (
+    calculate_payroll,
+    get_month_bounds,
+    get_months,
+)
+from reports.instrumentation import phase
+from reports.ledger import (
+    load_payroll,
+    load_payroll_range,
 )
 
-INCOME_TAX = Decimal("0.13")
 
 def get_aggregated_data(employee, year, month):
-    _, days_in_month_count = calendar.monthrange(year, month)
-    start_date = datetime.date(year, month, 1)
-    end_date = datetime.date(year, month, days_in_month_count)
-    business_days_list = list(business_days(month, year))
-
-    if start_date < employee.hired:
-        start_date = employee.hired
-
-    worked_days_count = 0
-    worked_days_payments = Decimal('0.00')
-    worked_days_rate = employee.wages / days_in_month_count
-    vacation_days_count = 0
-    vacation_payments = Decimal('0.00')
-    sicktime_days_count = 0
-    sicktime_payments = Decimal('0.00')
-    for day in daterange(start_date, end_date):
-        sicktime = employee.get_sicktime(day)
-        if sicktime:
-            sicktime_days_count +=1
-            sicktime_payments += sicktime.day_rate
-            continue
-        vacation = employee.get_vacation(day)
-        if vacation:
-            vacation_days_count += 1
-            vacation_payments += vacation.day_rate
-            continue
-        if day in business_days_list:
-            worked_days_count += 1
-        worked_days_payments += worked_days_rate
-    sicktime_tax = sicktime_payments * INCOME_TAX
-    sicktime_payments_minus_tax = sicktime_payments - sicktime_tax
-    vacation_tax = vacation_payments * INCOME_TAX
-    vacation_payments_minus_tax = vacation_payments - vacation_tax
-    bonus_payments = employee.get_bonus_payments(month)
-    bonus_tax = bonus_payments * INCOME_TAX
-    bonus_payments_minus_tax = bonus_payments - bonus_tax
-    total_payments = worked_days_payments + vacation_payments + sicktime_payments + bonus_payments
-    total_tax = total_payments * INCOME_TAX
-    total_payments_minus_tax = total_payments - total_tax
-    return {
-        'business_days_count': len(business_days_list),
-        'worked_days_count': worked_days_count,
-        'worked_days_payments': worked_days_payments.quantize(TWOPLACES),
-        'vacation_days_count': vacation_days_count,
-        'vacation_payments': vacation_payments.quantize(TWOPLACES),
-        'vacation_tax': vacation_tax.quantize(TWOPLACES),
-        'vacation_payments_minus_tax': vacation_payments_minus_tax.quantize(TWOPLACES),
-        'sicktime_days_count': sicktime_days_count,
-        'sicktime_payments': sicktime_payments.quantize(TWOPLACES),
-        'sicktime_tax': sicktime_tax.quantize(TWOPLACES),
-        'sicktime_payments_minus_tax': sicktime_payments_minus_tax.quantize(TWOPLACES),
-        'total_payments': total_payments.quantize(TWOPLACES),
-        'total_tax': total_tax.quantize(TWOPLACES),
-        'total_payments_minus_tax': total_payments_minus_tax.quantize(TWOPLACES),
-        'bonus_payments': bonus_payments.quantize(TWOPLACES),
-        'bonus_tax': bonus_tax.quantize(TWOPLACES),
-        'bonus_payments_minus_tax': bonus_payments_minus_tax.quantize(TWOPLACES),
-    }
+    start_date, end_date = get_month_bounds(year, month)
+    return calculate_payroll(
+        employee, year, month,
+        sicktimes=employee.sicktime_set.overlapping(None, start_date, end_date),
+        vacations=employee.vacation_set.overlapping(None, start_date, end_date),
+        bonus_payments=employee.get_bonus_payments(year, month),
+    )
 
 
 class Report(object):
     name = NotImplemented
+    title = NotImplemented
     header = ()
-
-    def __init__(self, establishment, context):
+    # Fixed workbook creation time; makes repeated builds byte-identical.
+    created = None
+    # Payroll backend or engine the data is computed with, one of
+    # ``PAYROLL_BACKENDS`` or ``PAYROLL_ENGINES``; the PAYROLL_BACKEND
+    # setting if ``None``.
+    engine = None
+
+    def __init__(self, establishment, context, snapshot=None):
         self.establishment = establishment
         self.context = context
         self.file_content = None
         self.current_column = 0
         self.month, self.year = context.get('month_year', (1900, 1))
+        self.snapshot = snapshot
 
     def get_name(self):
         return self.name
@@ -105,15 +66,33 @@ class Report(object):
             department__in=self.context.get('departments', []),
         )
 
-    def build_report(self):
-        output = StringIO.StringIO()
-        book = Workbook(output)
-        sheet = book.add_worksheet(self.get_name())
+    def get_snapshot(self):
+        if self.snapshot is None:
+            with phase('get_queryset'):
+                self.snapshot = load_payroll(self.get_queryset(), self.year, self.month, self.engine)
+        return self.snapshot
+
+    def compute(self):
+        self.get_snapshot().compute(backend=self.engine)
+
+    def build_report(self, output=None, **options):
+        if output is None:
+            output = StringIO.StringIO()
+        book = Workbook(output, options)
+        if self.created is not None:
+            book.set_properties({'created': self.created})
+        self.compute()
+        self.write_sheet(book, self.get_name())
+        with phase('book.close'):
+            book.close()
+        return output
+
+    def write_sheet(self, book, sheet_name):
+        sheet = book.add_worksheet(sheet_name)
         self.write_header(sheet)
-        self.write_body(sheet)
+        with phase('write_body'):
+            self.write_body(sheet)
         self.write_footer(sheet)
-        book.close()
-        return output
 
     def write_header(self, sheet):
         report_date = datetime.date(self.year, self.month, 1)
@@ -132,6 +111,21 @@ class Report(object):
     def write_footer(self, sheet):
         sheet.write(self.current_column + 2, 0, _(u'Гл. бухгалтер'))
 
+    def get_header(self):
+        return self.header
+
+    def get_row(self, index, employee, aggregated_data):
+        raise NotImplementedError('``get_row()`` method is not implemented')
+
+    def iter_rows(self):
+        """
+        Rows of the report body, a tuple of ``get_header()`` values per
+        employee, produced one by one for the CSV and NDJSON exporters.
+        """
+        self.compute()
+        for index, (employee, aggregated_data) in enumerate(self.get_snapshot()):
+            yield self.get_row(index, employee, aggregated_data)
+
     def get_file_content(self):
         if self.file_content is None:
             output = self.build_report()
@@ -139,9 +133,21 @@ class Report(object):
             self.file_content = output.read()
         return self.file_content
 
+    def get_file(self):
+        """
+        Build the report into a temporary file. Rows are flushed to disk as
+        soon as they are written, so memory usage does not depend on the
+        number of rows.
+        """
+        output = tempfile.TemporaryFile()
+        self.build_report(output, constant_memory=True)
+        output.seek(0)
+        return output
+
 
 class SummaryReport(Report):
     name = _(u'Расчетная ведомость')
+    title = _(u'Выплаты')
     header = (
         _(u'Номер п/п'),
         _(u'Табельный номер'),
@@ -157,24 +163,27 @@ class SummaryReport(Report):
         _(u'Выплачено через кассу/банк'),
     )
 
+    def get_row(self, index, employee, aggregated_data):
+        return (
+            index + 1,
+            employee.personnel_number,
+            employee.name,
+            employee.position.name,
+            aggregated_data['worked_days_count'],
+            aggregated_data['worked_days_payments'],
+            aggregated_data['sicktime_payments'],
+            aggregated_data['vacation_payments'],
+            aggregated_data['total_payments'],
+            aggregated_data['total_tax'],
+            aggregated_data['total_tax'],
+            aggregated_data['total_payments_minus_tax'],
+        )
+
     def write_body(self, sheet):
         index = 0
         summary = defaultdict(Decimal)
-        for index, employee in enumerate(self.get_queryset()):
-            aggregated_data = get_aggregated_data(employee, self.year, self.month)
-
-            sheet.write(self.current_column + index, 0, index + 1)
-            sheet.write(self.current_column + index, 1, employee.personnel_number)
-            sheet.write(self.current_column + index, 2, employee.name)
-            sheet.write(self.current_column + index, 3, employee.position.name)
-            sheet.write(self.current_column + index, 4, aggregated_data['worked_days_count'])
-            sheet.write(self.current_column + index, 5, aggregated_data['worked_days_payments'])
-            sheet.write(self.current_column + index, 6, aggregated_data['sicktime_payments'])
-            sheet.write(self.current_column + index, 7, aggregated_data['vacation_payments'])
-            sheet.write(self.current_column + index, 8, aggregated_data['total_payments'])
-            sheet.write(self.current_column + index, 9, aggregated_data['total_tax'])
-            sheet.write(self.current_column + index, 10, aggregated_data['total_tax'])
-            sheet.write(self.current_column + index, 11, aggregated_data['total_payments_minus_tax'])
+        for index, (employee, aggregated_data) in enumerate(self.get_snapshot()):
+            sheet.write_row(self.current_column + index, 0, self.get_row(index, employee, aggregated_data))
 
             summary['payment'] += aggregated_data['worked_days_payments']
             summary['sick'] += aggregated_data['sicktime_payments']
@@ -195,6 +204,7 @@ class SummaryReport(Report):
 
 class SickReport(Report):
     name = _(u'Расчетная ведомость')
+    title = _(u'Больничные')
     header = (
         _(u'Номер п/п'),
         _(u'Табельный номер'),
@@ -207,20 +217,24 @@ class SickReport(Report):
         _(u'Выплачено через кассу/банк'),
     )
 
+    def get_row(self, index, employee, aggregated_data):
+        return (
+            index + 1,
+            employee.personnel_number,
+            employee.name,
+            employee.position.name,
+            aggregated_data['sicktime_payments'],
+            aggregated_data['sicktime_payments'],
+            aggregated_data['sicktime_tax'],
+            aggregated_data['sicktime_tax'],
+            aggregated_data['sicktime_payments_minus_tax'],
+        )
+
     def write_body(self, sheet):
+        index = 0
         summary = defaultdict(Decimal)
-        for index, employee in enumerate(self.get_queryset()):
-            aggregated_data = get_aggregated_data(employee, self.year, self.month)
-
-            sheet.write(self.current_column + index, 0, index + 1)
-            sheet.write(self.current_column + index, 1, employee.personnel_number)
-            sheet.write(self.current_column + index, 2, employee.name)
-            sheet.write(self.current_column + index, 3, employee.position.name)
-            sheet.write(self.current_column + index, 4, aggregated_data['sicktime_payments'])
-            sheet.write(self.current_column + index, 5, aggregated_data['sicktime_payments'])
-            sheet.write(self.current_column + index, 6, aggregated_data['sicktime_tax'])
-            sheet.write(self.current_column + index, 7, aggregated_data['sicktime_tax'])
-            sheet.write(self.current_column + index, 8, aggregated_data['sicktime_payments_minus_tax'])
+        for index, (employee, aggregated_data) in enumerate(self.get_snapshot()):
+            sheet.write_row(self.current_column + index, 0, self.get_row(index, employee, aggregated_data))
 
             summary['sicktime'] += aggregated_data['sicktime_payments']
             summary['tax'] += aggregated_data['sicktime_tax']
@@ -237,6 +251,7 @@ class SickReport(Report):
 
 class VacationReport(Report):
     name = _(u'Расчетная ведомость')
+    title = _(u'Отпуска')
     header = (
         _(u'Номер п/п'),
         _(u'Табельный номер'),
@@ -249,20 +264,24 @@ class VacationReport(Report):
         _(u'Выплачено через кассу/банк'),
     )
 
+    def get_row(self, index, employee, aggregated_data):
+        return (
+            index + 1,
+            employee.personnel_number,
+            employee.name,
+            employee.position.name,
+            aggregated_data['vacation_payments'],
+            aggregated_data['vacation_payments'],
+            aggregated_data['vacation_tax'],
+            aggregated_data['vacation_tax'],
+            aggregated_data['vacation_payments_minus_tax'],
+        )
+
     def write_body(self, sheet):
+        index = 0
         summary = defaultdict(Decimal)
-        for index, employee in enumerate(self.get_queryset()):
-            aggregated_data = get_aggregated_data(employee, self.year, self.month)
-
-            sheet.write(self.current_column + index, 0, index + 1)
-            sheet.write(self.current_column + index, 1, employee.personnel_number)
-            sheet.write(self.current_column + index, 2, employee.name)
-            sheet.write(self.current_column + index, 3, employee.position.name)
-            sheet.write(self.current_column + index, 4, aggregated_data['vacation_payments'])
-            sheet.write(self.current_column + index, 5, aggregated_data['vacation_payments'])
-            sheet.write(self.current_column + index, 6, aggregated_data['vacation_tax'])
-            sheet.write(self.current_column + index, 7, aggregated_data['vacation_tax'])
-            sheet.write(self.current_column + index, 8, aggregated_data['vacation_payments_minus_tax'])
+        for index, (employee, aggregated_data) in enumerate(self.get_snapshot()):
+            sheet.write_row(self.current_column + index, 0, self.get_row(index, employee, aggregated_data))
 
             summary['vacation'] += aggregated_data['vacation_payments']
             summary['tax'] += aggregated_data['vacation_tax']
@@ -279,6 +298,7 @@ class VacationReport(Report):
 
 class BonusReport(Report):
     name = _(u'Расчетная ведомость')
+    title = _(u'Премии')
     header = (
         _(u'Номер п/п'),
         _(u'Табельный номер'),
@@ -291,20 +311,24 @@ class BonusReport(Report):
         _(u'Выплачено через кассу/банк'),
     )
 
+    def get_row(self, index, employee, aggregated_data):
+        return (
+            index + 1,
+            employee.personnel_number,
+            employee.name,
+            employee.position.name,
+            aggregated_data['bonus_payments'],
+            aggregated_data['bonus_payments'],
+            aggregated_data['bonus_tax'],
+            aggregated_data['bonus_tax'],
+            aggregated_data['bonus_payments_minus_tax'],
+        )
+
     def write_body(self, sheet):
+        index = 0
         summary = defaultdict(Decimal)
-        for index, employee in enumerate(self.get_queryset()):
-            aggregated_data = get_aggregated_data(employee, self.year, self.month)
-
-            sheet.write(self.current_column + index, 0, index + 1)
-            sheet.write(self.current_column + index, 1, employee.personnel_number)
-            sheet.write(self.current_column + index, 2, employee.name)
-            sheet.write(self.current_column + index, 3, employee.position.name)
-            sheet.write(self.current_column + index, 4, aggregated_data['bonus_payments'])
-            sheet.write(self.current_column + index, 5, aggregated_data['bonus_payments'])
-            sheet.write(self.current_column + index, 6, aggregated_data['bonus_tax'])
-            sheet.write(self.current_column + index, 7, aggregated_data['bonus_tax'])
-            sheet.write(self.current_column + index, 8, aggregated_data['bonus_payments_minus_tax'])
+        for index, (employee, aggregated_data) in enumerate(self.get_snapshot()):
+            sheet.write_row(self.current_column + index, 0, self.get_row(index, employee, aggregated_data))
 
             summary['bonus'] += aggregated_data['bonus_payments']
             summary['tax'] += aggregated_data['bonus_tax']
@@ -317,3 +341,169 @@ class BonusReport(Report):
         sheet.write(self.current_column + 1, 6, summary['tax'])
         sheet.write(self.current_column + 1, 7, summary['tax'])
         sheet.write(self.current_column + 1, 8, summary['actual'])
+
+
+class ReportPack(Report):
+    """
+    All month reports written as sheets of a single workbook. The payroll
+    snapshot is loaded once and shared by every sheet.
+    """
+    report_classes = (
+        SummaryReport,
+        BonusReport,
+        SickReport,
+        VacationReport,
+    )
+    # Leading columns of every sheet that describe the employee.
+    employee_columns = 4
+
+    def get_reports(self):
+        return [
+            report_class(
+                establishment=self.establishment,
+                context=self.context,
+                snapshot=self.get_snapshot(),
+            )
+            for report_class in self.report_classes
+        ]
+
+    def write_sheet(self, book, sheet_name):
+        for report in self.get_reports():
+            report.write_sheet(book, report.title)
+
+    def get_header(self):
+        header = self.report_classes[0].header[:self.employee_columns]
+        for report_class in self.report_classes:
+            header += tuple(
+                u'{title}: {column}'.format(title=report_class.title, column=column)
+                for column in report_class.header[self.employee_columns:]
+            )
+        return header
+
+    def iter_rows(self):
+        """
+        Rows of all sheets side by side: the employee columns followed by
+        the columns of each report.
+        """
+        self.compute()
+        reports = self.get_reports()
+        for index, (employee, aggregated_data) in enumerate(self.get_snapshot()):
+            row = reports[0].get_row(index, employee, aggregated_data)[:self.employee_columns]
+            for report in reports:
+                row += report.get_row(index, employee, aggregated_data)[self.employee_columns:]
+            yield row
+
+
+class RangeReport(Report):
+    """
+    Payroll over consecutive months in a single workbook: a sheet per
+    measure with a column per month and totals by employee and by month.
+    The data of the whole range is loaded at once, see
+    ``load_payroll_range()``.
+    """
+    name = _(u'Сводная расчетная ведомость')
+    title = _(u'За период')
+    measures = (
+        ('worked_days_payments', _(u'Оплата по окладу')),
+        ('sicktime_payments', _(u'Больничные')),
+        ('vacation_payments', _(u'Отпуска')),
+        ('bonus_payments', _(u'Премии')),
+        ('total_payments', _(u'Итого начислено')),
+        ('total_tax', _(u'НДФЛ')),
+        ('total_payments_minus_tax', _(u'Выплачено')),
+    )
+    header = (
+        _(u'Номер п/п'),
+        _(u'Табельный номер'),
+        _(u'Фамилия Имя Отчество'),
+        _(u'Занимаемая должность'),
+    )
+
+    def __init__(self, establishment, context, snapshots=None):
+        super(RangeReport, self).__init__(establishment, context)
+        self.end_month, self.end_year = context.get('end_month_year') or (self.month, self.year)
+        self.snapshots = snapshots
+
+    def get_months(self):
+        return get_months(self.year, self.month, self.end_year, self.end_month)
+
+    def get_snapshots(self):
+        if self.snapshots is None:
+            with phase('get_queryset'):
+                self.snapshots = load_payroll_range(self.get_queryset(), self.get_months(), self.engine)
+        return self.snapshots
+
+    def compute(self):
+        for snapshot in self.get_snapshots():
+            snapshot.compute(backend=self.engine)
+
+    def write_sheet(self, book, sheet_name):
+        for field, title in self.measures:
+            sheet = book.add_worksheet(title)
+            self.write_header(sheet, title)
+            with phase('write_body'):
+                self.write_body(sheet, field)
+            self.write_footer(sheet)
+
+    def get_header(self):
+        months = [self.format_month(year, month) for year, month in self.get_months()]
+        return self.header + (_(u'Показатель'),) + tuple(months) + (_(u'Итого'),)
+
+    def iter_rows(self):
+        """
+        A row per employee and measure with the values by month and their
+        total.
+        """
+        self.compute()
+        snapshots = self.get_snapshots()
+        for index, employee in enumerate(snapshots[0].employees):
+            for field, title in self.measures:
+                values = tuple(snapshot.get_aggregated_data(employee)[field] for snapshot in snapshots)
+                yield (
+                    index + 1,
+                    employee.personnel_number,
+                    employee.name,
+                    employee.position.name,
+                    title,
+                ) + values + (sum(values, Decimal()),)
+
+    def format_month(self, year, month):
+        return format_date(datetime.date(year, month, 1), 'LLLL YYYY', locale=settings.LANGUAGE_CODE)
+
+    def write_header(self, sheet, title):
+        sheet.write(0, 0, self.establishment.name)
+        sheet.write(2, 0, u'{name}: {title}'.format(name=self.get_name(), title=title))
+        sheet.write(4, 0, _(u"за период с {start} по {end}").format(
+            start=self.format_month(self.year, self.month),
+            end=self.format_month(self.end_year, self.end_month),
+        ))
+        months = [self.format_month(year, month) for year, month in self.get_months()]
+        for index, title in enumerate(self.header + tuple(months) + (_(u'Итого'),)):
+            sheet.write(6, index, title)
+        self.current_column = 7
+
+    def write_body(self, sheet, field):
+        snapshots = self.get_snapshots()
+        first_month_column = len(self.header)
+        total_column = first_month_column + len(snapshots)
+        month_totals = [Decimal() for snapshot in snapshots]
+        index = 0
+        for index, employee in enumerate(snapshots[0].employees):
+            row = self.current_column + index
+            sheet.write(row, 0, index + 1)
+            sheet.write(row, 1, employee.personnel_number)
+            sheet.write(row, 2, employee.name)
+            sheet.write(row, 3, employee.position.name)
+            employee_total = Decimal()
+            for month_index, snapshot in enumerate(snapshots):
+                value = snapshot.get_aggregated_data(employee)[field]
+                sheet.write(row, first_month_column + month_index, value)
+                month_totals[month_index] += value
+                employee_total += value
+            sheet.write(row, total_column, employee_total)
+
+        self.current_column += index
+        sheet.write(self.current_column + 1, 0, _(u'Итого по ведомости'))
+        for month_index, total in enumerate(month_totals):
+            sheet.write(self.current_column + 1, first_month_column + month_index, total)
+        sheet.write(self.current_column + 1, total_column, sum(month_totals, Decimal()))
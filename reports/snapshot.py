@@ -0,0 +1,158 @@
+# coding: utf-8
+from __future__ import absolute_import
+
+import multiprocessing
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+
+from personnel.models import (
+    Bonus,
+    SickTime,
+    Vacation,
+)
+from reports.instrumentation import phase
+from reports.payroll import (
+    get_month_bounds,
+    get_payroll_backend,
+    get_payroll_engine,
+)
+
+
+def calculate_chunk(args):
+    backend, year, month, items = args
+    engine = get_payroll_engine(backend)
+    if engine is not None:
+        return engine(year, month, items)
+    calculate_payroll = get_payroll_backend(backend)
+    return [
+        (employee.pk, calculate_payroll(
+            employee, year, month,
+            sicktimes=sicktimes,
+            vacations=vacations,
+            bonus_payments=bonus_payments,
+        ))
+        for employee, sicktimes, vacations, bonus_payments in items
+    ]
+
+
+class PayrollSnapshot(object):
+    """
+    In-memory payroll data for a set of employees and a single month.
+
+    ``load()`` fetches the employees with their positions, every active sick
+    leave and vacation overlapping the month and the month bonus sums in a
+    fixed number of queries, whatever the number of employees is. The
+    aggregated data of every employee is computed once and shared by all
+    reports built from the snapshot.
+    """
+
+    def __init__(self, year, month, employees, sicktimes, vacations, bonus_payments,
+                 aggregated_data=None):
+        self.year = year
+        self.month = month
+        self.employees = employees
+        self.sicktimes = sicktimes
+        self.vacations = vacations
+        self.bonus_payments = bonus_payments
+        self.aggregated_data = aggregated_data or {}
+
+    @classmethod
+    def load(cls, queryset, year, month):
+        return cls.load_range(queryset, [(year, month)])[0]
+
+    @classmethod
+    def load_range(cls, queryset, months):
+        """
+        Return a snapshot for each of the consecutive ``months``, a list of
+        ``(year, month)`` pairs. Employees, leaves overlapping the whole
+        range and bonus sums are fetched once and split between the months
+        in memory, so the number of queries does not depend on the number
+        of months either.
+        """
+        month_indexes = {key: index for index, key in enumerate(months)}
+        start_date = get_month_bounds(*months[0])[0]
+        end_date = get_month_bounds(*months[-1])[1]
+        employees = list(queryset.select_related('position'))
+        employees_by_pk = {employee.pk: employee for employee in employees}
+
+        def group_leaves(model):
+            grouped = [defaultdict(list) for key in months]
+            leaves = model.objects.overlapping(queryset, start_date, end_date)
+            for leave in leaves:
+                leave.employee = employees_by_pk[leave.employee_id]
+                first = month_indexes.get((leave.start_date.year, leave.start_date.month), 0)
+                last = month_indexes.get((leave.end_date.year, leave.end_date.month), len(months) - 1)
+                for index in xrange(first, last + 1):
+                    grouped[index][leave.employee_id].append(leave)
+            return grouped
+
+        bonus_payments = Bonus.objects.payments_by_month(queryset, months)
+        sicktimes = group_leaves(SickTime)
+        vacations = group_leaves(Vacation)
+        return [
+            cls(
+                year, month, employees,
+                sicktimes=sicktimes[index],
+                vacations=vacations[index],
+                bonus_payments=bonus_payments[(year, month)],
+            )
+            for index, (year, month) in enumerate(months)
+        ]
+
+    def get_calculation_item(self, employee):
+        return (
+            employee,
+            self.sicktimes.get(employee.pk, ()),
+            self.vacations.get(employee.pk, ()),
+            self.bonus_payments.get(employee.pk) or Decimal(),
+        )
+
+    def get_aggregated_data(self, employee):
+        if employee.pk not in self.aggregated_data:
+            self.aggregated_data.update(calculate_chunk(
+                (None, self.year, self.month, [self.get_calculation_item(employee)])
+            ))
+        return self.aggregated_data[employee.pk]
+
+    def compute(self, employees=None, workers=None, chunk_size=None, backend=None):
+        """
+        Compute the aggregated data of ``employees`` (all employees of the
+        snapshot by default) that have not been computed yet. ``backend``
+        names one of ``PAYROLL_BACKENDS`` or ``PAYROLL_ENGINES``, the
+        PAYROLL_BACKEND setting by default.
+
+        With more than one worker the employees are split into chunks of
+        ``chunk_size`` and computed in a process pool. The results do not
+        depend on the number of workers.
+        """
+        if workers is None:
+            workers = getattr(settings, 'PAYROLL_WORKERS', 1)
+        if chunk_size is None:
+            chunk_size = getattr(settings, 'PAYROLL_CHUNK_SIZE', 500)
+        items = [
+            self.get_calculation_item(employee)
+            for employee in (self.employees if employees is None else employees)
+            if employee.pk not in self.aggregated_data
+        ]
+        chunks = [
+            (backend, self.year, self.month, items[index:index + chunk_size])
+            for index in xrange(0, len(items), chunk_size)
+        ]
+        with phase('aggregation'):
+            if workers > 1 and len(chunks) > 1:
+                pool = multiprocessing.Pool(min(workers, len(chunks)))
+                try:
+                    results = pool.map(calculate_chunk, chunks)
+                finally:
+                    pool.close()
+                    pool.join()
+            else:
+                results = map(calculate_chunk, chunks)
+            for result in results:
+                self.aggregated_data.update(result)
+
+    def __iter__(self):
+        for employee in self.employees:
+            yield employee, self.get_aggregated_data(employee)
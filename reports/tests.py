@@ -0,0 +1,1160 @@
+# coding: utf-8
+from __future__ import absolute_import
+
+import calendar
+import codecs
+import csv
+import datetime
+import json
+import os
+import sys
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.core.urlresolvers import reverse
+from django.db import IntegrityError, connection, transaction
+from django.http import FileResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from common.models import Establishment
+from common.signals import (
+    object_changed,
+    objects_imported,
+)
+from common.utils import (
+    business_days,
+    daterange,
+)
+from personnel.views import (
+    BonusBulkCreateView,
+    BonusCreateView,
+    BonusDeleteView,
+    BonusUpdateView,
+    VacationUpdateView,
+)
+from personnel.models import (
+    Bonus,
+    Department,
+    Employee,
+    Position,
+    SickTime,
+    TWOPLACES,
+    Vacation,
+)
+from reports.api import get_payroll_etag
+from reports.exporters import (
+    export_report,
+    iter_chunks,
+    iter_csv,
+    iter_ndjson,
+)
+from reports.instrumentation import (
+    ReportInstrumentation,
+    instrument_stream,
+)
+from reports.jobs import (
+    claim_next_job,
+    delete_expired_jobs,
+    enqueue_report,
+    run_job,
+)
+from reports.ledger import (
+    load_payroll,
+    load_payroll_range,
+)
+from reports.models import (
+    PayrollLedger,
+    PayrollRevision,
+    ReportJob,
+)
+from reports.payroll import (
+    get_months,
+    INCOME_TAX,
+    PAYROLL_BACKENDS,
+    PAYROLL_ENGINES,
+)
+from reports.reports import (
+    BonusReport,
+    RangeReport,
+    Report,
+    ReportPack,
+    SickReport,
+    SummaryReport,
+    VacationReport,
+)
+from reports import payroll
+from reports import snapshot as snapshot_module
+from reports.snapshot import PayrollSnapshot
+from reports.views import ReportPackView
+
+
+def get_daily_aggregated_data(employee, year, month):
+    """
+    The day-by-day computation ``calculate_payroll()`` replaced: a sick
+    leave and a vacation lookup for every day of the month.
+    """
+    _, days_in_month_count = calendar.monthrange(year, month)
+    start_date = datetime.date(year, month, 1)
+    end_date = datetime.date(year, month, days_in_month_count)
+    business_days_list = list(business_days(month, year))
+
+    if start_date < employee.hired:
+        start_date = employee.hired
+
+    worked_days_count = 0
+    worked_days_payments = Decimal('0.00')
+    worked_days_rate = employee.wages / days_in_month_count
+    vacation_days_count = 0
+    vacation_payments = Decimal('0.00')
+    sicktime_days_count = 0
+    sicktime_payments = Decimal('0.00')
+    for day in daterange(start_date, end_date):
+        sicktime = employee.get_sicktime(day)
+        if sicktime:
+            sicktime_days_count += 1
+            sicktime_payments += sicktime.day_rate
+            continue
+        vacation = employee.get_vacation(day)
+        if vacation:
+            vacation_days_count += 1
+            vacation_payments += vacation.day_rate
+            continue
+        if day in business_days_list:
+            worked_days_count += 1
+        worked_days_payments += worked_days_rate
+    sicktime_tax = sicktime_payments * INCOME_TAX
+    vacation_tax = vacation_payments * INCOME_TAX
+    bonus_payments = employee.get_bonus_payments(year, month)
+    bonus_tax = bonus_payments * INCOME_TAX
+    total_payments = worked_days_payments + vacation_payments + sicktime_payments + bonus_payments
+    total_tax = total_payments * INCOME_TAX
+    return {
+        'business_days_count': len(business_days_list),
+        'worked_days_count': worked_days_count,
+        'worked_days_payments': worked_days_payments.quantize(TWOPLACES),
+        'vacation_days_count': vacation_days_count,
+        'vacation_payments': vacation_payments.quantize(TWOPLACES),
+        'vacation_tax': vacation_tax.quantize(TWOPLACES),
+        'vacation_payments_minus_tax': (vacation_payments - vacation_tax).quantize(TWOPLACES),
+        'sicktime_days_count': sicktime_days_count,
+        'sicktime_payments': sicktime_payments.quantize(TWOPLACES),
+        'sicktime_tax': sicktime_tax.quantize(TWOPLACES),
+        'sicktime_payments_minus_tax': (sicktime_payments - sicktime_tax).quantize(TWOPLACES),
+        'total_payments': total_payments.quantize(TWOPLACES),
+        'total_tax': total_tax.quantize(TWOPLACES),
+        'total_payments_minus_tax': (total_payments - total_tax).quantize(TWOPLACES),
+        'bonus_payments': bonus_payments.quantize(TWOPLACES),
+        'bonus_tax': bonus_tax.quantize(TWOPLACES),
+        'bonus_payments_minus_tax': (bonus_payments - bonus_tax).quantize(TWOPLACES),
+    }
+
+
+class PayrollTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('accountant')
+        self.department = self.create(Department, name=u'Бухгалтерия')
+
+    def create(self, model, **kwargs):
+        return model.objects.create(created_by=self.user, updated_by=self.user, **kwargs)
+
+    def create_employee(self, wages='30000.00', hired=datetime.date(2010, 1, 1), **kwargs):
+        kwargs.setdefault('permanent_bonus_amount', Decimal('0.00'))
+        return self.create(
+            Employee,
+            name=u'Сотрудник',
+            department=self.department,
+            position=self.create(Position, name=u'Должность', wages=Decimal(wages)),
+            personnel_number=str(Employee.objects.count() + 1),
+            hired=hired,
+            **kwargs
+        )
+
+    def create_sicktime(self, employee, start_date, end_date, last_two_years_wages='720000.00', **kwargs):
+        return self.create(
+            SickTime,
+            employee=employee,
+            start_date=start_date,
+            end_date=end_date,
+            last_two_years_wages=Decimal(last_two_years_wages),
+            **kwargs
+        )
+
+    def create_vacation(self, employee, start_date, end_date, average_daily_earnings='1000.00', **kwargs):
+        return self.create(
+            Vacation,
+            employee=employee,
+            start_date=start_date,
+            end_date=end_date,
+            average_daily_earnings=Decimal(average_daily_earnings),
+            **kwargs
+        )
+
+    def get_backends(self):
+        backends = sorted(PAYROLL_BACKENDS)
+        if numpy is not None:
+            backends.extend(sorted(PAYROLL_ENGINES))
+        return backends
+
+    def calculate(self, employee, year, month, backend):
+        snapshot = PayrollSnapshot.load(Employee.objects.filter(pk=employee.pk), year, month)
+        snapshot.compute(backend=backend)
+        return dict(snapshot.get_aggregated_data(employee))
+
+    def assertParity(self, employee, year, month):
+        expected = get_daily_aggregated_data(Employee.objects.get(pk=employee.pk), year, month)
+        for backend in self.get_backends():
+            self.assertEqual(self.calculate(employee, year, month, backend), expected, backend)
+        return expected
+
+
+class CalculatePayrollTest(PayrollTestCase):
+    def test_full_month(self):
+        employee = self.create_employee(wages='31000.00', permanent_bonus_amount=Decimal('1234.56'))
+        data = self.assertParity(employee, 2015, 3)
+        self.assertEqual(data['worked_days_payments'], Decimal('32234.56'))
+
+    def test_overlapping_sicktime_and_vacation(self):
+        employee = self.create_employee()
+        self.create_sicktime(employee, datetime.date(2015, 3, 5), datetime.date(2015, 3, 12))
+        self.create_vacation(employee, datetime.date(2015, 3, 10), datetime.date(2015, 3, 20))
+        data = self.assertParity(employee, 2015, 3)
+        self.assertEqual(data['sicktime_days_count'], 8)
+        self.assertEqual(data['vacation_days_count'], 8)
+
+    def test_overlapping_sicktimes(self):
+        # Each day goes to the sick leave with the lowest primary key, the
+        # rates differ, including both clamps of the daily wages.
+        employee = self.create_employee(insurance_experience=1)
+        self.create_sicktime(employee, datetime.date(2015, 4, 10), datetime.date(2015, 4, 20), '1000000.00')
+        self.create_sicktime(employee, datetime.date(2015, 4, 1), datetime.date(2015, 4, 14), '1000.00')
+        self.create_sicktime(employee, datetime.date(2015, 4, 18), datetime.date(2015, 4, 25), '123456.78')
+        data = self.assertParity(employee, 2015, 4)
+        self.assertEqual(data['sicktime_days_count'], 25)
+
+    def test_mid_month_hire(self):
+        employee = self.create_employee(hired=datetime.date(2015, 2, 11))
+        self.create_vacation(employee, datetime.date(2015, 2, 1), datetime.date(2015, 2, 13))
+        data = self.assertParity(employee, 2015, 2)
+        self.assertEqual(data['vacation_days_count'], 3)
+        self.assertParity(employee, 2015, 1)
+
+    def test_dismissal(self):
+        # Dismissing an employee deactivates it: the payroll of its months
+        # is unchanged and it leaves the reports.
+        employee = self.create_employee(hired=datetime.date(2015, 2, 11))
+        self.create_sicktime(employee, datetime.date(2015, 2, 20), datetime.date(2015, 3, 2))
+        expected = self.assertParity(employee, 2015, 2)
+        employee.active = False
+        employee.save()
+        self.assertEqual(self.assertParity(employee, 2015, 2), expected)
+        snapshot = PayrollSnapshot.load(Employee.objects.filter(active=True), 2015, 2)
+        self.assertEqual(list(snapshot), [])
+
+    def test_inactive_leaves(self):
+        employee = self.create_employee()
+        self.create_sicktime(employee, datetime.date(2015, 3, 5), datetime.date(2015, 3, 12), active=False)
+        self.create_vacation(employee, datetime.date(2015, 3, 10), datetime.date(2015, 3, 20), active=False)
+        data = self.assertParity(employee, 2015, 3)
+        self.assertEqual(data['worked_days_count'], data['business_days_count'])
+
+    def test_leaves_across_months(self):
+        employee = self.create_employee()
+        self.create_vacation(employee, datetime.date(2014, 12, 25), datetime.date(2015, 1, 5), '1234.57')
+        self.create_sicktime(employee, datetime.date(2015, 1, 28), datetime.date(2015, 2, 3))
+        for year, month in ((2014, 12), (2015, 1), (2015, 2)):
+            self.assertParity(employee, year, month)
+
+    def test_rounding_tie(self):
+        # The exact salary is 500.005; adding the rate day by day makes it
+        # 500.01.
+        employee = self.create_employee(wages='1000.01', hired=datetime.date(2015, 6, 16))
+        data = self.assertParity(employee, 2015, 6)
+        self.assertEqual(data['worked_days_payments'], Decimal('500.01'))
+        self.assertEqual(data['total_payments'], Decimal('500.01'))
+
+    def test_large_amounts(self):
+        # The amounts of the numpy engine would overflow 64 bits.
+        employee = self.create_employee(wages='9000000000000.00', permanent_bonus_amount=Decimal('0.01'))
+        self.create(Bonus, employee=employee, year=2015, month=3, amount=Decimal('123456789012345.67'))
+        self.create_vacation(employee, datetime.date(2015, 3, 10), datetime.date(2015, 3, 20), '98765432109.87')
+        data = self.assertParity(employee, 2015, 3)
+        self.assertEqual(data['bonus_payments'], Decimal('123456789012345.67'))
+
+    def test_unavailable_engine(self):
+        # NumPy is not installed: the engine module cannot be imported.
+        if 'reports.vectorized' in sys.modules:
+            self.addCleanup(sys.modules.__setitem__, 'reports.vectorized', sys.modules['reports.vectorized'])
+        else:
+            self.addCleanup(sys.modules.pop, 'reports.vectorized', None)
+        sys.modules['reports.vectorized'] = None
+        self.addCleanup(payroll.unavailable_engines.clear)
+        self.assertIsNone(payroll.get_payroll_engine('numpy'))
+        self.assertEqual(payroll.get_payroll_backend('numpy'), payroll.get_payroll_backend('decimal'))
+        self.assertEqual(payroll.unavailable_engines, {'numpy'})
+        employee = self.create_employee()
+        self.create(Bonus, employee=employee, year=2015, month=3, amount=Decimal('1000.00'))
+        expected = get_daily_aggregated_data(Employee.objects.get(pk=employee.pk), 2015, 3)
+        self.assertEqual(self.calculate(employee, 2015, 3, 'numpy'), expected)
+
+
+class LedgerCalendarTest(PayrollTestCase):
+    def test_holiday_added(self):
+        employee = self.create_employee()
+        snapshot = load_payroll(Employee.objects.all(), 2015, 3)
+        self.assertEqual(snapshot.get_aggregated_data(employee)['business_days_count'], 22)
+        with override_settings(BUSINESS_CALENDAR_HOLIDAYS=['2015-03-09']):
+            snapshot = load_payroll(Employee.objects.all(), 2015, 3)
+            self.assertEqual(snapshot.get_aggregated_data(employee)['business_days_count'], 21)
+            self.assertEqual(PayrollLedger.objects.get().worked_days_count, 21)
+        snapshot = load_payroll(Employee.objects.all(), 2015, 3)
+        self.assertEqual(snapshot.get_aggregated_data(employee)['worked_days_count'], 22)
+
+
+class BonusHistoryTest(PayrollTestCase):
+    """
+    Bonuses of the same month in different years, active or not: only
+    the active bonuses of the requested year are paid.
+    """
+
+    def setUp(self):
+        super(BonusHistoryTest, self).setUp()
+        self.employee = self.create_employee()
+        for year, amount, active in (
+            (2013, '100.00', True),
+            (2014, '200.00', True),
+            (2014, '1000.00', False),
+            (2015, '300.00', True),
+        ):
+            self.create(Bonus, employee=self.employee, year=year, month=3, amount=Decimal(amount), active=active)
+
+    def get_report(self, report_class, **context):
+        context.setdefault('departments', [self.department])
+        return report_class(establishment=Establishment(name=u'Организация'), context=context)
+
+    def test_bonus_report(self):
+        for year, amount in ((2013, '100.00'), (2014, '200.00'), (2015, '300.00'), (2016, '0.00')):
+            rows = list(self.get_report(BonusReport, month_year=(3, year)).iter_rows())
+            self.assertEqual(len(rows), 1)
+            self.assertEqual(rows[0][4], Decimal(amount))
+
+    def test_ledger(self):
+        for year in (2013, 2014, 2015):
+            load_payroll(Employee.objects.all(), year, 3)
+        ledger = dict(
+            PayrollLedger.objects.filter(month=3).values_list('year', 'bonus_payments')
+        )
+        self.assertEqual(ledger, {
+            2013: Decimal('100.00'),
+            2014: Decimal('200.00'),
+            2015: Decimal('300.00'),
+        })
+        self.assertEqual(
+            PayrollLedger.objects.get(year=2014, month=3).total_payments,
+            Decimal('30200.00'),
+        )
+
+    def test_deleted_bonus_leaves_ledger(self):
+        load_payroll(Employee.objects.all(), 2015, 3)
+        bonus = Bonus.objects.get(year=2015)
+        bonus.active = False
+        bonus.save()
+        object_changed.send(sender=Bonus, instance=bonus)
+        snapshot = load_payroll(Employee.objects.all(), 2015, 3)
+        self.assertEqual(snapshot.get_aggregated_data(self.employee)['bonus_payments'], Decimal('0.00'))
+        self.assertEqual(PayrollLedger.objects.get(year=2015, month=3).bonus_payments, Decimal('0.00'))
+        self.assertEqual(PayrollLedger.objects.filter(month=3).count(), 1)
+
+    def test_range_report(self):
+        report = self.get_report(RangeReport, month_year=(3, 2014), end_month_year=(3, 2015))
+        bonus_title = dict(RangeReport.measures)['bonus_payments']
+        rows = [row for row in report.iter_rows() if row[4] == bonus_title]
+        self.assertEqual(len(rows), 1)
+        values = rows[0][5:]
+        self.assertEqual(values[0], Decimal('200.00'))
+        self.assertEqual(values[-2], Decimal('300.00'))
+        self.assertEqual(values[-1], Decimal('500.00'))
+
+
+class EmptyReportTest(PayrollTestCase):
+    def test_no_employees(self):
+        for report_class in (SummaryReport, SickReport, VacationReport, BonusReport):
+            report = report_class(
+                establishment=Establishment(name=u'Организация'),
+                context={'departments': [self.department], 'month_year': (3, 2015)},
+            )
+            self.assertTrue(report.get_file_content())
+
+
+class PayrollEtagTest(PayrollTestCase):
+    def setUp(self):
+        super(PayrollEtagTest, self).setUp()
+        self.employee = self.create_employee()
+        self.other = self.create_employee()
+        self.bonus = self.create(Bonus, employee=self.employee, year=2015, month=3, amount=Decimal('100.00'))
+        # Not the latest change of the department.
+        self.create(Bonus, employee=self.employee, year=2015, month=2, amount=Decimal('200.00'))
+
+    def get_etag(self):
+        return get_payroll_etag([self.department], [(2015, 2), (2015, 3)], 'json')
+
+    def save(self, instance):
+        # Like the edit views.
+        previous = type(instance).objects.get(pk=instance.pk)
+        instance.save()
+        object_changed.send(sender=type(instance), instance=instance, previous=previous)
+
+    def get_revision(self):
+        return PayrollRevision.objects.get(pk=1).value
+
+    def test_revision(self):
+        # Incremented once per edit or imported batch, not per saved row.
+        revision = self.get_revision()
+        self.bonus.amount = Decimal('150.00')
+        self.bonus.save()
+        self.assertEqual(self.get_revision(), revision)
+        self.save(self.bonus)
+        self.assertEqual(self.get_revision(), revision + 1)
+        bonuses = [
+            Bonus(employee=employee, year=2015, month=3, amount=Decimal('10.00'),
+                  created_by=self.user, updated_by=self.user)
+            for employee in (self.employee, self.other)
+        ]
+        Bonus.objects.bulk_create(bonuses)
+        objects_imported.send(sender=Bonus, instances=bonuses)
+        self.assertEqual(self.get_revision(), revision + 2)
+
+    def test_unchanged(self):
+        self.assertEqual(self.get_etag(), self.get_etag())
+
+    def test_bonus_moved_out_of_range(self):
+        etag = self.get_etag()
+        self.bonus.year = 2014
+        self.save(self.bonus)
+        self.assertNotEqual(self.get_etag(), etag)
+
+    def test_bonus_reassigned(self):
+        other_department = self.create(Department, name=u'Продажи')
+        self.other.department = other_department
+        self.other.save()
+        etag = self.get_etag()
+        self.bonus.employee = self.other
+        self.save(self.bonus)
+        self.assertNotEqual(self.get_etag(), etag)
+
+    def test_leave_moved_out_of_range(self):
+        vacation = self.create_vacation(self.employee, datetime.date(2015, 3, 2), datetime.date(2015, 3, 6))
+        self.create_vacation(self.employee, datetime.date(2015, 2, 2), datetime.date(2015, 2, 6))
+        etag = self.get_etag()
+        vacation.start_date = datetime.date(2015, 4, 2)
+        vacation.end_date = datetime.date(2015, 4, 6)
+        self.save(vacation)
+        self.assertNotEqual(self.get_etag(), etag)
+
+    def test_calendar(self):
+        etag = self.get_etag()
+        with override_settings(BUSINESS_CALENDAR_HOLIDAYS=['2015-03-09']):
+            self.assertNotEqual(self.get_etag(), etag)
+
+
+class InstrumentationTest(PayrollTestCase):
+    def test_queries(self):
+        with ReportInstrumentation('test') as instrumentation:
+            Employee.objects.count()
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        Employee.objects.count()
+        self.assertEqual(instrumentation.query_count, 2)
+        self.assertGreater(instrumentation.query_time, 0)
+        self.assertNotIn('make_cursor', connection.__dict__)
+
+    def test_stream(self):
+        def iter_content():
+            for chunk in ('a,b\n', 'c,d\n'):
+                Employee.objects.count()
+                yield chunk
+
+        instrumentation = ReportInstrumentation('test')
+        self.assertEqual(list(instrument_stream(instrumentation, iter_content())), ['a,b\n', 'c,d\n'])
+        self.assertEqual(instrumentation.query_count, 2)
+        self.assertEqual(instrumentation.output_size, 8)
+
+    @override_settings(ROOT_URLCONF='reports.urls')
+    def test_job(self):
+        Establishment.objects.create(name=u'Организация')
+        self.create_employee()
+        enqueue_report('summary', (3, 2015), [self.department], self.user)
+        job = run_job(claim_next_job())
+        self.assertTrue(job.is_ready)
+        metrics = job.get_metrics()
+        self.assertGreater(metrics['queries'], 0)
+        self.assertEqual(metrics['output_size'], job.file.size)
+
+        self.user.set_password('secret')
+        self.user.save()
+        self.client.login(username='accountant', password='secret')
+        response = self.client.get(reverse('report-job-download', args=(job.pk,)))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(int(response['X-Report-Queries']), metrics['queries'])
+        self.assertIn('total;dur=', response['Server-Timing'])
+        job.file.delete()
+
+
+@override_settings(ROOT_URLCONF='reports.urls', REPORT_JOB_TIMEOUT=60, REPORT_JOB_MAX_ATTEMPTS=2)
+class ReportJobTest(PayrollTestCase):
+    def setUp(self):
+        super(ReportJobTest, self).setUp()
+        self.user.set_password('secret')
+        self.user.save()
+        self.other = User.objects.create_user('other', password='secret')
+        self.admin = User.objects.create_user('admin', password='secret')
+        self.admin.is_staff = True
+        self.admin.save()
+
+    def enqueue(self, user=None):
+        return enqueue_report('summary', (3, 2015), [self.department], user or self.user)
+
+    def test_deduplication(self):
+        job = self.enqueue()
+        self.assertEqual(self.enqueue().pk, job.pk)
+        self.assertNotEqual(self.enqueue(self.other).pk, job.pk)
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                ReportJob.objects.create(
+                    report_type='summary', month=3, year=2015, departments_key='',
+                    created_by=self.user, active_key=job.active_key,
+                )
+
+    def test_finished_job(self):
+        Establishment.objects.create(name=u'Организация')
+        self.enqueue()
+        job = run_job(claim_next_job())
+        self.assertIsNone(job.active_key)
+        self.assertNotEqual(self.enqueue().pk, job.pk)
+        job.file.delete()
+
+    def test_stale_job(self):
+        job = self.enqueue()
+        self.assertEqual(claim_next_job().pk, job.pk)
+        self.assertIsNone(claim_next_job())
+        ReportJob.objects.filter(pk=job.pk).update(started_at=timezone.now() - datetime.timedelta(minutes=5))
+        job = claim_next_job()
+        self.assertEqual(job.status, ReportJob.STATUS_RUNNING)
+        self.assertEqual(job.attempts, 2)
+        ReportJob.objects.filter(pk=job.pk).update(started_at=timezone.now() - datetime.timedelta(minutes=5))
+        self.assertIsNone(claim_next_job())
+        job = ReportJob.objects.get(pk=job.pk)
+        self.assertEqual(job.status, ReportJob.STATUS_FAILED)
+        self.assertIsNone(job.active_key)
+
+    def test_requeued_run(self):
+        # A slow run requeued as stale does not overwrite the next run.
+        Establishment.objects.create(name=u'Организация')
+        self.enqueue()
+        slow = claim_next_job()
+        ReportJob.objects.filter(pk=slow.pk).update(started_at=timezone.now() - datetime.timedelta(minutes=5))
+        job = claim_next_job()
+        self.assertEqual(job.pk, slow.pk)
+
+        directory = os.path.join(settings.MEDIA_ROOT, 'reports')
+        files = set(os.listdir(directory)) if os.path.isdir(directory) else set()
+        slow = run_job(slow)
+        self.assertEqual(slow.status, ReportJob.STATUS_RUNNING)
+        self.assertFalse(slow.file)
+        self.assertEqual(set(os.listdir(directory)), files)
+
+        job = run_job(job)
+        self.assertTrue(ReportJob.objects.get(pk=job.pk).is_ready)
+        job.file.delete()
+
+    @override_settings(REPORT_JOB_EXPIRY=3600)
+    def test_expired_jobs(self):
+        Establishment.objects.create(name=u'Организация')
+        self.enqueue()
+        job = run_job(claim_next_job())
+        path = job.file.path
+        self.assertEqual(delete_expired_jobs(), 0)
+        ReportJob.objects.filter(pk=job.pk).update(finished_at=timezone.now() - datetime.timedelta(hours=2))
+        self.enqueue()
+        self.assertEqual(delete_expired_jobs(), 1)
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(list(ReportJob.objects.values_list('status', flat=True)), [ReportJob.STATUS_PENDING])
+
+    def test_owner(self):
+        Establishment.objects.create(name=u'Организация')
+        self.enqueue()
+        job = run_job(claim_next_job())
+        url = reverse('report-job-download', args=(job.pk,))
+        for user, status_code in ((self.user, 200), (self.other, 404), (self.admin, 200)):
+            self.client.logout()
+            self.client.login(username=user.username, password='secret')
+            self.assertEqual(self.client.get(url).status_code, status_code, user.username)
+        job.file.delete()
+
+
+class ParallelComputeTest(PayrollTestCase):
+    def setUp(self):
+        super(ParallelComputeTest, self).setUp()
+        self.establishment = Establishment.objects.create(name=u'Организация')
+        for index in range(7):
+            employee = self.create_employee(
+                wages='{0}.{1:02d}'.format(30000 + index * 1111, index * 13),
+                hired=datetime.date(2015, 3, 1 + index * 3),
+            )
+            self.create_sicktime(employee, datetime.date(2015, 3, 2 + index), datetime.date(2015, 3, 5 + index))
+            self.create_vacation(employee, datetime.date(2015, 3, 20), datetime.date(2015, 4, 2), '1234.5{0}'.format(index))
+            self.create(Bonus, employee=employee, year=2015, month=3, amount=Decimal('100.{0}1'.format(index)))
+
+    def build(self):
+        PayrollLedger.objects.all().delete()
+        report = SummaryReport(
+            establishment=self.establishment,
+            context={'departments': [self.department], 'month_year': (3, 2015)},
+        )
+        report.created = datetime.datetime(2015, 4, 1)
+        output = report.get_file()
+        try:
+            return output.read()
+        finally:
+            output.close()
+
+    def test_workers(self):
+        pools = []
+        pool_class = snapshot_module.multiprocessing.Pool
+
+        def create_pool(*args, **kwargs):
+            pools.append(args)
+            return pool_class(*args, **kwargs)
+
+        with override_settings(PAYROLL_WORKERS=1, PAYROLL_CHUNK_SIZE=3):
+            serial = self.build()
+        snapshot_module.multiprocessing.Pool = create_pool
+        try:
+            with override_settings(PAYROLL_WORKERS=2, PAYROLL_CHUNK_SIZE=3):
+                parallel = self.build()
+        finally:
+            snapshot_module.multiprocessing.Pool = pool_class
+        # Seven employees in chunks of three, computed by two processes.
+        self.assertEqual(pools, [(2,)])
+        self.assertEqual(parallel, serial)
+
+
+class LedgerInvalidationTest(PayrollTestCase):
+    """
+    Each edit drops exactly the ledger cells depending on the edited
+    fields; the next load recomputes them.
+    """
+    months = get_months(2015, 1, 2015, 6)
+
+    def setUp(self):
+        super(LedgerInvalidationTest, self).setUp()
+        self.first = self.create_employee()
+        self.position = self.first.position
+        self.second = self.create_employee()
+        self.second.position = self.position
+        self.second.save()
+        self.third = self.create_employee()
+        self.bonus = self.create(Bonus, employee=self.first, year=2015, month=3, amount=Decimal('100.00'))
+        self.sicktime = self.create_sicktime(self.first, datetime.date(2015, 3, 5), datetime.date(2015, 3, 10))
+        self.load()
+
+    def load(self):
+        return load_payroll_range(Employee.objects.all(), self.months)
+
+    def get_cells(self):
+        return set(PayrollLedger.objects.values_list('employee_id', 'year', 'month'))
+
+    def get_all_cells(self, *employees):
+        return set((employee.pk, year, month) for employee in employees for year, month in self.months)
+
+    def update(self, instance, **changes):
+        previous = type(instance).objects.get(pk=instance.pk)
+        for field, value in changes.items():
+            setattr(instance, field, value)
+        instance.save()
+        object_changed.send(sender=type(instance), instance=instance, previous=previous)
+
+    def assertDropped(self, expected):
+        all_cells = self.get_all_cells(self.first, self.second, self.third)
+        self.assertEqual(all_cells - self.get_cells(), set(expected))
+        snapshots = self.load()
+        self.assertEqual(self.get_cells(), all_cells)
+        for (year, month), snapshot in zip(self.months, snapshots):
+            computed = PayrollSnapshot.load(Employee.objects.all(), year, month)
+            computed.compute()
+            for employee in snapshot.employees:
+                self.assertEqual(
+                    dict(snapshot.get_aggregated_data(employee)),
+                    dict(computed.get_aggregated_data(employee)),
+                )
+
+    def test_bonus_amount(self):
+        self.update(self.bonus, amount=Decimal('150.00'))
+        self.assertDropped([(self.first.pk, 2015, 3)])
+
+    def test_bonus_moved(self):
+        self.update(self.bonus, month=5)
+        self.assertDropped([(self.first.pk, 2015, 3), (self.first.pk, 2015, 5)])
+
+    def test_bonus_reassigned(self):
+        self.update(self.bonus, employee=self.second)
+        self.assertDropped([(self.first.pk, 2015, 3), (self.second.pk, 2015, 3)])
+
+    def test_bonus_description(self):
+        self.update(self.bonus, description=u'Квартальная')
+        self.assertDropped([])
+
+    def test_bonus_deleted(self):
+        self.bonus.active = False
+        self.bonus.save()
+        object_changed.send(sender=Bonus, instance=self.bonus)
+        self.assertDropped([(self.first.pk, 2015, 3)])
+
+    def test_leave_moved(self):
+        self.update(self.sicktime, start_date=datetime.date(2015, 4, 28), end_date=datetime.date(2015, 5, 2))
+        self.assertDropped([(self.first.pk, 2015, month) for month in (3, 4, 5)])
+
+    def test_leave_created(self):
+        vacation = self.create_vacation(self.third, datetime.date(2015, 1, 26), datetime.date(2015, 2, 6))
+        object_changed.send(sender=Vacation, instance=vacation)
+        self.assertDropped([(self.third.pk, 2015, 1), (self.third.pk, 2015, 2)])
+
+    def test_hired(self):
+        # Only the months between the old and the new hire dates.
+        self.update(self.first, hired=datetime.date(2015, 4, 10))
+        self.assertDropped([(self.first.pk, 2015, month) for month in (1, 2, 3, 4)])
+
+    def test_employee_rate(self):
+        self.update(self.first, permanent_bonus_amount=Decimal('500.00'))
+        self.assertDropped(self.get_all_cells(self.first))
+
+    def test_employee_position(self):
+        self.update(self.third, position=self.position)
+        self.assertDropped(self.get_all_cells(self.third))
+
+    def test_employee_name(self):
+        self.update(self.first, name=u'Другое имя')
+        self.assertDropped([])
+
+    def test_position_wages(self):
+        self.update(self.position, wages=Decimal('45000.00'))
+        self.assertDropped(self.get_all_cells(self.first, self.second))
+
+    def test_position_name(self):
+        self.update(self.position, name=u'Главный бухгалтер')
+        self.assertDropped([])
+
+    def test_department(self):
+        # The payroll does not depend on the department.
+        self.update(self.department, name=u'Финансы')
+        self.assertDropped([])
+
+    def test_imported_bonuses(self):
+        bonuses = [
+            Bonus(employee=self.second, year=2015, month=2, amount=Decimal('10.00')),
+            Bonus(employee=self.third, year=2015, month=6, amount=Decimal('20.00')),
+        ]
+        for bonus in bonuses:
+            bonus.created_by = bonus.updated_by = self.user
+        Bonus.objects.bulk_create(bonuses)
+        objects_imported.send(sender=Bonus, instances=bonuses)
+        self.assertDropped([(self.second.pk, 2015, 2), (self.third.pk, 2015, 6)])
+
+    def test_imported_leaves(self):
+        # The leaves of a batch are invalidated as one range of months.
+        vacations = [
+            Vacation(
+                employee=self.second, start_date=datetime.date(2015, 2, 2), end_date=datetime.date(2015, 2, 6),
+                average_daily_earnings=Decimal('1000.00'),
+            ),
+            Vacation(
+                employee=self.third, start_date=datetime.date(2015, 4, 6), end_date=datetime.date(2015, 4, 10),
+                average_daily_earnings=Decimal('1000.00'),
+            ),
+        ]
+        for vacation in vacations:
+            vacation.created_by = vacation.updated_by = self.user
+        Vacation.objects.bulk_create(vacations)
+        objects_imported.send(sender=Vacation, instances=vacations)
+        self.assertDropped([
+            (employee.pk, 2015, month) for employee in (self.second, self.third) for month in (2, 3, 4)
+        ])
+
+
+class BonusBulkCreateTest(PayrollTestCase):
+    def setUp(self):
+        super(BonusBulkCreateTest, self).setUp()
+        self.first = self.create_employee()
+        self.second = self.create_employee()
+        # Another department of the same name.
+        self.department = self.create(Department, name=self.department.name)
+        self.third = self.create_employee()
+        self.data = {
+            'departments': [self.first.department_id, self.third.department_id],
+            'month_year': '03/2015',
+            'percent': '10',
+        }
+        load_payroll_range(Employee.objects.all(), get_months(2015, 2, 2015, 4))
+
+    def post(self, data):
+        request = RequestFactory().post('/bonus/bulk/', data)
+        request.user = self.user
+        request.session = {}
+        request._messages = FallbackStorage(request)
+        # The list of bonuses is routed by the project, not by the app.
+        return BonusBulkCreateView.as_view(success_url='/bonus/')(request)
+
+    def preview(self):
+        response = self.post(self.data)
+        self.assertEqual(response.status_code, 200)
+        return response.context_data['preview']
+
+    def confirm(self, token):
+        return self.post(dict(self.data, confirm='', token=token))
+
+    def test_preview(self):
+        preview = self.preview()
+        self.assertEqual(
+            [(row['department'].pk, row['count'], row['amount']) for row in preview['departments']],
+            [
+                (self.first.department_id, 2, Decimal('6000.00')),
+                (self.third.department_id, 1, Decimal('3000.00')),
+            ],
+        )
+        self.assertEqual(preview['count'], 3)
+        self.assertEqual(preview['amount'], Decimal('9000.00'))
+        self.assertFalse(Bonus.objects.exists())
+        self.assertEqual(PayrollLedger.objects.count(), 9)
+
+    def test_confirm(self):
+        response = self.confirm(self.preview()['token'])
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            sorted(Bonus.objects.values_list('employee_id', 'year', 'month', 'amount')),
+            [(employee.pk, 2015, 3, Decimal('3000.00')) for employee in (self.first, self.second, self.third)],
+        )
+        self.assertEqual(
+            set(PayrollLedger.objects.values_list('employee_id', 'month')),
+            set((employee.pk, month) for employee in (self.first, self.second, self.third) for month in (2, 4)),
+        )
+
+    def test_stale_confirm(self):
+        token = self.preview()['token']
+        self.second.position.wages = Decimal('40000.00')
+        self.second.position.save()
+        response = self.confirm(token)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Bonus.objects.exists())
+        self.assertEqual(response.context_data['preview']['amount'], Decimal('10000.00'))
+        self.assertEqual(self.confirm(response.context_data['preview']['token']).status_code, 302)
+        self.assertEqual(Bonus.objects.count(), 3)
+
+    def test_double_submit(self):
+        token = self.preview()['token']
+        self.assertEqual(self.confirm(token).status_code, 302)
+        response = self.confirm(token)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context_data['form'].non_field_errors())
+        self.assertNotIn('preview', response.context_data)
+        self.assertEqual(Bonus.objects.count(), 3)
+
+        response = self.post(self.data)
+        self.assertTrue(response.context_data['form'].non_field_errors())
+        self.assertNotIn('preview', response.context_data)
+
+
+class ExportTest(PayrollTestCase):
+    header = (u'Номер п/п', u'Фамилия Имя Отчество', u'Сумма')
+    rows = [
+        (1, u'Иванов; Иван', Decimal('1234.50')),
+        (2, u'Петров "Пётр"', Decimal('-0.10')),
+    ]
+
+    def test_csv(self):
+        lines = list(iter_csv(self.header, self.rows))
+        self.assertTrue(lines[0].startswith(codecs.BOM_UTF8))
+        self.assertFalse(any(line.startswith(codecs.BOM_UTF8) for line in lines[1:]))
+        self.assertEqual(lines[0][len(codecs.BOM_UTF8):], u'Номер п/п;Фамилия Имя Отчество;Сумма\r\n'.encode('utf-8'))
+        self.assertEqual(lines[1], u'1;"Иванов; Иван";1234.50\r\n'.encode('utf-8'))
+        self.assertEqual(lines[2], u'2;"Петров ""Пётр""";-0.10\r\n'.encode('utf-8'))
+
+    def test_ndjson(self):
+        lines = list(iter_ndjson(self.header, self.rows))
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(all(line.endswith('\n') and line.count('\n') == 1 for line in lines))
+        # Non-ASCII characters are written as UTF-8, not escaped.
+        self.assertIn(u'Иванов; Иван'.encode('utf-8'), lines[0])
+        record = json.loads(lines[0].decode('utf-8'))
+        self.assertEqual(record, {u'Номер п/п': 1, u'Фамилия Имя Отчество': u'Иванов; Иван', u'Сумма': u'1234.50'})
+        self.assertEqual(json.loads(lines[1].decode('utf-8'))[u'Сумма'], u'-0.10')
+
+    def test_chunks(self):
+        lines = ['{0}\n'.format(i) for i in range(5)]
+        self.assertEqual(list(iter_chunks(lines, size=2)), ['0\n', '1\n2\n', '3\n4\n'])
+        self.assertEqual(list(iter_chunks(lines, size=10)), ['0\n', '1\n2\n3\n4\n'])
+        self.assertEqual(list(iter_chunks(iter(lines[:1]), size=2)), ['0\n'])
+        self.assertEqual(list(iter_chunks([], size=2)), [])
+
+    def create_report_data(self):
+        Establishment.objects.create(name=u'Организация')
+        employee = self.create_employee()
+        employee.name = u'Иванов; Иван'
+        employee.save()
+        self.create(Bonus, employee=employee, year=2015, month=3, amount=Decimal('1234.50'))
+        return employee
+
+    def test_export_report(self):
+        employee = self.create_report_data()
+        report = ReportPack(establishment=None, context={'month_year': (3, 2015), 'departments': [self.department]})
+        chunks = list(export_report(report, 'ndjson'))
+        self.assertEqual(len(chunks), 1)
+        record = json.loads(chunks[0].decode('utf-8'))
+        self.assertEqual(record[u'Табельный номер'], employee.personnel_number)
+        self.assertEqual(record[u'Премии: Премия'], u'1234.50')
+
+    @override_settings(ROOT_URLCONF='reports.urls')
+    def test_streamed_csv(self):
+        employee = self.create_report_data()
+        self.user.set_password('secret')
+        self.user.save()
+        self.client.login(username='accountant', password='secret')
+        response = self.client.post(reverse('report-pack'), {
+            'departments': [self.department.pk],
+            'month_year': '03/2015',
+            'format': 'csv',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename=reports.csv')
+        content = b''.join(response.streaming_content)
+        self.assertTrue(content.startswith(codecs.BOM_UTF8))
+
+        rows = list(csv.reader(content[len(codecs.BOM_UTF8):].splitlines(), delimiter=';'))
+        header = [title.decode('utf-8') for title in rows[0]]
+        report = ReportPack(establishment=None, context={'month_year': (3, 2015), 'departments': [self.department]})
+        self.assertEqual(header, list(report.get_header()))
+        self.assertEqual(len(rows), 2)
+        row = [value.decode('utf-8') for value in rows[1]]
+        self.assertEqual(row[:4], [u'1', employee.personnel_number, u'Иванов; Иван', employee.position.name])
+        self.assertEqual(row[header.index(u'Премии: Премия')], u'1234.50')
+        self.assertRegexpMatches(row[header.index(u'Выплаты: Оплата по окладу')], r'^\d+\.\d{2}$')
+
+
+@override_settings(ROOT_URLCONF='reports.urls')
+class PayrollApiTest(PayrollTestCase):
+    def setUp(self):
+        super(PayrollApiTest, self).setUp()
+        self.employee = self.create_employee()
+        self.bonus = self.create(Bonus, employee=self.employee, year=2015, month=3, amount=Decimal('100.00'))
+        self.user.set_password('secret')
+        self.user.save()
+        self.client.login(username='accountant', password='secret')
+
+    def get(self, etag=None, **params):
+        params = dict({'departments': self.department.pk, 'month_year': '03/2015'}, **params)
+        headers = {} if etag is None else {'HTTP_IF_NONE_MATCH': etag}
+        return self.client.get(reverse('payroll-api'), params, **headers)
+
+    def get_records(self, response):
+        return json.loads(b''.join(response.streaming_content))['results']
+
+    def test_etag(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        records = self.get_records(response)
+        self.assertEqual([record['employee'] for record in records], [self.employee.pk])
+        self.assertEqual(records[0]['bonus_payments'], '100.00')
+        self.assertEqual(self.get()['ETag'], etag)
+
+        response = self.get(etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, '')
+        self.assertEqual(response['ETag'], etag)
+        # Nothing is computed for a 304.
+        PayrollLedger.objects.all().delete()
+        self.assertEqual(self.get(etag).status_code, 304)
+        self.assertFalse(PayrollLedger.objects.exists())
+        self.assertEqual(self.get(etag, period='quarter').status_code, 200)
+
+    def test_formats(self):
+        etag = self.get()['ETag']
+        response = self.get(etag, format='ndjson')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.get(response['ETag'], format='ndjson').status_code, 304)
+
+    def test_changed(self):
+        etag = self.get()['ETag']
+        previous = Bonus.objects.get(pk=self.bonus.pk)
+        self.bonus.amount = Decimal('150.00')
+        self.bonus.save()
+        object_changed.send(sender=Bonus, instance=self.bonus, previous=previous)
+        response = self.get(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.get_records(response)[0]['bonus_payments'], '150.00')
+        self.assertEqual(self.get(response['ETag']).status_code, 304)
+
+
+class ReportPackTest(PayrollTestCase):
+    def setUp(self):
+        super(ReportPackTest, self).setUp()
+        self.establishment = Establishment.objects.create(name=u'Организация')
+        for i in range(3):
+            employee = self.create_employee()
+            self.create(Bonus, employee=employee, year=2015, month=3, amount=Decimal('100.00'))
+            self.create_sicktime(employee, datetime.date(2015, 3, 2), datetime.date(2015, 3, 4))
+            self.create_vacation(employee, datetime.date(2015, 3, 16), datetime.date(2015, 3, 20))
+        self.context = {'month_year': (3, 2015), 'departments': [self.department]}
+
+    def test_shared_snapshot(self):
+        pack = ReportPack(establishment=self.establishment, context=self.context)
+        reports = pack.get_reports()
+        self.assertEqual(len(reports), len(ReportPack.report_classes))
+        for report in reports:
+            self.assertIs(report.get_snapshot(), pack.get_snapshot())
+
+    def test_queries(self):
+        # The four sheets cost the queries of a single report: the payroll
+        # is loaded and computed once.
+        with CaptureQueriesContext(connection) as queries:
+            SummaryReport(establishment=self.establishment, context=self.context).get_file().close()
+        PayrollLedger.objects.all().delete()
+        with self.assertNumQueries(len(queries)):
+            ReportPack(establishment=self.establishment, context=self.context).get_file().close()
+        # The employees and their ledger rows once the ledger is filled.
+        with self.assertNumQueries(2):
+            ReportPack(establishment=self.establishment, context=self.context).get_file().close()
+
+
+class EditViewTest(PayrollTestCase):
+    """
+    The create, update and delete views announce the change with
+    ``object_changed``, which drops the affected ledger cells.
+    """
+    months = get_months(2015, 2, 2015, 5)
+
+    def setUp(self):
+        super(EditViewTest, self).setUp()
+        self.employee = self.create_employee()
+        self.other = self.create_employee()
+        self.bonus = self.create(Bonus, employee=self.employee, year=2015, month=3, amount=Decimal('100.00'))
+        self.vacation = self.create_vacation(self.employee, datetime.date(2015, 4, 6), datetime.date(2015, 4, 10))
+        load_payroll_range(Employee.objects.all(), self.months)
+        self.changes = []
+        object_changed.connect(self.receive, dispatch_uid='edit-view-test')
+        self.addCleanup(object_changed.disconnect, dispatch_uid='edit-view-test')
+
+    def receive(self, sender, instance, previous=None, **kwargs):
+        self.changes.append((sender, instance.pk, previous is not None))
+
+    def post(self, view_class, data=None, **kwargs):
+        request = RequestFactory().post('/', data or {})
+        request.user = self.user
+        request.session = {}
+        request._messages = FallbackStorage(request)
+        # The list views are routed by the project, not by the app.
+        response = view_class.as_view(success_url='/')(request, **kwargs)
+        self.assertEqual(response.status_code, 302)
+        return response
+
+    def assertDropped(self, expected):
+        cells = set(PayrollLedger.objects.values_list('employee_id', 'year', 'month'))
+        all_cells = set((employee.pk, year, month) for employee in (self.employee, self.other) for year, month in self.months)
+        self.assertEqual(all_cells - cells, set(expected))
+
+    def test_create(self):
+        self.post(BonusCreateView, {
+            'employee': self.other.pk,
+            'month_year': '04/2015',
+            'percent': '10',
+            'description': u'Премия',
+        })
+        bonus = Bonus.objects.get(employee=self.other)
+        self.assertEqual(bonus.amount, Decimal('3000.00'))
+        self.assertEqual(bonus.created_by, self.user)
+        self.assertEqual(self.changes, [(Bonus, bonus.pk, False)])
+        self.assertDropped([(self.other.pk, 2015, 4)])
+
+    def test_update(self):
+        self.post(BonusUpdateView, {
+            'month_year': '05/2015',
+            'percent': '',
+            'amount': '150.00',
+            'description': u'',
+        }, pk=self.bonus.pk)
+        bonus = Bonus.objects.get(pk=self.bonus.pk)
+        self.assertEqual((bonus.month, bonus.amount), (5, Decimal('150.00')))
+        self.assertEqual(self.changes, [(Bonus, bonus.pk, True)])
+        # The month the bonus left and the month it moved to.
+        self.assertDropped([(self.employee.pk, 2015, 3), (self.employee.pk, 2015, 5)])
+
+    def test_update_leave(self):
+        self.post(VacationUpdateView, {
+            'start_date': '30.03.2015',
+            'end_date': '03.04.2015',
+            'average_daily_earnings': '1000.00',
+        }, pk=self.vacation.pk)
+        self.assertEqual(self.changes, [(Vacation, self.vacation.pk, True)])
+        self.assertDropped([(self.employee.pk, 2015, 3), (self.employee.pk, 2015, 4)])
+
+    def test_delete(self):
+        self.post(BonusDeleteView, pk=self.bonus.pk)
+        self.assertFalse(Bonus.objects.get(pk=self.bonus.pk).active)
+        self.assertEqual(self.changes, [(Bonus, self.bonus.pk, False)])
+        self.assertDropped([(self.employee.pk, 2015, 3)])
+        # The next load recomputes the cell without the bonus.
+        snapshot = load_payroll(Employee.objects.filter(pk=self.employee.pk), 2015, 3)
+        self.assertEqual(dict(snapshot.get_aggregated_data(self.employee))['bonus_payments'], Decimal('0.00'))
+
+
+class XlsxResponseTest(PayrollTestCase):
+    def setUp(self):
+        super(XlsxResponseTest, self).setUp()
+        Establishment.objects.create(name=u'Организация')
+        self.create_employee()
+        self.options = []
+        build_report = Report.build_report
+
+        def record_build_report(report, output=None, **options):
+            self.options.append((output, options))
+            return build_report(report, output, **options)
+
+        def get_file_content(report):
+            raise AssertionError('The workbook is built in memory.')
+
+        for name, method in (('build_report', record_build_report), ('get_file_content', get_file_content)):
+            self.addCleanup(setattr, Report, name, Report.__dict__[name])
+            setattr(Report, name, method)
+
+    def test_file_response(self):
+        request = RequestFactory().post('/', {
+            'departments': [self.department.pk],
+            'month_year': '03/2015',
+            'format': 'xlsx',
+        })
+        request.user = self.user
+        response = ReportPackView.as_view(background=False)(request)
+        self.assertIsInstance(response, FileResponse)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename=reports.xlsx')
+        self.assertEqual(response['Content-Type'], ReportPackView.mimetype)
+
+        [(output, options)] = self.options
+        self.assertTrue(options['constant_memory'])
+        # A temporary file on disk, not a buffer.
+        self.assertEqual(os.fstat(output.fileno()).st_size, int(response['Content-Length']))
+        content = b''.join(response.streaming_content)
+        self.assertEqual(len(content), int(response['Content-Length']))
+        self.assertTrue(content.startswith(b'PK'))
+        response.close()
+        self.assertTrue(output.closed)
@@ -0,0 +1,20 @@
+from __future__ import absolute_import
+
+from django.conf.urls import url
+
+from reports.views import (
+    PayrollApiView,
+    ReportPackView,
+    RangeReportView,
+    ReportJobView,
+    ReportJobDownloadView,
+)
+
+
+urlpatterns = [
+    url(r'^pack/$', ReportPackView.as_view(), name='report-pack'),
+    url(r'^range/$', RangeReportView.as_view(), name='report-range'),
+    url(r'^api/payroll/$', PayrollApiView.as_view(), name='payroll-api'),
+    url(r'^jobs/(?P<pk>\d+)/$', ReportJobView.as_view(), name='report-job'),
+    url(r'^jobs/(?P<pk>\d+)/download/$', ReportJobDownloadView.as_view(), name='report-job-download'),
+]
@@ -0,0 +1,258 @@
+# coding: utf-8
+"""
+Vectorized payroll engine.
+
+A chunk of employees is turned into columns (wages, hire dates, leave
+intervals and day rates) and computed at once with NumPy: the days of the
+month form an ``employees x days`` matrix where every day is given to the
+sick leave or vacation that owns it, and worked days, leave days and
+payments are sums over that matrix. Money follows the integer rules of
+``reports.kopecks`` and the results are the same to the kopeck: employees
+with an inexact amount that is a tie are computed by the reference backend.
+
+Amounts are 64-bit integers. The money fields allow 22 digits, so an
+employee whose largest intermediate amount may exceed ``INT64_MAX`` is left
+out of the arrays and computed by the reference backend as well.
+
+NumPy is an optional dependency, installed with the ``numpy`` extra of
+``setup.py``. Without it this module cannot be imported and the engine
+registry computes with the reference backend instead, see
+``reports.payroll.get_payroll_engine()``.
+"""
+from __future__ import absolute_import
+
+import itertools
+from collections import Mapping
+
+import numpy
+
+from common.utils import get_business_calendar
+from personnel.models import SickTime
+from reports.kopecks import (
+    LEAVE_DENOMINATOR,
+    TAX_PERCENT,
+    from_kopecks,
+    get_day_rate,
+    to_kopecks,
+)
+from reports.payroll import (
+    calculate_payroll,
+    get_month_bounds,
+)
+
+INT64_MAX = 2 ** 63 - 1
+
+COUNT_FIELDS = (
+    'business_days_count',
+    'worked_days_count',
+    'vacation_days_count',
+    'sicktime_days_count',
+)
+
+
+class PayrollRow(Mapping):
+    """
+    Aggregated data of an employee, read like the dictionaries of the other
+    backends. Money is kept in kopecks and turned into ``Decimal`` on first
+    access.
+    """
+
+    def __init__(self, counts, kopecks):
+        self.counts = counts
+        self.kopecks = kopecks
+        self.decimals = {}
+
+    def __getitem__(self, key):
+        if key in self.counts:
+            return self.counts[key]
+        if key not in self.decimals:
+            self.decimals[key] = from_kopecks(self.kopecks[key])
+        return self.decimals[key]
+
+    def __iter__(self):
+        return itertools.chain(self.counts, self.kopecks)
+
+    def __len__(self):
+        return len(self.counts) + len(self.kopecks)
+
+
+def get_columns(year, month, items):
+    """
+    Columns of the calculation ``items`` of a snapshot: plain lists with
+    days as indexes in the month and money as integers. ``overflow`` flags
+    the employees whose amounts do not fit in 64 bits; their columns are
+    zeros and they have no leaves.
+    """
+    month_start, month_end = get_month_bounds(year, month)
+    business_days = set(date.day for date in get_business_calendar().business_days(year, month))
+    columns = {
+        'days_in_month': month_end.day,
+        'business_days': [day in business_days for day in range(1, month_end.day + 1)],
+        'start_day': [],
+        'wages': [],
+        'bonus': [],
+        'leave_employee': [],
+        'leave_start': [],
+        'leave_end': [],
+        'leave_priority': [],
+        'leave_rate': [],
+        'leave_sick': [],
+        'overflow': [],
+    }
+    days_in_month = month_end.day
+    position_wages = {}
+    for index, (employee, sicktimes, vacations, bonus_payments) in enumerate(items):
+        if employee.position_id not in position_wages:
+            position_wages[employee.position_id] = to_kopecks(employee.position.wages)
+        wages = position_wages[employee.position_id] + (
+            to_kopecks(employee.permanent_bonus_amount) if employee.permanent_bonus_amount else 0
+        )
+        bonus = to_kopecks(bonus_payments) if bonus_payments else 0
+        leaves = [(leave, get_day_rate(leave)) for leave in itertools.chain(sicktimes, vacations)]
+        # Bound of the total payments numerator times a tax percent, the
+        # largest amount of ``compute_columns()``.
+        bound = (
+            wages * days_in_month * LEAVE_DENOMINATOR +
+            sum(rate for leave, rate in leaves) * days_in_month * days_in_month +
+            bonus * LEAVE_DENOMINATOR * days_in_month
+        ) * 100
+        overflow = bound > INT64_MAX
+        columns['overflow'].append(overflow)
+        columns['start_day'].append(max((employee.hired - month_start).days, 0))
+        if overflow:
+            columns['wages'].append(0)
+            columns['bonus'].append(0)
+            continue
+        columns['wages'].append(wages)
+        columns['bonus'].append(bonus)
+        for leave, rate in leaves:
+            columns['leave_employee'].append(index)
+            columns['leave_start'].append((leave.start_date - month_start).days)
+            columns['leave_end'].append((leave.end_date - month_start).days)
+            # Sick leave comes first, then the lowest primary key.
+            columns['leave_priority'].append((not isinstance(leave, SickTime), leave.pk))
+            columns['leave_rate'].append(rate)
+            columns['leave_sick'].append(isinstance(leave, SickTime))
+    return columns
+
+
+def round_half_even(numerator, denominator):
+    quotient, remainder = numpy.divmod(numerator, denominator)
+    return quotient + ((remainder * 2 > denominator) | ((remainder * 2 == denominator) & (quotient % 2 == 1)))
+
+
+def is_tie(numerator, denominator):
+    return numerator % denominator * 2 == denominator
+
+
+def compute_columns(columns):
+    """
+    Compute the payroll of every employee of ``columns``. Returns arrays of
+    day counts and of amounts in kopecks keyed by aggregated data field.
+    """
+    days_in_month = columns['days_in_month']
+    start_day = numpy.array(columns['start_day'], dtype=numpy.int64)
+    wages = numpy.array(columns['wages'], dtype=numpy.int64)
+    bonus = numpy.array(columns['bonus'], dtype=numpy.int64)
+    employees_count = len(wages)
+    day = numpy.arange(days_in_month)
+    active = day[numpy.newaxis, :] >= start_day[:, numpy.newaxis]
+
+    # owner[employee, day] is the rank of the leave owning the day, the
+    # number of leaves if no leave does.
+    leaves_count = len(columns['leave_employee'])
+    owner = numpy.full((employees_count, days_in_month), leaves_count, dtype=numpy.int64)
+    rate = numpy.zeros(leaves_count + 1, dtype=numpy.int64)
+    sick = numpy.zeros(leaves_count + 1, dtype=bool)
+    if leaves_count:
+        order = sorted(range(leaves_count), key=columns['leave_priority'].__getitem__)
+        leave_employee = numpy.array(columns['leave_employee'], dtype=numpy.int64)[order]
+        leave_start = numpy.maximum(
+            numpy.array(columns['leave_start'], dtype=numpy.int64)[order],
+            start_day[leave_employee],
+        )
+        leave_end = numpy.minimum(numpy.array(columns['leave_end'], dtype=numpy.int64)[order], days_in_month - 1)
+        rate[:-1] = numpy.array(columns['leave_rate'], dtype=numpy.int64)[order]
+        sick[:-1] = numpy.array(columns['leave_sick'], dtype=bool)[order]
+
+        lengths = numpy.maximum(leave_end - leave_start + 1, 0)
+        rank = numpy.repeat(numpy.arange(leaves_count), lengths)
+        offsets = numpy.arange(len(rank)) - numpy.repeat(numpy.cumsum(lengths) - lengths, lengths)
+        numpy.minimum.at(owner, (leave_employee[rank], leave_start[rank] + offsets), rank)
+
+    covered = owner < leaves_count
+    sick_days = covered & sick[owner]
+    vacation_days = covered & ~sick[owner]
+    day_rate = rate[owner]
+    worked = active & ~covered
+    worked_calendar_days_count = worked.sum(axis=1)
+
+    # Every amount below is numerator / denominator kopecks.
+    leave = LEAVE_DENOMINATOR
+    total = leave * days_in_month
+    sicktime_payments = numpy.where(sick_days, day_rate, 0).sum(axis=1)
+    vacation_payments = numpy.where(vacation_days, day_rate, 0).sum(axis=1)
+    total_payments = (
+        wages * worked_calendar_days_count * leave +
+        (vacation_payments + sicktime_payments) * days_in_month +
+        bonus * total
+    )
+
+    # Employees whose inexact amounts are ties, see ``reports.kopecks``.
+    ties = numpy.zeros(employees_count, dtype=bool)
+    for numerator, denominator in (
+        (wages * worked_calendar_days_count, days_in_month),
+        (sicktime_payments, leave),
+        (total_payments, total),
+    ):
+        for percent in (100, TAX_PERCENT, 100 - TAX_PERCENT):
+            ties |= is_tie(numerator * percent, denominator * 100)
+
+    def tax(numerator, denominator):
+        return round_half_even(numerator * TAX_PERCENT, denominator * 100)
+
+    def minus_tax(numerator, denominator):
+        return round_half_even(numerator * (100 - TAX_PERCENT), denominator * 100)
+
+    business_days = numpy.array(columns['business_days'], dtype=bool)
+    return {
+        'business_days_count': numpy.repeat(business_days.sum(), employees_count),
+        'worked_days_count': (worked & business_days).sum(axis=1),
+        'worked_days_payments': round_half_even(wages * worked_calendar_days_count, days_in_month),
+        'vacation_days_count': vacation_days.sum(axis=1),
+        'vacation_payments': round_half_even(vacation_payments, leave),
+        'vacation_tax': tax(vacation_payments, leave),
+        'vacation_payments_minus_tax': minus_tax(vacation_payments, leave),
+        'sicktime_days_count': sick_days.sum(axis=1),
+        'sicktime_payments': round_half_even(sicktime_payments, leave),
+        'sicktime_tax': tax(sicktime_payments, leave),
+        'sicktime_payments_minus_tax': minus_tax(sicktime_payments, leave),
+        'total_payments': round_half_even(total_payments, total),
+        'total_tax': tax(total_payments, total),
+        'total_payments_minus_tax': minus_tax(total_payments, total),
+        'bonus_payments': bonus,
+        'bonus_tax': tax(bonus, 1),
+        'bonus_payments_minus_tax': minus_tax(bonus, 1),
+        'ties': ties,
+    }
+
+
+def calculate_chunk(year, month, items):
+    if not items:
+        return []
+    columns = get_columns(year, month, items)
+    results = dict((field, values.tolist()) for field, values in compute_columns(columns).items())
+    ties = results.pop('ties')
+    overflow = columns['overflow']
+    money_fields = [field for field in results if field not in COUNT_FIELDS]
+    rows = []
+    for index, (employee, sicktimes, vacations, bonus_payments) in enumerate(items):
+        if ties[index] or overflow[index]:
+            row = calculate_payroll(employee, year, month, sicktimes, vacations, bonus_payments)
+        else:
+            row = PayrollRow(
+                dict((field, results[field][index]) for field in COUNT_FIELDS),
+                dict((field, results[field][index]) for field in money_fields),
+            )
+        rows.append((employee.pk, row))
+    return rows
@@ -1,24 +1,74 @@
 # coding: utf-8
 from __future__ import absolute_import
 
-from django.views.generic import TemplateView
+import os
+
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponseNotModified,
+    HttpResponseRedirect,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.views.generic import (
+    TemplateView,
+    View,
+)
+from django.views.generic.detail import (
+    DetailView,
+    SingleObjectMixin,
+)
 from django.views.generic.list import ListView
 from django.views.generic.edit import FormView
-from django.core.urlresolvers import reverse_lazy
+from django.core.urlresolvers import (
+    reverse,
+    reverse_lazy,
+)
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
 from django.utils.translation import ugettext as _
 
-from common.models import Establishment
+from common.cache import get_establishment
 from common.mixins import (
     LoginRequiredMixin,
     XlsxResponseMixin,
 )
+from personnel.models import Employee
+from reports.api import (
+    OUTPUT_FORMATS,
+    get_payroll_etag,
+    iter_payroll_records,
+)
 from reports.reports import (
     SummaryReport,
     SickReport,
     VacationReport,
     BonusReport,
+    ReportPack,
+    RangeReport,
+)
+from reports.exporters import (
+    EXPORT_FORMATS,
+    export_report,
+)
+from reports.forms import (
+    PayrollApiForm,
+    ReportForm,
+    RangeReportForm,
+)
+from reports.instrumentation import (
+    ReportInstrumentation,
+    annotate_response,
+    instrument_stream,
 )
-from reports.forms import ReportForm
+from reports.jobs import (
+    REPORT_TYPES,
+    enqueue_report,
+)
+from reports.ledger import load_payroll_range
+from reports.models import ReportJob
+from reports.payroll import get_months
 
 
 class ReportListView(LoginRequiredMixin, ListView):
@@ -28,49 +78,194 @@ class ReportListView(LoginRequiredMixin, ListView):
         {'name': _(u'Премии'), 'url': reverse_lazy('report-bonus')},
         {'name': _(u'Больничные'), 'url': reverse_lazy('report-sick')},
         {'name': _(u'Отпуска'), 'url': reverse_lazy('report-vacation')},
+        {'name': _(u'Все ведомости'), 'url': reverse_lazy('report-pack')},
+        {'name': _(u'За период'), 'url': reverse_lazy('report-range')},
     )
 
 
-class ReportView(XlsxResponseMixin, FormView):
+class ReportView(LoginRequiredMixin, XlsxResponseMixin, FormView):
     template_name = 'reports/report_form.html'
     form_class = ReportForm
     report_class = NotImplemented
     report_title = NotImplemented
+    report_type = NotImplemented
+    streaming = True
+    background = True
 
     def get_report_class(self):
         return self.report_class
 
-    def get_content(self, context):
-        establishment = Establishment.objects.last()
-        report = self.get_report_class()(
+    def get_report(self, context):
+        establishment = get_establishment()
+        return self.get_report_class()(
             establishment=establishment,
             context=context,
         )
-        return report.get_file_content()
+
+    def get_content(self, context):
+        return self.get_report(context).get_file_content()
+
+    def get_file(self, context):
+        return self.get_report(context).get_file()
+
+    def profiling_requested(self):
+        return 'profile' in self.request.GET and self.request.user.is_staff
+
+    def render_to_streaming_response(self, context, output_format):
+        """
+        Stream the report in one of ``EXPORT_FORMATS``, row by row. The
+        metrics are logged once the content is sent.
+        """
+        content_type, extension, writer = EXPORT_FORMATS[output_format]
+        instrumentation = ReportInstrumentation(self.report_type, profile=self.profiling_requested())
+        response = StreamingHttpResponse(
+            instrument_stream(instrumentation, export_report(self.get_report(context), output_format)),
+            content_type=content_type,
+        )
+        response['Content-Disposition'] = "attachment; filename={filename}.{extension}".format(
+            filename=os.path.splitext(self.get_filename())[0],
+            extension=extension,
+        )
+        return response
 
     def form_valid(self, form):
-        return self.render_to_file_response(form.cleaned_data)
+        if form.cleaned_data['format'] in EXPORT_FORMATS:
+            return self.render_to_streaming_response(form.cleaned_data, form.cleaned_data['format'])
+        if self.background:
+            job = enqueue_report(
+                self.report_type,
+                form.cleaned_data['month_year'],
+                form.cleaned_data['departments'],
+                self.request.user,
+                end_month_year=form.cleaned_data.get('end_month_year'),
+                profile=self.profiling_requested(),
+            )
+            return HttpResponseRedirect(reverse('report-job', args=(job.pk,)))
+        with ReportInstrumentation(self.report_type, profile=self.profiling_requested()) as instrumentation:
+            response = self.render_to_file_response(form.cleaned_data)
+        if response.streaming:
+            instrumentation.output_size = int(response['Content-Length'])
+        else:
+            instrumentation.output_size = len(response.content)
+        instrumentation.log()
+        return instrumentation.annotate_response(response)
 
 
 class SummaryReportView(ReportView):
     report_class = SummaryReport
     report_title = _(u'Выплаты')
+    report_type = 'summary'
     filename = 'summary.xlsx'
 
 
 class SickReportView(ReportView):
     report_class = SickReport
     report_title = _(u'Больничные')
+    report_type = 'sick'
     filename = 'sick.xlsx'
 
 
 class VacationReportView(ReportView):
     report_class = VacationReport
     report_title = _(u'Отпуска')
+    report_type = 'vacation'
     filename = 'vacation.xlsx'
 
 
 class BonusReportView(ReportView):
     report_class = BonusReport
     report_title = _(u'Премии')
+    report_type = 'bonus'
     filename = 'bonus.xlsx'
+
+
+class ReportPackView(ReportView):
+    report_class = ReportPack
+    report_title = _(u'Все ведомости')
+    report_type = 'pack'
+    filename = 'reports.xlsx'
+
+
+class RangeReportView(ReportView):
+    form_class = RangeReportForm
+    report_class = RangeReport
+    report_title = _(u'За период')
+    report_type = 'range'
+    filename = 'range.xlsx'
+
+
+class ReportJobOwnerMixin(object):
+    """
+    Restrict the jobs to those created by the user, staff see every job.
+    """
+    model = ReportJob
+
+    def get_queryset(self):
+        queryset = super(ReportJobOwnerMixin, self).get_queryset()
+        if not self.request.user.is_staff:
+            queryset = queryset.filter(created_by=self.request.user)
+        return queryset
+
+
+class ReportJobView(LoginRequiredMixin, ReportJobOwnerMixin, DetailView):
+    template_name = 'reports/report_job.html'
+
+
+class ReportJobDownloadView(LoginRequiredMixin, ReportJobOwnerMixin, SingleObjectMixin, View):
+    mimetype = XlsxResponseMixin.mimetype
+
+    def get(self, request, *args, **kwargs):
+        job = self.get_object()
+        if not job.is_ready:
+            raise Http404
+        job.file.open('rb')
+        response = FileResponse(job.file, content_type=self.mimetype)
+        response['Content-Length'] = job.file.size
+        response['Content-Disposition'] = "attachment; filename={filename}".format(
+            filename=REPORT_TYPES[job.report_type][1],
+        )
+        metrics = job.get_metrics()
+        if metrics is not None:
+            annotate_response(response, metrics)
+        return response
+
+
+class PayrollApiView(LoginRequiredMixin, View):
+    """
+    Read-only payroll of the employees of the ``departments`` for a month
+    or a period, one record per employee and month, as JSON or NDJSON
+    streamed from the payroll ledger.
+
+    The ETag is derived from the payroll revision, the latest change of the
+    rows the payroll is computed from and the business calendar of the
+    months, so a conditional request for unchanged data is answered with
+    304 after a single query.
+    """
+    form_class = PayrollApiForm
+
+    def get(self, request, *args, **kwargs):
+        form = self.form_class(request.GET)
+        if not form.is_valid():
+            return JsonResponse(
+                {'errors': {field: list(errors) for field, errors in form.errors.items()}},
+                status=400,
+            )
+        departments = form.cleaned_data['departments']
+        month, year = form.cleaned_data['month_year']
+        end_month, end_year = form.cleaned_data['end_month_year']
+        months = get_months(year, month, end_year, end_month)
+        output_format = form.cleaned_data['format']
+
+        etag = get_payroll_etag(departments, months, output_format)
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = HttpResponseNotModified()
+        else:
+            content_type, render = OUTPUT_FORMATS[output_format]
+            snapshots = load_payroll_range(
+                Employee.objects.filter(active=True, department__in=departments).order_by('pk'),
+                months,
+            )
+            response = StreamingHttpResponse(render(iter_payroll_records(snapshots)), content_type=content_type)
+        response['ETag'] = quote_etag(etag)
+        patch_cache_control(response, private=True, max_age=0, must_revalidate=True)
+        return response
@@ -6,4 +6,8 @@ setup(name='django 1.7 on Red Hat Openshift',
     author='',
     author_email='',
     url='https://github.com/jfmatth/openshift-django17',
+    extras_require={
+        # The numpy payroll engine. 1.16 is the last release for Python 2.7.
+        'numpy': ['numpy==1.16.6'],
+    },
 )